@@ -0,0 +1,184 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# pair_scanner.py
+
+from __future__ import print_function
+
+import datetime
+import multiprocessing
+import os, os.path
+import sqlite3
+import sys
+
+import numpy as np
+import pandas as pd
+import statsmodels.tsa.stattools as ts
+
+# Prices are loaded from local data by the feature store in chapter15
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'chapter15')
+)
+from feature_store import DB_PATH, load_price_panel
+
+
+def universe_symbols(db_path=None):
+    """
+    Returns every ticker in the securities master.
+    """
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        rows = conn.execute("SELECT ticker FROM symbol ORDER BY ticker").fetchall()
+    finally:
+        conn.close()
+    return [r[0] for r in rows]
+
+
+def clean_price_matrix(prices):
+    """
+    Forward fills missing prices and drops any symbol that
+    still has gaps (e.g. one listed part way through the
+    window), so every pair is tested on the same dates.
+    """
+    prices = prices.dropna(how='all').ffill()
+    return prices.dropna(axis=1, how='any')
+
+
+def correlation_prefilter(prices, min_corr=0.9):
+    """
+    Correlates every column of the price matrix with every
+    other in one pass and returns the index arrays (i, j), with
+    i < j, of the pairs whose correlation is at least min_corr,
+    along with those correlations.
+    """
+    corr = np.corrcoef(np.asarray(prices, dtype=np.float64), rowvar=0)
+    i, j = np.triu_indices(corr.shape[0], k=1)
+    keep = corr[i, j] >= min_corr
+    return i[keep], j[keep], corr[i, j][keep]
+
+
+def batch_hedge_ratios(prices, i, j):
+    """
+    Calculates the OLS hedge ratios, with an intercept, of
+    column i regressed on column j for every pair at once,
+    from a single covariance matrix of the prices.
+    """
+    values = np.asarray(prices, dtype=np.float64)
+    demeaned = values - values.mean(axis=0)
+    cov = np.dot(demeaned.T, demeaned)
+    return cov[i, j] / cov[j, j]
+
+
+def half_life(res):
+    """
+    Returns the Ornstein-Uhlenbeck half-life, in bars, of a
+    spread, from the regression of its change on its lagged
+    level. It is infinite if the spread does not mean revert.
+    """
+    lagged = res[:-1] - res[:-1].mean()
+    delta = np.diff(res)
+    lam = np.dot(lagged, delta - delta.mean()) / np.dot(lagged, lagged)
+    if lam >= 0.0:
+        return np.inf
+    return -np.log(2) / lam
+
+
+# The price matrix of each worker process
+_prices = None
+
+
+def _init_worker(prices):
+    global _prices
+    _prices = prices
+
+
+def _cadf_chunk(task):
+    """
+    Runs the CADF test on the residuals of each pair in
+    a chunk, returning (adf_stat, p_value, half_life) rows.
+    """
+    i, j, beta, maxlag, autolag = task
+    rows = []
+    for a, b, hr in zip(i, j, beta):
+        res = _prices[:, a] - hr * _prices[:, b]
+        cadf = ts.adfuller(res, maxlag=maxlag, autolag=autolag)
+        rows.append((cadf[0], cadf[1], half_life(res)))
+    return rows
+
+
+def scan_pairs(
+    prices, min_corr=0.9, max_pvalue=0.05, maxlag=None,
+    autolag='AIC', processes=None, chunk_size=500
+):
+    """
+    Scans every pair of symbols in a price matrix for
+    cointegration.
+
+    Pairs are first prefiltered on the correlation of their
+    prices. The hedge ratios of the survivors are calculated
+    together, then the cointegrated augmented Dickey-Fuller
+    test is run on each residual series in a process pool.
+
+    Parameters:
+    prices - A DataFrame of prices with one column per symbol.
+    min_corr - The minimum price correlation of a pair.
+    max_pvalue - The maximum CADF p-value of a reported pair.
+    maxlag, autolag - Passed to adfuller. The defaults match
+        cadf.py, while maxlag=1, autolag=None is much faster.
+    processes - Number of worker processes, default all cores.
+    chunk_size - Number of pairs sent to a worker at once.
+
+    Returns:
+    A DataFrame of the cointegrated pairs, ranked by the CADF
+    test statistic, with the y and x symbols (the hedge ratio
+    being that of y on x), their correlation, the hedge ratio,
+    the test statistic, the p-value and the half-life in bars.
+    """
+    prices = clean_price_matrix(prices)
+    symbols = np.asarray(prices.columns)
+    values = np.ascontiguousarray(prices.values, dtype=np.float64)
+
+    i, j, corr = correlation_prefilter(values, min_corr)
+    beta = batch_hedge_ratios(values, i, j)
+
+    tasks = [
+        (i[k:k + chunk_size], j[k:k + chunk_size],
+         beta[k:k + chunk_size], maxlag, autolag)
+        for k in range(0, len(i), chunk_size)
+    ]
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(
+        max(1, min(processes, len(tasks))),
+        initializer=_init_worker, initargs=(values,)
+    )
+    try:
+        rows = [r for chunk in pool.map(_cadf_chunk, tasks) for r in chunk]
+    finally:
+        pool.close()
+        pool.join()
+
+    stats = np.array(rows, dtype=np.float64).reshape(-1, 3)
+    pairs = pd.DataFrame({
+        "y": symbols[i], "x": symbols[j], "corr": corr,
+        "hedge_ratio": beta, "adf_stat": stats[:, 0],
+        "p_value": stats[:, 1], "half_life": stats[:, 2]
+    }, columns=[
+        "y", "x", "corr", "hedge_ratio", "adf_stat", "p_value", "half_life"
+    ])
+    pairs = pairs[pairs["p_value"] <= max_pvalue]
+    return pairs.sort_values("adf_stat").reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    # Scan the whole securities master, or the symbols given
+    # on the command line, and write the ranked pairs to
+    # pairs.csv for the pairs trading backtests
+    start = datetime.datetime(2012, 1, 1)
+    end = datetime.datetime(2013, 1, 1)
+    symbols = sys.argv[1:] or universe_symbols()
+
+    prices = load_price_panel(symbols, start, end)
+    pairs = scan_pairs(prices)
+    pairs.to_csv("pairs.csv", index=False)
+    print(pairs.head(20))
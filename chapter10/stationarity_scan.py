@@ -0,0 +1,282 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# stationarity_scan.py
+
+from __future__ import print_function
+
+import multiprocessing
+import os, os.path
+import sqlite3
+import sys
+
+import numpy as np
+import pandas as pd
+import statsmodels.tsa.stattools as ts
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'chapter15')
+)
+from feature_store import DB_PATH
+
+
+# A window of 0 bars means the full price history
+STATS_TABLE = """
+CREATE TABLE IF NOT EXISTS stationarity_stats (
+    symbol_id INTEGER NOT NULL,
+    window INTEGER NOT NULL,
+    last_price_date TEXT NOT NULL,
+    price_count INTEGER NOT NULL,
+    bars INTEGER NOT NULL,
+    adf_stat REAL,
+    adf_pvalue REAL,
+    hurst REAL,
+    half_life REAL,
+    computed_date TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY(symbol_id, window),
+    FOREIGN KEY(symbol_id) REFERENCES symbol(id) ON DELETE CASCADE
+)
+"""
+
+
+def hurst_exponents(prices, max_lag=100):
+    """
+    Calculates the Hurst exponent of every column of a price
+    matrix at once. For each lag the standard deviation of the
+    lagged differences is taken down all the columns, then the
+    slope of its log against the log of the lag is found for
+    every column with a single closed-form regression.
+
+    H < 0.5 indicates a mean reverting series, H = 0.5 a
+    geometric Brownian motion and H > 0.5 a trending series.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    lags = np.arange(2, min(max_lag, prices.shape[0] - 1))
+    log_std = np.log(np.array([
+        np.std(prices[lag:] - prices[:-lag], axis=0) for lag in lags
+    ]))
+    log_lags = np.log(lags) - np.log(lags).mean()
+    return np.dot(log_lags, log_std - log_std.mean(axis=0)) / np.dot(log_lags, log_lags)
+
+
+def half_lives(prices):
+    """
+    Calculates the Ornstein-Uhlenbeck half-life, in bars, of
+    every column of a price matrix, from the regression of the
+    price change on the lagged price. Columns that do not mean
+    revert have an infinite half-life.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    lagged = prices[:-1] - prices[:-1].mean(axis=0)
+    delta = np.diff(prices, axis=0)
+    delta = delta - delta.mean(axis=0)
+    lam = (lagged * delta).sum(axis=0) / (lagged * lagged).sum(axis=0)
+    with np.errstate(divide='ignore'):
+        return np.where(lam < 0.0, -np.log(2) / lam, np.inf)
+
+
+def _adf(prices):
+    """
+    Runs the augmented Dickey-Fuller test, with a lag order of
+    1, on one price series, returning the statistic and p-value.
+    """
+    adf = ts.adfuller(prices, 1)
+    return adf[0], adf[1]
+
+
+def create_stats_table(conn):
+    conn.execute(STATS_TABLE)
+    conn.commit()
+
+
+def stale_symbols(conn, windows):
+    """
+    Returns the symbols whose prices have changed since their
+    statistics were last computed for any of the windows, as a
+    DataFrame of symbol_id, ticker, last_price_date and
+    price_count. A change in the count as well as the last date
+    picks up backfilled or corrected history.
+    """
+    latest = pd.read_sql_query(
+        """SELECT dp.symbol_id, sym.ticker,
+                  date(MAX(dp.price_date) * 86400, 'unixepoch')
+                      AS last_price_date,
+                  COUNT(*) AS price_count
+           FROM daily_price AS dp
+           INNER JOIN symbol AS sym ON dp.symbol_id = sym.id
+           GROUP BY dp.symbol_id""", conn
+    )
+    stored = pd.read_sql_query(
+        """SELECT symbol_id, window, last_price_date, price_count
+           FROM stationarity_stats""", conn
+    )
+    stale = np.zeros(len(latest), dtype=bool)
+    for window in windows:
+        done = stored[stored["window"] == window]
+        merged = latest.merge(
+            done, on="symbol_id", how="left", suffixes=("", "_done")
+        )
+        stale |= (
+            (merged["last_price_date"] != merged["last_price_date_done"]) |
+            (merged["price_count"] != merged["price_count_done"])
+        ).values
+    return latest[stale].reset_index(drop=True)
+
+
+def load_price_columns(conn, symbol_ids, field='adj_close_price'):
+    """
+    Loads the price history of each symbol as a dictionary
+    of symbol_id to a date ordered array.
+    """
+    prices = {}
+    ids = list(symbol_ids)
+    # Stay under SQLite's limit on the number of bound parameters
+    for k in range(0, len(ids), 500):
+        chunk = ids[k:k + 500]
+        rows = pd.read_sql_query(
+            """SELECT symbol_id, %s AS price FROM daily_price
+               WHERE symbol_id IN (%s) AND %s IS NOT NULL
+               ORDER BY symbol_id, price_date""" % (
+                field, ",".join("?" * len(chunk)), field
+            ), conn, params=chunk
+        )
+        for symbol_id, group in rows.groupby("symbol_id"):
+            prices[symbol_id] = group["price"].values.astype(np.float64)
+    return prices
+
+
+def window_matrix(prices, symbol_ids, window):
+    """
+    Stacks the last window prices of each symbol into a matrix
+    with one column per symbol, returning the matrix and the
+    symbol ids used. Symbols with fewer prices than the window
+    are left out. A window of 0 uses the full histories, which
+    are returned as a list as their lengths differ.
+    """
+    used = [
+        s for s in list(symbol_ids)
+        if s in prices and len(prices[s]) >= max(window, 20)
+    ]
+    if window == 0:
+        return [prices[s] for s in used], used
+    matrix = np.empty((window, len(used)))
+    for k, s in enumerate(used):
+        matrix[:, k] = prices[s][-window:]
+    return matrix, used
+
+
+def compute_stats(prices, symbol_ids, window, max_lag=100, pool=None):
+    """
+    Computes the ADF statistic and p-value, Hurst exponent and
+    half-life of the symbols over one window. The Hurst
+    exponents and half-lives are vectorised over the price
+    matrix, while the ADF tests are spread over the pool.
+    """
+    matrix, used = window_matrix(prices, symbol_ids, window)
+    short = [s for s in symbol_ids if s not in used]
+    if window == 0:
+        # Full histories differ in length, so are taken singly
+        columns = matrix
+        hurst = np.array([hurst_exponents(c[:, None], max_lag)[0] for c in columns])
+        half_life = np.array([half_lives(c[:, None])[0] for c in columns])
+        bars = [len(c) for c in columns]
+    else:
+        columns = [matrix[:, k] for k in range(matrix.shape[1])]
+        hurst = hurst_exponents(matrix, max_lag)
+        half_life = half_lives(matrix)
+        bars = [window] * len(used)
+
+    if pool is None:
+        adf = [_adf(c) for c in columns]
+    else:
+        adf = pool.map(_adf, columns, chunksize=16)
+    adf = np.array(adf, dtype=np.float64).reshape(-1, 2)
+
+    # Symbols without enough prices are stored without
+    # statistics, so they are not recomputed until they
+    # have new prices
+    nan = np.full(len(short), np.nan)
+    return pd.DataFrame({
+        "symbol_id": used + short, "window": window,
+        "bars": bars + [len(prices.get(s, [])) for s in short],
+        "adf_stat": np.concatenate([adf[:, 0], nan]),
+        "adf_pvalue": np.concatenate([adf[:, 1], nan]),
+        "hurst": np.concatenate([hurst, nan]),
+        "half_life": np.concatenate([half_life, nan])
+    }, columns=[
+        "symbol_id", "window", "bars", "adf_stat",
+        "adf_pvalue", "hurst", "half_life"
+    ])
+
+
+def update_stationarity_stats(
+    db_path=None, windows=(252, 756), max_lag=100,
+    field='adj_close_price', processes=None
+):
+    """
+    Brings the stationarity_stats table up to date, recomputing
+    the statistics only for the symbols with new prices since
+    the last run.
+
+    Parameters:
+    db_path - The securities master SQLite database.
+    windows - The trailing windows, in bars, to compute the
+        statistics over, with 0 meaning the full history.
+    max_lag - The largest lag used for the Hurst exponent.
+    field - The price column of daily_price to use.
+    processes - Number of worker processes for the ADF tests.
+
+    Returns:
+    A DataFrame of the statistics that were recomputed.
+    """
+    conn = sqlite3.connect(db_path or DB_PATH)
+    try:
+        create_stats_table(conn)
+        stale = stale_symbols(conn, windows)
+        if len(stale) == 0:
+            return pd.DataFrame()
+        prices = load_price_columns(conn, stale["symbol_id"], field)
+
+        pool = multiprocessing.Pool(processes or multiprocessing.cpu_count())
+        try:
+            stats = pd.concat([
+                compute_stats(prices, stale["symbol_id"], w, max_lag, pool)
+                for w in windows
+            ], ignore_index=True)
+        finally:
+            pool.close()
+            pool.join()
+
+        stats = stats.merge(stale, on="symbol_id")
+        conn.executemany(
+            """INSERT OR REPLACE INTO stationarity_stats
+               (symbol_id, window, last_price_date, price_count, bars,
+                adf_stat, adf_pvalue, hurst, half_life)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", [
+                (int(r.symbol_id), int(r.window), r.last_price_date,
+                 int(r.price_count), int(r.bars), float(r.adf_stat),
+                 float(r.adf_pvalue), float(r.hurst), float(r.half_life))
+                for r in stats.itertuples()
+            ]
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return stats
+
+
+if __name__ == "__main__":
+    # Update the statistics over one and three years of bars
+    # and list the most mean reverting symbols
+    stats = update_stationarity_stats(windows=(252, 756))
+    print("Recomputed %s symbol windows" % len(stats))
+
+    conn = sqlite3.connect(DB_PATH)
+    print(pd.read_sql_query(
+        """SELECT sym.ticker, st.window, st.adf_stat, st.adf_pvalue,
+                  st.hurst, st.half_life
+           FROM stationarity_stats AS st
+           INNER JOIN symbol AS sym ON st.symbol_id = sym.id
+           ORDER BY st.window, st.hurst LIMIT 20""", conn
+    ))
+    conn.close()
@@ -6,66 +6,26 @@
 from __future__ import print_function
 
 import datetime
+import os, os.path
+import sys
+
 import numpy as np
 import pandas as pd
 import sklearn
-
-from pandas.io.data import DataReader
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.lda import LDA
-from sklearn.metrics import confusion_matrix
 from sklearn.qda import QDA
 from sklearn.svm import LinearSVC, SVC
 
-
-def create_lagged_series(symbol, start_date, end_date, lags=5):
-    """
-    This creates a pandas DataFrame that stores the 
-    percentage returns of the adjusted closing value of 
-    a stock obtained from Yahoo Finance, along with a 
-    number of lagged returns from the prior trading days 
-    (lags defaults to 5 days). Trading volume, as well as 
-    the Direction from the previous day, are also included.
-    """
-
-    # Obtain stock information from Yahoo Finance
-    ts = DataReader(
-    	symbol, "yahoo", 
-    	start_date-datetime.timedelta(days=365), 
-    	end_date
+# The lagged series are built by the shared feature store
+# and the models compared by the chapter 16 harness
+for chapter in ('chapter15', 'chapter16'):
+    sys.path.append(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', chapter)
     )
-
-    # Create the new lagged DataFrame
-    tslag = pd.DataFrame(index=ts.index)
-    tslag["Today"] = ts["Adj Close"]
-    tslag["Volume"] = ts["Volume"]
-
-    # Create the shifted lag series of prior trading period close values
-    for i in range(0, lags):
-        tslag["Lag%s" % str(i+1)] = ts["Adj Close"].shift(i+1)
-
-    # Create the returns DataFrame
-    tsret = pd.DataFrame(index=tslag.index)
-    tsret["Volume"] = tslag["Volume"]
-    tsret["Today"] = tslag["Today"].pct_change()*100.0
-
-    # If any of the values of percentage returns equal zero, set them to
-    # a small number (stops issues with QDA model in scikit-learn)
-    for i,x in enumerate(tsret["Today"]):
-        if (abs(x) < 0.0001):
-            tsret["Today"][i] = 0.0001
-
-    # Create the lagged percentage returns columns
-    for i in range(0, lags):
-        tsret["Lag%s" % str(i+1)] = \
-        tslag["Lag%s" % str(i+1)].pct_change()*100.0
-
-    # Create the "Direction" column (+1 or -1) indicating an up/down day
-    tsret["Direction"] = np.sign(tsret["Today"])
-    tsret = tsret[tsret.index >= start_date]
-
-    return tsret
+from feature_store import create_lagged_series
+from model_comparison import compare_models, print_comparison
 
 
 if __name__ == "__main__":
@@ -90,7 +50,6 @@ if __name__ == "__main__":
     y_test = y[y.index >= start_test]
    
     # Create the (parametrised) models
-    print("Hit Rates/Confusion Matrices:\n")
     models = [("LR", LogisticRegression()), 
               ("LDA", LDA()), 
               ("QDA", QDA()),
@@ -109,15 +68,9 @@ if __name__ == "__main__":
                 random_state=None, verbose=0)
               )]
 
-    # Iterate through the models
-    for m in models:
-        
-        # Train each of the models on the training set
-        m[1].fit(X_train, y_train)
-
-        # Make an array of predictions on the test set
-        pred = m[1].predict(X_test)
-
-        # Output the hit-rate and the confusion matrix for each model
-        print("%s:\n%0.3f" % (m[0], m[1].score(X_test, y_test)))
-        print("%s\n" % confusion_matrix(pred, y_test))
\ No newline at end of file
+    # Train and test each of the models concurrently, outputting
+    # the hit-rate and the confusion matrix for each model
+    results = compare_models(
+        models, {"^GSPC": (X_train, X_test, y_train, y_test)}
+    )
+    print_comparison(results)
@@ -0,0 +1,176 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# sharpe_screener.py
+
+from __future__ import print_function
+
+import datetime
+import hashlib
+import os, os.path
+import pickle
+import sqlite3
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'chapter15')
+)
+from feature_store import CACHE_DIR, DB_PATH, source_stamp
+
+
+def _cache_path(cache_dir, db_path, symbols, start_date, end_date):
+    """
+    Returns the memo file for a returns matrix. The stamp of the
+    database and its write-ahead log is part of the key, so new
+    prices invalidate the cached matrix.
+    """
+    key = hashlib.sha1(repr((
+        'returns', os.path.abspath(db_path), source_stamp(db_path),
+        sorted(symbols) if symbols else None, str(start_date), str(end_date)
+    )).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, '%s.pkl' % key)
+
+
+def load_returns_matrix(
+    start_date, end_date, symbols=None, db_path=None, cache_dir=CACHE_DIR
+):
+    """
+    Loads the daily adjusted closes of a universe from the
+    securities master with a single query and returns them as a
+    matrix of daily returns, one column per ticker. The matrix is
+    memoised on disk, so later runs over the same universe and
+    dates do not touch the database.
+
+    Parameters:
+    start_date, end_date - The (inclusive) date range.
+    symbols - Optional list of tickers, default every ticker.
+    db_path - The securities master SQLite database.
+    cache_dir - The memo directory, None to disable it.
+    """
+    db_path = db_path or DB_PATH
+    if db_path is None:
+        raise ValueError("No securities master database given")
+
+    cache_path = None
+    if cache_dir is not None:
+        cache_path = _cache_path(cache_dir, db_path, symbols, start_date, end_date)
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as f:
+                return pickle.load(f)
+
+    # A ticker listed on several exchanges is resolved to its
+    # first symbol (MIN(id)), so each ticker is one column
+    tickers = ""
+    params = []
+    if symbols:
+        tickers = "WHERE ticker IN (%s)" % ",".join("?" * len(symbols))
+        params += list(symbols)
+    sql = """SELECT sym.ticker, dp.price_date, dp.adj_close_price
+             FROM (SELECT ticker, MIN(id) AS id FROM symbol
+                   %s GROUP BY ticker) AS sym
+             INNER JOIN daily_price AS dp ON dp.symbol_id = sym.id
+             WHERE dp.price_date >= julianday(?) - 2440587.5
+               AND dp.price_date <= julianday(?) - 2440587.5""" % tickers
+    params += [start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')]
+
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+
+    # Prices are stored by day number since 1970-01-01
+    rows["price_date"] = pd.to_datetime(rows["price_date"], unit="D")
+    prices = rows.pivot(
+        index="price_date", columns="ticker", values="adj_close_price"
+    ).sort_index()
+    returns = prices / prices.shift(1) - 1.0
+    returns = returns.iloc[1:]
+
+    if cache_path is not None:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        tmp_path = '%s.%s.tmp' % (cache_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(returns, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, cache_path)
+    return returns
+
+
+def annualised_sharpe(returns, N=252):
+    """
+    Calculate the annualised Sharpe ratio of every column of a
+    returns matrix based on a number of trading periods, N,
+    ignoring the missing returns of each column.
+
+    The function assumes that the returns are the excess of
+    those compared to a benchmark.
+    """
+    return np.sqrt(N) * returns.mean() / returns.std()
+
+
+def rolling_sharpe(returns, window=126, N=252):
+    """
+    Calculates the annualised Sharpe ratio of every column
+    over a rolling window of periods.
+    """
+    rolling = returns.rolling(window, min_periods=window)
+    return np.sqrt(N) * rolling.mean() / rolling.std()
+
+
+def screen(returns, benchmark='SPY', risk_free=0.05, N=252, window=126):
+    """
+    Ranks every column of a returns matrix by its annualised
+    Sharpe ratio.
+
+    Parameters:
+    returns - A DataFrame of daily returns, one column per ticker.
+    benchmark - The ticker used for the market neutral Sharpe,
+        which is that of a long position in each ticker and a
+        corresponding short of the benchmark.
+    risk_free - The average annual risk-free rate.
+    N - The number of trading periods in a year.
+    window - The length of the rolling Sharpe ratio window.
+
+    Returns:
+    A DataFrame indexed by ticker of the number of returns, the
+    Sharpe ratio, the market neutral Sharpe ratio and the latest,
+    mean and minimum rolling Sharpe ratio, best first.
+    """
+    excess = returns - risk_free / N
+    rolling = rolling_sharpe(excess, window, N)
+
+    results = pd.DataFrame({
+        "observations": returns.count(),
+        "sharpe": annualised_sharpe(excess, N),
+        "rolling_last": rolling.ffill().iloc[-1] if len(rolling) else np.nan,
+        "rolling_mean": rolling.mean(),
+        "rolling_min": rolling.min()
+    }, columns=[
+        "observations", "sharpe", "market_neutral_sharpe",
+        "rolling_last", "rolling_mean", "rolling_min"
+    ])
+    if benchmark in returns.columns:
+        # The net returns are (long - short)/2, since there is
+        # twice the trading capital for this strategy
+        net = returns.sub(returns[benchmark], axis=0) / 2.0
+        results["market_neutral_sharpe"] = annualised_sharpe(net, N)
+        results.loc[benchmark, "market_neutral_sharpe"] = np.nan
+    return results.sort_values("sharpe", ascending=False)
+
+
+if __name__ == "__main__":
+    # Rank the whole securities master, or the tickers
+    # given on the command line, against SPY
+    start = datetime.datetime(2000, 1, 1)
+    end = datetime.datetime(2013, 1, 1)
+    symbols = sys.argv[1:]
+    if symbols and "SPY" not in symbols:
+        symbols.append("SPY")
+
+    returns = load_returns_matrix(start, end, symbols)
+    results = screen(returns, benchmark="SPY")
+    print(results.head(25))
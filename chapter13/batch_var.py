@@ -0,0 +1,202 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# batch_var.py
+
+from __future__ import print_function
+
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+
+
+def _block_size(rows, chunk_elements):
+    """
+    Returns how many portfolios can be processed at once so
+    that a (rows x portfolios) P&L block stays within
+    chunk_elements floats.
+    """
+    return max(1, int(chunk_elements // max(rows, 1)))
+
+
+def _tail_var_cvar(pnl, c):
+    """
+    Calculates VaR and CVaR (as positive losses) for every
+    column of a (scenarios x portfolios) P&L matrix, using a
+    partial sort rather than a full sort of each column.
+    """
+    k = int((1.0 - c) * pnl.shape[0])
+    part = np.partition(pnl, k, axis=0)
+    var = -part[k]
+    cvar = -part[:k + 1].mean(axis=0)
+    return var, cvar
+
+
+def parametric_var(returns, weights, c=0.99):
+    """
+    Variance-Covariance VaR/CVaR for many portfolios at once,
+    assuming normally distributed asset returns.
+
+    Parameters:
+    returns - A (time x assets) array of asset returns.
+    weights - A (portfolios x assets) array of holdings in USD.
+    c - The confidence level, e.g. 0.99.
+
+    Returns:
+    var, cvar - Arrays of losses in USD, one per portfolio.
+    """
+    mu = returns.mean(axis=0)
+    cov = np.cov(returns, rowvar=0)
+
+    port_mu = np.dot(weights, mu)
+    port_sigma = np.sqrt(
+        np.maximum((np.dot(weights, cov) * weights).sum(axis=1), 0.0)
+    )
+
+    z = norm.ppf(1.0 - c)
+    var = -(port_mu + z * port_sigma)
+    cvar = port_sigma * norm.pdf(z) / (1.0 - c) - port_mu
+    return var, cvar
+
+
+def historical_var(returns, weights, c=0.99, chunk_elements=2**24):
+    """
+    Historical simulation VaR/CVaR for many portfolios at once.
+    The P&L matrix is built with one matrix product per block
+    of portfolios, so memory is bounded by chunk_elements.
+
+    Parameters:
+    returns - A (time x assets) array of asset returns.
+    weights - A (portfolios x assets) array of holdings in USD.
+    c - The confidence level, e.g. 0.99.
+    chunk_elements - Maximum number of P&L values held at once.
+
+    Returns:
+    var, cvar - Arrays of losses in USD, one per portfolio.
+    """
+    n_ports = weights.shape[0]
+    var = np.empty(n_ports)
+    cvar = np.empty(n_ports)
+
+    block = _block_size(returns.shape[0], chunk_elements)
+    for start in range(0, n_ports, block):
+        end = min(start + block, n_ports)
+        pnl = np.dot(returns, weights[start:end].T)
+        var[start:end], cvar[start:end] = _tail_var_cvar(pnl, c)
+    return var, cvar
+
+
+def monte_carlo_var(
+    returns, weights, c=0.99, n_sims=10000, seed=42,
+    sim_chunk=2000, chunk_elements=2**24
+):
+    """
+    Monte Carlo VaR/CVaR for many portfolios at once, drawing
+    multivariate normal scenarios with the sample mean and
+    covariance of the asset returns.
+
+    Scenarios are generated sim_chunk at a time from a random
+    state seeded with (seed + chunk number), so the results are
+    reproducible and independent of how the portfolios are
+    blocked. Neither the (scenarios x assets x portfolios) cube
+    nor the full (scenarios x assets) matrix is ever stored.
+
+    Parameters:
+    returns - A (time x assets) array of asset returns.
+    weights - A (portfolios x assets) array of holdings in USD.
+    c - The confidence level, e.g. 0.99.
+    n_sims - The number of simulated scenarios.
+    seed - The base seed for the random number generator.
+    sim_chunk - Number of scenarios generated at once.
+    chunk_elements - Maximum number of P&L values held at once.
+
+    Returns:
+    var, cvar - Arrays of losses in USD, one per portfolio.
+    """
+    n_assets = returns.shape[1]
+    n_ports = weights.shape[0]
+    mu = returns.mean(axis=0)
+    cov = np.atleast_2d(np.cov(returns, rowvar=0))
+
+    # Add a little jitter if the covariance is not
+    # numerically positive definite
+    try:
+        chol = np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        jitter = 1e-10 * np.trace(cov) / n_assets
+        chol = np.linalg.cholesky(cov + jitter * np.eye(n_assets))
+
+    var = np.empty(n_ports)
+    cvar = np.empty(n_ports)
+
+    block = _block_size(n_sims, chunk_elements)
+    for start in range(0, n_ports, block):
+        end = min(start + block, n_ports)
+        w = weights[start:end]
+
+        # Scenario P&L is mu.w + Z.(L'w), so the Cholesky
+        # factor is folded into the weights up front
+        loadings = np.dot(chol.T, w.T)
+        port_mu = np.dot(w, mu)
+
+        pnl = np.empty((n_sims, end - start))
+        for i, s in enumerate(range(0, n_sims, sim_chunk)):
+            n = min(sim_chunk, n_sims - s)
+            z = np.random.RandomState(seed + i).standard_normal(
+                (n, n_assets)
+            )
+            pnl[s:s + n] = np.dot(z, loadings) + port_mu
+        var[start:end], cvar[start:end] = _tail_var_cvar(pnl, c)
+    return var, cvar
+
+
+def portfolio_var_report(
+    returns, weights, c=0.99, n_sims=10000, seed=42, names=None
+):
+    """
+    Calculates parametric, historical and Monte Carlo VaR/CVaR
+    for every portfolio and returns them as a DataFrame.
+
+    Parameters:
+    returns - A (time x assets) array or DataFrame of returns.
+    weights - A (portfolios x assets) array or DataFrame of holdings.
+    c - The confidence level, e.g. 0.99.
+    n_sims - The number of Monte Carlo scenarios.
+    seed - The base seed for the Monte Carlo simulation.
+    names - Optional portfolio names used as the index.
+    """
+    if names is None and isinstance(weights, pd.DataFrame):
+        names = weights.index
+    returns = np.asarray(returns, dtype=np.float64)
+    weights = np.atleast_2d(np.asarray(weights, dtype=np.float64))
+
+    report = pd.DataFrame(index=names)
+    report["ParamVaR"], report["ParamCVaR"] = parametric_var(
+        returns, weights, c
+    )
+    report["HistVaR"], report["HistCVaR"] = historical_var(
+        returns, weights, c
+    )
+    report["MCVaR"], report["MCCVaR"] = monte_carlo_var(
+        returns, weights, c, n_sims=n_sims, seed=seed
+    )
+    return report
+
+
+if __name__ == "__main__":
+    # Synthetic example: 4 years of daily returns on 100 assets
+    # and 5,000 random long/short books of 1,000,000 USD each
+    rs = np.random.RandomState(0)
+    n_days, n_assets, n_ports = 1000, 100, 5000
+    returns = rs.normal(0.0003, 0.015, (n_days, n_assets))
+    weights = rs.normal(0.0, 1.0, (n_ports, n_assets))
+    weights *= 1e6 / np.abs(weights).sum(axis=1)[:, np.newaxis]
+
+    start = time.time()
+    report = portfolio_var_report(returns, weights, c=0.99)
+    print(report.describe())
+    print("Calculated VaR for %s portfolios in %0.2fs" % (
+        n_ports, time.time() - start)
+    )
@@ -6,6 +6,7 @@
 from __future__ import print_function
 
 import datetime
+import os.path
 import pprint
 try:
     import Queue as queue
@@ -23,7 +24,8 @@ class Backtest(object):
     def __init__(
         self, csv_dir, symbol_list, initial_capital,
         heartbeat, start_date, data_handler, 
-        execution_handler, portfolio, strategy
+        execution_handler, portfolio, strategy,
+        portfolio_params=None
     ):
         """
         Initialises the backtest.
@@ -38,6 +40,8 @@ class Backtest(object):
         execution_handler - (Class) Handles the orders/fills for trades.
         portfolio - (Class) Keeps track of portfolio current and prior positions.
         strategy - (Class) Generates signals based on market data.
+        portfolio_params - Optional dictionary of keyword arguments
+            for the portfolio, e.g. max_var or results_dir.
         """
         self.csv_dir = csv_dir
         self.symbol_list = symbol_list
@@ -49,6 +53,7 @@ class Backtest(object):
         self.execution_handler_cls = execution_handler
         self.portfolio_cls = portfolio
         self.strategy_cls = strategy
+        self.portfolio_params = portfolio_params or {}
 
         self.events = queue.Queue()
         
@@ -70,8 +75,17 @@ class Backtest(object):
         self.data_handler = self.data_handler_cls(self.events, self.csv_dir, self.symbol_list)
         self.strategy = self.strategy_cls(self.data_handler, self.events)
         self.portfolio = self.portfolio_cls(self.data_handler, self.events, self.start_date, 
-                                            self.initial_capital)
-        self.execution_handler = self.execution_handler_cls(self.events)
+                                            self.initial_capital, **self.portfolio_params)
+        self.execution_handler = self._create_execution_handler(self.events)
+
+    def _create_execution_handler(self, events):
+        """
+        Creates an ExecutionHandler, passing it the DataHandler
+        if it matches orders against the market data.
+        """
+        if getattr(self.execution_handler_cls, 'requires_bars', False):
+            return self.execution_handler_cls(events, self.data_handler)
+        return self.execution_handler_cls(events)
 
     def _run_backtest(self):
         """
@@ -96,6 +110,7 @@ class Backtest(object):
                 else:
                     if event is not None:
                         if event.type == 'MARKET':
+                            self.execution_handler.update_market(event)
                             self.strategy.calculate_signals(event)
                             self.portfolio.update_timeindex(event)
 
@@ -136,3 +151,184 @@ class Backtest(object):
         """
         self._run_backtest()
         self._output_performance()
+
+
+class StrategyStack(object):
+    """
+    Holds one independent Strategy, Portfolio and ExecutionHandler,
+    along with its own event queue and counters, so that several
+    of them can share a single DataHandler without interfering.
+    """
+
+    def __init__(self, name, events, strategy, portfolio, execution_handler):
+        """
+        Initialises the stack.
+
+        Parameters:
+        name - A unique name for the stack, used for its output.
+        events - The stack's own Queue of Event objects.
+        strategy - The Strategy instance.
+        portfolio - The Portfolio instance.
+        execution_handler - The ExecutionHandler instance.
+        """
+        self.name = name
+        self.events = events
+        self.strategy = strategy
+        self.portfolio = portfolio
+        self.execution_handler = execution_handler
+
+        self.signals = 0
+        self.orders = 0
+        self.fills = 0
+
+    def update_market(self, event):
+        """
+        Passes a MarketEvent to the execution handler, strategy
+        and portfolio and then handles the events they generate.
+        """
+        self.execution_handler.update_market(event)
+        self.strategy.calculate_signals(event)
+        self.portfolio.update_timeindex(event)
+        self.process_events()
+
+    def process_events(self):
+        """
+        Handles all of the Signal, Order and Fill events on
+        the stack's queue until it is empty.
+        """
+        while True:
+            try:
+                event = self.events.get(False)
+            except queue.Empty:
+                break
+            else:
+                if event is not None:
+                    if event.type == 'SIGNAL':
+                        self.signals += 1
+                        self.portfolio.update_signal(event)
+
+                    elif event.type == 'ORDER':
+                        self.orders += 1
+                        self.execution_handler.execute_order(event)
+
+                    elif event.type == 'FILL':
+                        self.fills += 1
+                        self.portfolio.update_fill(event)
+
+
+class MultiStrategyBacktest(Backtest):
+    """
+    Runs several strategies over a single pass of the market data.
+
+    Each MarketEvent from the shared DataHandler is fanned out to
+    a StrategyStack per strategy, so the CSV parsing and the bar
+    iteration are only carried out once, while every strategy
+    keeps its own positions, holdings, orders and output file.
+    """
+
+    def __init__(
+        self, csv_dir, symbol_list, initial_capital,
+        heartbeat, start_date, data_handler,
+        execution_handler, portfolio, strategies,
+        portfolio_params=None
+    ):
+        """
+        Initialises the multi-strategy backtest.
+
+        Parameters:
+        csv_dir - The hard root to the CSV data directory.
+        symbol_list - The list of symbol strings.
+        intial_capital - The starting capital for each portfolio.
+        heartbeat - Backtest "heartbeat" in seconds
+        start_date - The start datetime of the strategies.
+        data_handler - (Class) Handles the market data feed.
+        execution_handler - (Class) Handles the orders/fills for trades.
+        portfolio - (Class) Keeps track of portfolio current and prior positions.
+        strategies - A list of (strategy class, parameter dict) tuples.
+        portfolio_params - Optional dictionary of keyword arguments
+            for every portfolio. A results_dir is used as the parent
+            directory of a results directory per strategy.
+        """
+        self.strategies = strategies
+        self.stacks = []
+        self.results = {}
+        super(MultiStrategyBacktest, self).__init__(
+            csv_dir, symbol_list, initial_capital, heartbeat,
+            start_date, data_handler, execution_handler, portfolio,
+            None, portfolio_params=portfolio_params
+        )
+        self.num_strats = len(self.stacks)
+
+    def _generate_trading_instances(self):
+        """
+        Generates the shared DataHandler and a separate
+        StrategyStack for each of the strategies.
+        """
+        print(
+            "Creating DataHandler and %s Strategy, Portfolio and "
+            "ExecutionHandler stacks" % len(self.strategies)
+        )
+        self.data_handler = self.data_handler_cls(
+            self.events, self.csv_dir, self.symbol_list
+        )
+        for i, (strategy_cls, params) in enumerate(self.strategies):
+            name = "%s_%s" % (strategy_cls.__name__, i)
+            events = queue.Queue()
+            strategy = strategy_cls(self.data_handler, events, **params)
+
+            # Keep the output of each portfolio separate
+            portfolio_params = dict(self.portfolio_params)
+            portfolio_params['equity_file'] = "equity_%s.csv" % name
+            if 'results_dir' in portfolio_params:
+                portfolio_params['results_dir'] = os.path.join(
+                    portfolio_params['results_dir'], name
+                )
+            portfolio = self.portfolio_cls(
+                self.data_handler, events, self.start_date,
+                self.initial_capital, **portfolio_params
+            )
+            execution_handler = self._create_execution_handler(events)
+            self.stacks.append(
+                StrategyStack(name, events, strategy, portfolio, execution_handler)
+            )
+
+    def _run_backtest(self):
+        """
+        Executes the backtest, fanning every MarketEvent out
+        to all of the strategy stacks.
+        """
+        while True:
+            # Update the market bars
+            if self.data_handler.continue_backtest == True:
+                self.data_handler.update_bars()
+            else:
+                break
+
+            # Handle the shared market events
+            while True:
+                try:
+                    event = self.events.get(False)
+                except queue.Empty:
+                    break
+                else:
+                    if event is not None and event.type == 'MARKET':
+                        for stack in self.stacks:
+                            stack.update_market(event)
+
+            time.sleep(self.heartbeat)
+
+    def _output_performance(self):
+        """
+        Outputs the performance of each strategy stack and
+        stores the summary statistics in self.results.
+        """
+        for stack in self.stacks:
+            print("Strategy: %s" % stack.name)
+            stack.portfolio.create_equity_curve_dataframe()
+            stats = stack.portfolio.output_summary_stats()
+            self.results[stack.name] = stats
+            pprint.pprint(stats)
+
+            print("Signals: %s" % stack.signals)
+            print("Orders: %s" % stack.orders)
+            print("Fills: %s" % stack.fills)
@@ -0,0 +1,276 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# costs.py
+
+from __future__ import print_function
+
+import numpy as np
+
+
+class CostModel(object):
+    """
+    CostModel is an abstract base class for transaction cost
+    models. Every model calculates the cost in USD (as a
+    positive number) of whole arrays of fills at once, so that
+    the same model can be used by the event-driven Portfolio,
+    one fill at a time, and by vectorised backtests to re-cost
+    a full history of fills in a single array expression.
+
+    Scalars are accepted as well as arrays and the result is
+    broadcast in the usual NumPy way.
+    """
+
+    def cost(self, quantity, price, **market):
+        """
+        Returns the transaction costs of the fills in USD.
+
+        Parameters:
+        quantity - The filled quantities (signed or unsigned).
+        price - The fill prices.
+        market - Optional market data used by some models, such
+            as 'volume', 'volatility' or 'spread'.
+        """
+        raise NotImplementedError("Should implement cost()")
+
+    def __call__(self, quantity, price, **market):
+        return self.cost(quantity, price, **market)
+
+
+def _as_arrays(quantity, price):
+    """
+    Returns the absolute quantities and prices as float arrays.
+    """
+    return (
+        np.abs(np.asarray(quantity, dtype=np.float64)),
+        np.asarray(price, dtype=np.float64)
+    )
+
+
+class IBDirectedCommission(CostModel):
+    """
+    The Interactive Brokers fee structure for "US API Directed
+    Orders" that FillEvent has always used: 0.013 USD per share
+    up to 500 shares and 0.008 USD per share above, with a
+    minimum of 1.30 USD per order.
+
+    This does not include exchange or ECN fees.
+    """
+
+    def __init__(
+        self, small_rate=0.013, large_rate=0.008,
+        breakpoint=500, minimum=1.3
+    ):
+        self.small_rate = small_rate
+        self.large_rate = large_rate
+        self.breakpoint = breakpoint
+        self.minimum = minimum
+
+    def cost(self, quantity, price=None, **market):
+        quantity = np.abs(np.asarray(quantity, dtype=np.float64))
+        rate = np.where(
+            quantity <= self.breakpoint, self.small_rate, self.large_rate
+        )
+        return np.maximum(self.minimum, rate * quantity)
+
+
+class IBFixedCommission(CostModel):
+    """
+    The Interactive Brokers fixed pricing for US stocks: a
+    rate per share subject to a minimum per order and a
+    maximum of a percentage of the trade value.
+    """
+
+    def __init__(self, per_share=0.005, minimum=1.0, max_pct=0.01):
+        self.per_share = per_share
+        self.minimum = minimum
+        self.max_pct = max_pct
+
+    def cost(self, quantity, price, **market):
+        quantity, price = _as_arrays(quantity, price)
+        fee = np.maximum(self.minimum, self.per_share * quantity)
+        return np.minimum(fee, self.max_pct * quantity * price)
+
+
+class IBTieredCommission(CostModel):
+    """
+    The Interactive Brokers tiered pricing for US stocks, where
+    the rate per share falls as the shares traded in the month
+    rise. The monthly volume before each fill can be passed in
+    as 'monthly_volume', otherwise the first tier is used.
+    """
+
+    def __init__(
+        self, tiers=(
+            (300000, 0.0035), (3000000, 0.002), (20000000, 0.0015),
+            (100000000, 0.001), (np.inf, 0.0005)
+        ), minimum=0.35, max_pct=0.01
+    ):
+        """
+        Parameters:
+        tiers - Sequence of (monthly volume upper bound, rate per share).
+        minimum - The minimum commission per order.
+        max_pct - The maximum commission as a fraction of trade value.
+        """
+        self.bounds = np.array([t[0] for t in tiers], dtype=np.float64)
+        self.rates = np.array([t[1] for t in tiers], dtype=np.float64)
+        self.minimum = minimum
+        self.max_pct = max_pct
+
+    def cost(self, quantity, price, monthly_volume=0, **market):
+        quantity, price = _as_arrays(quantity, price)
+        tier = np.searchsorted(
+            self.bounds, np.asarray(monthly_volume), side='right'
+        )
+        rate = self.rates[np.minimum(tier, len(self.rates) - 1)]
+        fee = np.maximum(self.minimum, rate * quantity)
+        return np.minimum(fee, self.max_pct * quantity * price)
+
+
+class PerShareCommission(CostModel):
+    """
+    A flat rate per share, with an optional minimum per order.
+    """
+
+    def __init__(self, per_share=0.01, minimum=0.0):
+        self.per_share = per_share
+        self.minimum = minimum
+
+    def cost(self, quantity, price=None, **market):
+        quantity = np.abs(np.asarray(quantity, dtype=np.float64))
+        return np.maximum(self.minimum, self.per_share * quantity)
+
+
+class BpsCommission(CostModel):
+    """
+    A fee of a number of basis points of the trade value.
+    """
+
+    def __init__(self, bps=1.0):
+        self.bps = bps
+
+    def cost(self, quantity, price, **market):
+        quantity, price = _as_arrays(quantity, price)
+        return self.bps * 1e-4 * quantity * price
+
+
+class SpreadSlippage(CostModel):
+    """
+    Slippage from crossing half of the bid/ask spread. The
+    spread can be passed in per fill as 'spread' (in USD),
+    otherwise it is taken as a fixed number of basis points
+    of the price.
+    """
+
+    def __init__(self, spread_bps=5.0):
+        self.spread_bps = spread_bps
+
+    def cost(self, quantity, price, spread=None, **market):
+        quantity, price = _as_arrays(quantity, price)
+        if spread is None:
+            spread = self.spread_bps * 1e-4 * price
+        return 0.5 * np.asarray(spread, dtype=np.float64) * quantity
+
+
+class SquareRootImpact(CostModel):
+    """
+    The square-root market impact model, in which the price
+    impact of a trade is proportional to the volatility times
+    the square root of the fraction of volume traded:
+
+    impact = coefficient * volatility * price * sqrt(|q| / volume)
+
+    The 'volume' and (per period) 'volatility' can be passed in
+    per fill, otherwise the defaults given here are used.
+    """
+
+    def __init__(self, coefficient=0.1, volatility=0.02, volume=1e6):
+        self.coefficient = coefficient
+        self.volatility = volatility
+        self.volume = volume
+
+    def cost(self, quantity, price, volume=None, volatility=None, **market):
+        quantity, price = _as_arrays(quantity, price)
+        if volume is None:
+            volume = self.volume
+        if volatility is None:
+            volatility = self.volatility
+        volume = np.asarray(volume, dtype=np.float64)
+
+        # Fills against no reported volume get the impact of
+        # trading the whole period's volume
+        participation = np.where(
+            volume > 0, quantity / np.where(volume > 0, volume, 1.0), 1.0
+        )
+        impact = self.coefficient * volatility * price * np.sqrt(participation)
+        return impact * quantity
+
+
+class CompositeCost(CostModel):
+    """
+    The sum of several cost models, e.g. spread slippage plus
+    market impact.
+    """
+
+    def __init__(self, *models):
+        self.models = models
+
+    def cost(self, quantity, price, **market):
+        total = 0.0
+        for model in self.models:
+            total = total + model.cost(quantity, price, **market)
+        return total
+
+
+def transaction_costs(
+    quantity, price, commission_model=None, slippage_model=None, **market
+):
+    """
+    Calculates the commission and slippage of arrays of fills.
+
+    Parameters:
+    quantity - The filled quantities.
+    price - The fill prices.
+    commission_model - The CostModel for commissions, defaulting
+        to the Interactive Brokers directed order fees.
+    slippage_model - Optional CostModel for slippage and impact.
+    market - Market data passed through to the models.
+
+    Returns:
+    commission, slippage - Arrays of costs in USD.
+    """
+    if commission_model is None:
+        commission_model = IBDirectedCommission()
+    commission = commission_model.cost(quantity, price, **market)
+    if slippage_model is None:
+        slippage = np.zeros(np.broadcast(quantity, price).shape)
+    else:
+        slippage = slippage_model.cost(quantity, price, **market)
+    return commission, slippage
+
+
+if __name__ == "__main__":
+    import time
+
+    # Re-cost a million synthetic fills under several schedules
+    rs = np.random.RandomState(42)
+    n = 1000000
+    quantity = rs.randint(1, 5000, n)
+    price = rs.uniform(5.0, 500.0, n)
+    volume = rs.uniform(1e5, 1e7, n)
+
+    models = [
+        ("IB directed", IBDirectedCommission(), None),
+        ("IB fixed", IBFixedCommission(), None),
+        ("IB tiered", IBTieredCommission(), None),
+        ("1c/share + spread", PerShareCommission(0.01), SpreadSlippage(5.0)),
+        ("1bp + impact", BpsCommission(1.0), SquareRootImpact()),
+    ]
+    for name, commission_model, slippage_model in models:
+        start = time.time()
+        commission, slippage = transaction_costs(
+            quantity, price, commission_model, slippage_model, volume=volume
+        )
+        print("%s: commission $%0.2f, slippage $%0.2f in %0.3fs" % (
+            name, commission.sum(), slippage.sum(), time.time() - start)
+        )
@@ -103,6 +103,7 @@ class HistoricCSVDataHandler(DataHandler):
         self.symbol_list = symbol_list
 
         self.symbol_data = {}
+        self.symbol_frames = {}
         self.latest_symbol_data = {}
         self.continue_backtest = True       
         self.bar_index = 0
@@ -143,6 +144,7 @@ class HistoricCSVDataHandler(DataHandler):
                 index=comb_index, method='pad'
             )
             self.symbol_data[s]["returns"] = self.symbol_data[s]["adj_close"].pct_change()
+            self.symbol_frames[s] = self.symbol_data[s]
             self.symbol_data[s] = self.symbol_data[s].iterrows()
 
     def _get_new_bar(self, symbol):
@@ -215,6 +217,23 @@ class HistoricCSVDataHandler(DataHandler):
         else:
             return np.array([getattr(b[1], val_type) for b in bars_list])
 
+    def get_all_bars_values(self, symbol, val_type):
+        """
+        Returns the values of every bar in the backtest, including
+        those not yet reached, for vectorised calculations such as
+        batch model predictions. Element i is the value of the
+        bar that is the (i+1)-th to be pushed by update_bars.
+        Callers must only use values up to the current bar
+        for anything that is traded on.
+        """
+        try:
+            frame = self.symbol_frames[symbol]
+        except KeyError:
+            print("That symbol is not available in the historical data set.")
+            raise
+        else:
+            return frame[val_type].values
+
     def update_bars(self):
         """
         Pushes the latest bar to the latest_symbol_data structure
@@ -5,6 +5,8 @@
 
 from __future__ import print_function
 
+from costs import IBDirectedCommission
+
 
 class Event(object):
     """
@@ -61,7 +63,7 @@ class OrderEvent(Event):
     quantity and a direction.
     """
 
-    def __init__(self, symbol, order_type, quantity, direction):
+    def __init__(self, symbol, order_type, quantity, direction, price=None):
         """
         Initialises the order type, setting whether it is
         a Market order ('MKT') or Limit order ('LMT'), has
@@ -76,20 +78,22 @@ class OrderEvent(Event):
         order_type - 'MKT' or 'LMT' for Market or Limit.
         quantity - Non-negative integer for quantity.
         direction - 'BUY' or 'SELL' for long or short.
+        price - The limit price, for Limit orders only.
         """
         self.type = 'ORDER'
         self.symbol = symbol
         self.order_type = order_type
         self.quantity = quantity
         self.direction = direction
+        self.price = price
 
     def print_order(self):
         """
         Outputs the values within the Order.
         """
         print(
-            "Order: Symbol=%s, Type=%s, Quantity=%s, Direction=%s" % 
-            (self.symbol, self.order_type, self.quantity, self.direction)
+            "Order: Symbol=%s, Type=%s, Quantity=%s, Direction=%s, Price=%s" % 
+            (self.symbol, self.order_type, self.quantity, self.direction, self.price)
         )
 
 
@@ -148,10 +152,8 @@ class FillEvent(Event):
 
         Based on "US API Directed Orders":
         https://www.interactivebrokers.com/en/index.php?f=commission&p=stocks2
+
+        The schedule itself lives in costs.IBDirectedCommission,
+        which also works on whole arrays of fills.
         """
-        full_cost = 1.3
-        if self.quantity <= 500:
-            full_cost = max(1.3, 0.013 * self.quantity)
-        else: # Greater than 500
-            full_cost = max(1.3, 0.008 * self.quantity)
-        return full_cost
+        return float(IBDirectedCommission().cost(self.quantity))
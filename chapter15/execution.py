@@ -41,6 +41,17 @@ class ExecutionHandler(object):
         """
         raise NotImplementedError("Should implement execute_order()")
 
+    def update_market(self, event):
+        """
+        Called with each MarketEvent before the strategies see
+        it. Simulated exchanges use this to match any working
+        orders against the new bar, otherwise it does nothing.
+
+        Parameters:
+        event - The MarketEvent for the latest bar.
+        """
+        pass
+
 
 class SimulatedExecutionHandler(ExecutionHandler):
     """
@@ -0,0 +1,237 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# feature_store.py
+
+from __future__ import print_function
+
+import datetime
+import hashlib
+import os, os.path
+import pickle
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+
+# The securities master database, as used by the chapter 7
+# scripts, and the default location of the memoised features
+DB_PATH = os.environ.get('DB_PATH')
+CACHE_DIR = os.environ.get(
+    'FEATURE_CACHE', os.path.join(os.path.expanduser('~'), '.feature_store')
+)
+
+
+def _to_datetime(d):
+    return pd.Timestamp(d).to_pydatetime()
+
+
+def load_prices(symbol, start_date, end_date, db_path=None, csv_dir=None):
+    """
+    Loads the daily bars of a symbol from local data, either
+    the 'symbol.csv' file of a directory of Yahoo format CSV
+    files (the bar cache used by HistoricCSVDataHandler) or
+    the daily_price table of the securities master.
+
+    Parameters:
+    symbol - The ticker symbol.
+    start_date, end_date - The (inclusive) date range.
+    db_path - The securities master SQLite database, defaulting
+        to the DB_PATH environment variable.
+    csv_dir - Optional directory of CSV files, used in
+        preference to the database.
+
+    Returns:
+    A DataFrame of open, high, low, close, volume and adj_close,
+    indexed on date.
+    """
+    columns = ['open', 'high', 'low', 'close', 'volume', 'adj_close']
+    start_date = _to_datetime(start_date)
+    end_date = _to_datetime(end_date)
+
+    if csv_dir is not None:
+        prices = pd.read_csv(
+            os.path.join(csv_dir, '%s.csv' % symbol),
+            header=0, index_col=0, parse_dates=True,
+            names=['datetime'] + columns
+        ).sort_index()
+        return prices[(prices.index >= start_date) & (prices.index <= end_date)]
+
+    db_path = db_path or DB_PATH
+    if db_path is None:
+        raise ValueError("No securities master database or CSV directory given")
+    conn = sqlite3.connect(db_path)
+    try:
+        prices = pd.read_sql_query(
+            """SELECT dp.price_date, dp.open_price, dp.high_price,
+                      dp.low_price, dp.close_price, dp.volume,
+                      dp.adj_close_price
+               FROM daily_price AS dp
+               INNER JOIN symbol AS sym ON dp.symbol_id = sym.id
+               WHERE sym.ticker = ?
+                 AND dp.price_date >= julianday(?) - 2440587.5
+                 AND dp.price_date <= julianday(?) - 2440587.5
+               ORDER BY dp.price_date ASC""",
+            conn, params=(
+                symbol, start_date.strftime('%Y-%m-%d'),
+                end_date.strftime('%Y-%m-%d')
+            ), index_col='price_date'
+        )
+    finally:
+        conn.close()
+    prices.columns = columns
+
+    # Prices are stored by day number since 1970-01-01
+    prices.index = pd.to_datetime(prices.index, unit='D')
+    prices.index.name = 'datetime'
+    return prices
+
+
+def load_price_panel(
+    symbols, start_date, end_date, field='adj_close',
+    db_path=None, csv_dir=None
+):
+    """
+    Loads one price field for several symbols into a single
+    DataFrame, with one column per symbol, on the union of
+    their dates.
+    """
+    return pd.DataFrame(dict(
+        (s, load_prices(s, start_date, end_date, db_path, csv_dir)[field])
+        for s in symbols
+    ), columns=list(symbols))
+
+
+def lagged_return_arrays(returns, lags=5):
+    """
+    Builds the lagged features from an array of percentage
+    returns in one vectorised pass.
+
+    Row i holds the return of day i (with near-zero returns set
+    to 0.0001, which stops issues with the QDA model in
+    scikit-learn), the returns of the prior lags days and the
+    direction (+1 or -1) of day i. Rows without enough history
+    contain NaNs.
+
+    Returns:
+    today, lag_matrix, direction - Arrays of length n, (n x lags)
+        and n respectively.
+    """
+    returns = np.asarray(returns, dtype=np.float64)
+    n = len(returns)
+    lag_matrix = np.full((n, lags), np.nan)
+    for k in range(1, min(lags, n - 1) + 1):
+        lag_matrix[k:, k - 1] = returns[:n - k]
+
+    with np.errstate(invalid='ignore'):
+        today = np.where(np.abs(returns) < 0.0001, 0.0001, returns)
+    direction = np.sign(today)
+    return today, lag_matrix, direction
+
+
+def lagged_features(prices, start_date=None, lags=5):
+    """
+    Creates the DataFrame of percentage returns of the adjusted
+    close, along with a number of lagged returns from the prior
+    trading days, the trading volume and the Direction of the
+    day, in the same layout as create_lagged_series.
+    """
+    adj_close = prices['adj_close'].values.astype(np.float64)
+    returns = np.full(len(adj_close), np.nan)
+    returns[1:] = (adj_close[1:] / adj_close[:-1] - 1.0) * 100.0
+    today, lag_matrix, direction = lagged_return_arrays(returns, lags)
+
+    tsret = pd.DataFrame(index=prices.index)
+    tsret["Volume"] = prices['volume'].values
+    tsret["Today"] = today
+    for k in range(lags):
+        tsret["Lag%s" % (k + 1)] = lag_matrix[:, k]
+    tsret["Direction"] = direction
+    if start_date is not None:
+        tsret = tsret[tsret.index >= _to_datetime(start_date)]
+    return tsret
+
+
+def source_stamp(path):
+    """
+    Returns the modification time and size of a data file, and
+    of its SQLite write-ahead log if there is one. In WAL mode
+    new rows sit in the '-wal' file until a checkpoint, without
+    touching the database file itself.
+    """
+    stamp = [os.path.getmtime(path), os.path.getsize(path)]
+    wal_path = path + '-wal'
+    if os.path.exists(wal_path):
+        stamp += [os.path.getmtime(wal_path), os.path.getsize(wal_path)]
+    return tuple(stamp)
+
+
+def _cache_key(symbol, start_date, end_date, lags, db_path, csv_dir):
+    """
+    Returns the memo key for a feature request. The source file
+    stamp is included so that new data is picked up.
+    """
+    if csv_dir is not None:
+        source = os.path.abspath(os.path.join(csv_dir, '%s.csv' % symbol))
+    else:
+        source = os.path.abspath(db_path)
+    return hashlib.sha1(repr((
+        symbol, str(_to_datetime(start_date)), str(_to_datetime(end_date)),
+        lags, source, source_stamp(source)
+    )).encode('utf-8')).hexdigest()
+
+
+def create_lagged_series(
+    symbol, start_date, end_date, lags=5, db_path=None,
+    csv_dir=None, cache_dir=CACHE_DIR
+):
+    """
+    This creates a pandas DataFrame that stores the
+    percentage returns of the adjusted closing value of
+    a stock obtained from local data, along with a
+    number of lagged returns from the prior trading days
+    (lags defaults to 5 days). Trading volume, as well as
+    the Direction from the previous day, are also included.
+
+    The result is memoised on disk, keyed by the symbol, the
+    date range, the lags and the data source, so that the
+    forecasting scripts share features rather than rebuilding
+    them on every run.
+
+    Parameters:
+    symbol - The ticker symbol.
+    start_date, end_date - The date range of the features.
+    lags - The number of lagged returns.
+    db_path - The securities master SQLite database.
+    csv_dir - Optional directory of Yahoo format CSV files.
+    cache_dir - The memo directory, None to disable it.
+    """
+    db_path = db_path or DB_PATH
+    if db_path is None and csv_dir is None:
+        raise ValueError("No securities master database or CSV directory given")
+
+    cache_path = None
+    if cache_dir is not None:
+        key = _cache_key(symbol, start_date, end_date, lags, db_path, csv_dir)
+        cache_path = os.path.join(cache_dir, '%s.pkl' % key)
+        if os.path.exists(cache_path):
+            with open(cache_path, 'rb') as f:
+                return pickle.load(f)
+
+    # Take a year of extra history so that the lags and
+    # returns at the start of the range are populated
+    prices = load_prices(
+        symbol, _to_datetime(start_date) - datetime.timedelta(days=365),
+        end_date, db_path, csv_dir
+    )
+    tsret = lagged_features(prices, start_date, lags)
+
+    if cache_path is not None:
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        tmp_path = '%s.%s.tmp' % (cache_path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(tsret, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, cache_path)
+    return tsret
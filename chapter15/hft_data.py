@@ -14,6 +14,7 @@ import pandas as pd
 
 from event import MarketEvent
 from data import DataHandler
+from intraday_store import IntradayStore
 
 
 class HistoricCSVDataHandlerHFT(DataHandler):
@@ -60,15 +61,7 @@ class HistoricCSVDataHandlerHFT(DataHandler):
         """
         comb_index = None
         for s in self.symbol_list:
-            # Load the CSV file with no header information, indexed on date
-            self.symbol_data[s] = pd.io.parsers.read_csv(
-                os.path.join(self.csv_dir, '%s.csv' % s),
-                header=0, index_col=0, parse_dates=True,
-                names=[
-                    'datetime', 'open', 'low', 
-                    'high', 'close', 'volume', 'oi'
-                ]
-            ).sort()
+            self.symbol_data[s] = self._load_symbol_data(s)
 
             # Combine the index to pad forward values
             if comb_index is None:
@@ -86,6 +79,20 @@ class HistoricCSVDataHandlerHFT(DataHandler):
             self.symbol_data[s]["returns"] = self.symbol_data[s]["close"].pct_change()
             self.symbol_data[s] = self.symbol_data[s].iterrows()
 
+    def _load_symbol_data(self, symbol):
+        """
+        Loads the bars of a symbol as a DataFrame indexed on date.
+        """
+        # Load the CSV file with no header information, indexed on date
+        return pd.io.parsers.read_csv(
+            os.path.join(self.csv_dir, '%s.csv' % symbol),
+            header=0, index_col=0, parse_dates=True,
+            names=[
+                'datetime', 'open', 'low', 
+                'high', 'close', 'volume', 'oi'
+            ]
+        ).sort()
+
     def _get_new_bar(self, symbol):
         """
         Returns the latest bar from the data feed.
@@ -170,3 +177,39 @@ class HistoricCSVDataHandlerHFT(DataHandler):
                 if bar is not None:
                     self.latest_symbol_data[s].append(bar)
         self.events.put(MarketEvent())
+
+
+class HistoricSQLiteDataHandlerHFT(HistoricCSVDataHandlerHFT):
+    """
+    HistoricSQLiteDataHandlerHFT reads the minute bars of each
+    symbol from the minute_bar table of the securities master,
+    as loaded from IQFeed CSV files by intraday_store.py, rather
+    than from the CSV files themselves.
+    """
+
+    def __init__(self, events, db_path, symbol_list, start=None, end=None):
+        """
+        Initialises the historic data handler from the database.
+
+        Parameters:
+        events - The Event Queue.
+        db_path - The securities master SQLite database.
+        symbol_list - A list of symbol strings.
+        start, end - Optional (inclusive) datetime range of bars.
+        """
+        self.start = start
+        self.end = end
+        self.store = IntradayStore(db_path)
+        try:
+            super(HistoricSQLiteDataHandlerHFT, self).__init__(
+                events, db_path, symbol_list
+            )
+        finally:
+            self.store.close()
+
+    def _load_symbol_data(self, symbol):
+        """
+        Loads the bars of a symbol in the date range with one
+        indexed query.
+        """
+        return self.store.load_bars(symbol, self.start, self.end)
@@ -7,6 +7,7 @@ from __future__ import print_function
 
 import datetime
 from math import floor
+import os.path
 try:
     import Queue as queue
 except ImportError:
@@ -17,6 +18,8 @@ import pandas as pd
 
 from event import FillEvent, OrderEvent
 from performance import create_sharpe_ratio, create_drawdowns
+from results import StreamingResults, read_results
+from risk import OnlineRiskMonitor
 
 
 class PortfolioHFT(object):
@@ -38,7 +41,12 @@ class PortfolioHFT(object):
     portfolio total across bars.
     """
 
-    def __init__(self, bars, events, start_date, initial_capital=100000.0):
+    def __init__(
+        self, bars, events, start_date, initial_capital=100000.0,
+        confidence_levels=(0.95, 0.99), max_var=None,
+        equity_file='equity.csv', results_dir=None,
+        commission_model=None, slippage_model=None
+    ):
         """
         Initialises the portfolio with bars and an event queue. 
         Also includes a starting datetime index and initial capital 
@@ -49,12 +57,26 @@ class PortfolioHFT(object):
         events - The Event Queue object.
         start_date - The start date (bar) of the portfolio.
         initial_capital - The starting capital in USD.
+        confidence_levels - The VaR confidence levels to track.
+        max_var - Optional one-bar VaR limit as a fraction of equity,
+            above which no new positions are opened.
+        equity_file - The CSV file the equity curve is written to.
+        results_dir - If given, positions and holdings are streamed
+            to columnar binary tables in this directory instead
+            of being kept in memory until the end of the backtest.
+        commission_model - Optional costs.CostModel used for the
+            commission instead of the one on each FillEvent.
+        slippage_model - Optional costs.CostModel for slippage
+            and market impact, deducted from cash on each fill.
         """
         self.bars = bars
         self.events = events
         self.symbol_list = self.bars.symbol_list
         self.start_date = start_date
         self.initial_capital = initial_capital
+        self.equity_file = equity_file
+        self.commission_model = commission_model
+        self.slippage_model = slippage_model
         
         self.all_positions = self.construct_all_positions()
         self.current_positions = dict( (k,v) for k, v in [(s, 0) for s in self.symbol_list] )
@@ -62,6 +84,16 @@ class PortfolioHFT(object):
         self.all_holdings = self.construct_all_holdings()
         self.current_holdings = self.construct_current_holdings()
 
+        self.risk = OnlineRiskMonitor(
+            self.symbol_list, confidence_levels=confidence_levels,
+            max_var=max_var
+        )
+
+        self.results = None
+        if results_dir is not None:
+            self.results = StreamingResults(results_dir, self.symbol_list)
+            self.results.append(self.all_positions[0], self.all_holdings[0])
+
     def construct_all_positions(self):
         """
         Constructs the positions list using the start_date
@@ -113,7 +145,8 @@ class PortfolioHFT(object):
             dp[s] = self.current_positions[s]
 
         # Append the current positions
-        self.all_positions.append(dp)
+        if self.results is None:
+            self.all_positions.append(dp)
 
         # Update holdings
         # ===============
@@ -123,15 +156,28 @@ class PortfolioHFT(object):
         dh['commission'] = self.current_holdings['commission']
         dh['total'] = self.current_holdings['cash']
 
+        prices = []
         for s in self.symbol_list:
             # Approximation to the real value
-            market_value = self.current_positions[s] * \
-                self.bars.get_latest_bar_value(s, "close")
+            price = self.bars.get_latest_bar_value(s, "close")
+            market_value = self.current_positions[s] * price
+            prices.append(price)
             dh[s] = market_value
             dh['total'] += market_value
 
-        # Append the current holdings
-        self.all_holdings.append(dh)
+        # Append the current holdings, or stream both records
+        # to disk, keeping only the latest ones in memory
+        if self.results is None:
+            self.all_holdings.append(dh)
+        else:
+            self.results.append(dp, dh)
+            self.all_positions = [dp]
+            self.all_holdings = [dh]
+
+        # Update the streaming risk estimates
+        self.risk.update(
+            dh['total'], prices, [dh[s] for s in self.symbol_list]
+        )
 
     # ======================
     # FILL/POSITION HANDLING
@@ -170,15 +216,36 @@ class PortfolioHFT(object):
         if fill.direction == 'SELL':
             fill_dir = -1
 
+        # Use the cost of the fill where the execution handler
+        # provides it, otherwise the latest bar price
+        if fill.fill_cost is None:
+            fill_cost = self.bars.get_latest_bar_value(
+                fill.symbol, "close"
+            ) * fill.quantity
+        else:
+            fill_cost = fill.fill_cost
+
+        # Commission and slippage from the cost models, if any
+        commission = fill.commission
+        slippage = 0.0
+        if self.commission_model is not None or self.slippage_model is not None:
+            price = fill_cost / fill.quantity if fill.quantity else 0.0
+            volume = self.bars.get_latest_bar_value(fill.symbol, "volume")
+            if self.commission_model is not None:
+                commission = float(self.commission_model.cost(
+                    fill.quantity, price, volume=volume
+                ))
+            if self.slippage_model is not None:
+                slippage = float(self.slippage_model.cost(
+                    fill.quantity, price, volume=volume
+                ))
+
         # Update holdings list with new quantities
-        fill_cost = self.bars.get_latest_bar_value(
-            fill.symbol, "close"
-        )
-        cost = fill_dir * fill_cost * fill.quantity
+        cost = fill_dir * fill_cost
         self.current_holdings[fill.symbol] += cost
-        self.current_holdings['commission'] += fill.commission
-        self.current_holdings['cash'] -= (cost + fill.commission)
-        self.current_holdings['total'] -= (cost + fill.commission)
+        self.current_holdings['commission'] += commission
+        self.current_holdings['cash'] -= (cost + commission + slippage)
+        self.current_holdings['total'] -= (cost + commission + slippage)
 
     def update_fill(self, event):
         """
@@ -225,6 +292,12 @@ class PortfolioHFT(object):
         based on the portfolio logic.
         """
         if event.type == 'SIGNAL':
+            # Only allow exits while the VaR limit is breached
+            if event.signal_type != 'EXIT' and self.risk.limit_breached():
+                print("VaR limit breached, ignoring %s signal for %s" % (
+                    event.signal_type, event.symbol)
+                )
+                return
             order_event = self.generate_naive_order(event)
             self.events.put(order_event)
 
@@ -236,7 +309,20 @@ class PortfolioHFT(object):
         """
         Creates a pandas DataFrame from the all_holdings
         list of dictionaries.
+
+        When streaming results, the 'equity' table and the
+        summary statistics are instead created in one chunked
+        pass over the holdings on disk, and only the last rows
+        of the equity curve are loaded into memory.
         """
+        if self.results is not None:
+            self.results.close()
+            self.stream_stats = self.results.create_equity_curve(periods=252*6.5*60)
+            self.equity_curve = read_results(
+                os.path.join(self.results.results_dir, 'equity'), start=-10
+            )
+            return
+
         curve = pd.DataFrame(self.all_holdings)
         curve.set_index('datetime', inplace=True)
         curve['returns'] = curve['total'].pct_change()
@@ -247,6 +333,14 @@ class PortfolioHFT(object):
         """
         Creates a list of summary statistics for the portfolio.
         """
+        if self.results is not None:
+            return self._format_summary_stats(
+                self.stream_stats['total_return'],
+                self.stream_stats['sharpe_ratio'],
+                self.stream_stats['max_drawdown'],
+                self.stream_stats['drawdown_duration']
+            )
+
         total_return = self.equity_curve['equity_curve'][-1]
         returns = self.equity_curve['returns']
         pnl = self.equity_curve['equity_curve']
@@ -254,11 +348,22 @@ class PortfolioHFT(object):
         sharpe_ratio = create_sharpe_ratio(returns, periods=252*6.5*60)
         drawdown, max_dd, dd_duration = create_drawdowns(pnl)
         self.equity_curve['drawdown'] = drawdown
+        self.equity_curve.to_csv(self.equity_file)
+
+        return self._format_summary_stats(
+            total_return, sharpe_ratio, max_dd, dd_duration
+        )
 
+    def _format_summary_stats(
+        self, total_return, sharpe_ratio, max_dd, dd_duration
+    ):
+        """
+        Formats the summary statistics, along with the latest
+        risk statistics, as a list of (name, value) tuples.
+        """
         stats = [("Total Return", "%0.2f%%" % ((total_return - 1.0) * 100.0)),
                  ("Sharpe Ratio", "%0.2f" % sharpe_ratio),
                  ("Max Drawdown", "%0.2f%%" % (max_dd * 100.0)),
                  ("Drawdown Duration", "%d" % dd_duration)]
-
-        self.equity_curve.to_csv('equity.csv')
+        stats.extend(self.risk.output_summary_stats())
         return stats
@@ -6,7 +6,7 @@
 from __future__ import print_function
 
 import datetime
-import time
+import threading
 
 from ib.ext.Contract import Contract
 from ib.ext.Order import Order
@@ -14,6 +14,7 @@ from ib.opt import ibConnection, message
 
 from event import FillEvent, OrderEvent
 from execution import ExecutionHandler
+from order_store import OrderStore, CANCELLED, REJECTED
 
 
 class IBExecutionHandler(ExecutionHandler):
@@ -21,65 +22,132 @@ class IBExecutionHandler(ExecutionHandler):
     Handles order execution via the Interactive Brokers
     API, for use against accounts when trading live
     directly.
+
+    Orders are pipelined: execute_order sends each order as
+    soon as it is received and returns without waiting for
+    TWS. Every order is tracked in an OrderStore keyed on its
+    orderId, and the (possibly partial) fills reported by TWS
+    are turned into FillEvents as the order status messages
+    arrive on the IbPy reader thread. If the store is given a
+    write-ahead log, the open orders survive a restart.
     """
 
+    # TWS order states after which no further fills are sent
+    cancelled_states = ("Cancelled", "ApiCancelled", "Inactive")
+
     def __init__(
-        self, events, order_routing="SMART", currency="USD"
+        self, events, order_routing="SMART", currency="USD",
+        host="localhost", port=7496, client_id=100, id_timeout=10.0,
+        wal_path=None
     ):
         """
         Initialises the IBExecutionHandler instance.
 
         Parameters:
         events - The Queue of Event objects.
+        order_routing - The exchange the orders are routed to.
+        currency - The currency of the orders.
+        host - The host TWS (or the gateway) is running on.
+        port - The port TWS is listening on.
+        client_id - The clientId used for this connection.
+        id_timeout - Seconds to wait for TWS to send the next
+            valid order ID after connecting.
+        wal_path - Optional write-ahead log for the OrderStore,
+            replayed on start up to recover the open orders.
         """
         self.events = events
         self.order_routing = order_routing
         self.currency = currency
-        self.fill_dict = {}
+        self.host = host
+        self.port = port
+        self.client_id = client_id
+        self.id_timeout = id_timeout
+
+        # The reply handler runs on the IbPy reader
+        # thread, so the order store is guarded by the lock
+        if wal_path is not None:
+            self.order_store = OrderStore.recover(wal_path)
+        else:
+            self.order_store = OrderStore()
+        self.lock = threading.Lock()
+        self.valid_id = threading.Event()
+        self.order_id = None
 
         self.tws_conn = self.create_tws_connection()
-        self.order_id = self.create_initial_order_id()
         self.register_handlers()
+        if not self.tws_conn.connect():
+            raise RuntimeError(
+                "Could not connect to TWS on %s:%s" % (host, port)
+            )
+        self.order_id = self.create_initial_order_id()
 
     def _error_handler(self, msg):
         """Handles the capturing of error messages"""
-        # Currently no error handling.
+        # Order rejections are reported as errors against the
+        # orderId, in which case the order is no longer working
+        if msg.errorCode == 201:
+            with self.lock:
+                if msg.id in self.order_store:
+                    # This runs on the IbPy reader thread, which
+                    # must survive an unexpected broker message
+                    try:
+                        self.order_store.set_status(msg.id, REJECTED)
+                    except ValueError as e:
+                        print("Ignoring rejection of order %s: %s" % (msg.id, e))
         print("Server Error: %s" % msg)
 
+    def _next_valid_id_handler(self, msg):
+        """
+        Handles the next valid order ID, which TWS sends on
+        connection and in reply to reqIds.
+        """
+        with self.lock:
+            if self.order_id is None or msg.orderId > self.order_id:
+                self.order_id = msg.orderId
+        self.valid_id.set()
+
     def _reply_handler(self, msg):
         """Handles of server replies"""
-        # Handle open order orderId processing
-        if msg.typeName == "openOrder" and \
-            msg.orderId == self.order_id and \
-            not self.fill_dict.has_key(msg.orderId):
-            self.create_fill_dict_entry(msg)
-        # Handle Fills
-        if msg.typeName == "orderStatus" and \
-            msg.status == "Filled" and \
-            self.fill_dict[msg.orderId]["filled"] == False:
+        # Handle Fills, including partial fills
+        if msg.typeName == "orderStatus":
             self.create_fill(msg)
         print("Server Response: %s, %s\n" % (msg.typeName, msg))
 
     def create_tws_connection(self):
         """
-        Connect to the Trader Workstation (TWS) running on the
-        usual port of 7496, with a clientId of 100.
-        The clientId is chosen by us and we will need
-        separate IDs for both the execution connection and
-        market data connection, if the latter is used elsewhere.
+        Creates the connection to the Trader Workstation (TWS),
+        by default running on the usual port of 7496, with a
+        clientId of 100. The clientId is chosen by us and we
+        will need separate IDs for both the execution connection
+        and market data connection, if the latter is used
+        elsewhere.
+
+        The connection is made once the handlers are registered,
+        so that the initial nextValidId message is not missed.
         """
-        tws_conn = ibConnection()
-        tws_conn.connect()
+        tws_conn = ibConnection(
+            host=self.host, port=self.port, clientId=self.client_id
+        )
         return tws_conn
 
     def create_initial_order_id(self):
         """
-        Creates the initial order ID used for Interactive
-        Brokers to keep track of submitted orders.
+        Obtains the initial order ID used for Interactive
+        Brokers to keep track of submitted orders, by asking
+        TWS for the next valid ID and waiting for the reply.
+        IDs of recovered orders are never reused.
         """
-        # There is scope for more logic here, but we
-        # will use "1" as the default for now.
-        return 1
+        self.tws_conn.reqIds(1)
+        if not self.valid_id.wait(self.id_timeout):
+            raise RuntimeError(
+                "No valid order ID received from TWS within %ss" %
+                self.id_timeout
+            )
+        with self.lock:
+            max_id = self.order_store.max_order_id()
+            if max_id is not None and max_id >= self.order_id:
+                return max_id + 1
+            return self.order_id
 
     def register_handlers(self):
         """
@@ -90,6 +158,9 @@ class IBExecutionHandler(ExecutionHandler):
         # to the TWS connection
         self.tws_conn.register(self._error_handler, 'Error')
 
+        # Keep track of the order IDs handed out by TWS
+        self.tws_conn.register(self._next_valid_id_handler, 'NextValidId')
+
         # Assign all of the server reply messages to the
         # reply_handler function defined above
         self.tws_conn.registerAll(self._reply_handler)
@@ -111,71 +182,69 @@ class IBExecutionHandler(ExecutionHandler):
         contract.m_currency = curr
         return contract
 
-    def create_order(self, order_type, quantity, action):
+    def create_order(self, order_type, quantity, action, price=None):
         """Create an Order object (Market/Limit) to go long/short.
 
         order_type - 'MKT', 'LMT' for Market or Limit orders
         quantity - Integral number of assets to order
-        action - 'BUY' or 'SELL'"""
+        action - 'BUY' or 'SELL'
+        price - The limit price, for limit orders"""
         order = Order()
         order.m_orderType = order_type
         order.m_totalQuantity = quantity
         order.m_action = action
+        if price is not None:
+            order.m_lmtPrice = price
         return order
 
-    def create_fill_dict_entry(self, msg):
-        """
-        Creates an entry in the Fill Dictionary that lists
-        orderIds and provides security information. This is
-        needed for the event-driven behaviour of the IB
-        server message behaviour.
-        """
-        self.fill_dict[msg.orderId] = {
-            "symbol": msg.contract.m_symbol,
-            "exchange": msg.contract.m_exchange,
-            "direction": msg.order.m_action,
-            "filled": False
-        }
-
     def create_fill(self, msg):
         """
         Handles the creation of the FillEvent that will be
         placed onto the events queue subsequent to an order
-        being filled.
-        """
-        fd = self.fill_dict[msg.orderId]
-
-        # Prepare the fill data
-        symbol = fd["symbol"]
-        exchange = fd["exchange"]
-        filled = msg.filled
-        direction = fd["direction"]
-        fill_cost = msg.avgFillPrice
+        being (partially) filled.
 
-        # Create a fill event object
-        fill = FillEvent(
-            datetime.datetime.utcnow(), symbol,
-            exchange, filled, direction, fill_cost
-        )
-
-        # Make sure that multiple messages don't create
-        # additional fills.
-        self.fill_dict[msg.orderId]["filled"] = True
+        TWS reports the cumulative quantity filled and the
+        average fill price, which the OrderStore turns into
+        the quantity and cost of the new fill. Repeated status
+        messages therefore don't create additional fills.
+        """
+        with self.lock:
+            order = self.order_store.get(msg.orderId)
+            if order is None:
+                return
+
+            # Prepare the fill data
+            filled, fill_cost = self.order_store.fill(
+                msg.orderId, msg.filled, msg.avgFillPrice
+            )
+            if msg.status in self.cancelled_states:
+                self.order_store.set_status(msg.orderId, CANCELLED)
+
+        if filled > 0:
+            # Create a fill event object
+            fill = FillEvent(
+                datetime.datetime.utcnow(), order.symbol,
+                order.exchange, filled, order.direction, fill_cost
+            )
 
-        # Place the fill event onto the event queue
-        self.events.put(fill_event)
+            # Place the fill event onto the event queue
+            self.events.put(fill)
 
     def execute_order(self, event):
         """
         Creates the necessary InteractiveBrokers order object
         and submits it to IB via their API.
 
-        The results are then queried in order to generate a
-        corresponding Fill object, which is placed back on
-        the event queue.
+        The order is sent without waiting for TWS to respond.
+        The results are handled as they arrive in order to
+        generate the corresponding Fill objects, which are
+        placed back on the event queue.
 
         Parameters:
         event - Contains an Event object with order information.
+
+        Returns:
+        The orderId, which can be used with cancel_order.
         """
         if event.type == 'ORDER':
             # Prepare the parameters for the asset order
@@ -184,6 +253,7 @@ class IBExecutionHandler(ExecutionHandler):
             order_type = event.order_type
             quantity = event.quantity
             direction = event.direction
+            price = getattr(event, 'price', None)
 
             # Create the Interactive Brokers contract via the
             # passed Order event
@@ -195,17 +265,42 @@ class IBExecutionHandler(ExecutionHandler):
             # Create the Interactive Brokers order via the
             # passed Order event
             ib_order = self.create_order(
-                order_type, quantity, direction
+                order_type, quantity, direction, price
             )
 
+            # Take the next order ID for this session and start
+            # tracking the order before it is sent, as the
+            # replies can arrive straight away
+            with self.lock:
+                order_id = self.order_id
+                self.order_id += 1
+                self.order_store.add(
+                    order_id, asset, self.order_routing, direction,
+                    quantity, order_type, price
+                )
+
             # Use the connection to the send the order to IB
-            self.tws_conn.placeOrder(
-                self.order_id, ib_contract, ib_order
-            )
+            self.tws_conn.placeOrder(order_id, ib_contract, ib_order)
+            return order_id
 
-            # NOTE: This following line is crucial.
-            # It ensures the order goes through!
-            time.sleep(1)
+    def cancel_order(self, order_id):
+        """
+        Asks TWS to cancel the unfilled remainder of an order.
+        The order stops being tracked once TWS confirms it.
+        """
+        self.tws_conn.cancelOrder(order_id)
 
-            # Increment the order ID for this session
-            self.order_id += 1
+    def working_orders(self):
+        """
+        Returns the number of orders that are still in flight.
+        """
+        with self.lock:
+            return len(self.order_store.open_orders())
+
+    def disconnect(self):
+        """
+        Closes the connection to TWS and the order store.
+        """
+        self.tws_conn.disconnect()
+        with self.lock:
+            self.order_store.close()
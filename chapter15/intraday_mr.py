@@ -13,8 +13,8 @@ import statsmodels.api as sm
 
 from strategy import Strategy
 from event import SignalEvent
-from backtest import Backtest
-from hft_data import HistoricCSVDataHandlerHFT
+from backtest import Backtest, MultiStrategyBacktest
+from hft_data import HistoricCSVDataHandlerHFT, HistoricSQLiteDataHandlerHFT
 from hft_portfolio import PortfolioHFT
 from execution import SimulatedExecutionHandler
 
@@ -32,7 +32,7 @@ class IntradayOLSMRStrategy(Strategy):
     
     def __init__(
         self, bars, events, ols_window=100, 
-        zscore_low=0.5, zscore_high=3.0
+        zscore_low=0.5, zscore_high=3.0, pair=None
     ):
         """
         Initialises the stat arb strategy.
@@ -40,6 +40,9 @@ class IntradayOLSMRStrategy(Strategy):
         Parameters:
         bars - The DataHandler object that provides bar information
         events - The Event Queue object.
+        pair - The (y, x) tickers to trade, e.g. a row of the
+            pairs.csv ranking from chapter10/pair_scanner.py,
+            defaulting to the first two symbols of the bars.
         """
         self.bars = bars
         self.symbol_list = self.bars.symbol_list
@@ -48,7 +51,7 @@ class IntradayOLSMRStrategy(Strategy):
         self.zscore_low = zscore_low
         self.zscore_high = zscore_high
 
-        self.pair = ('AREX', 'WLL')
+        self.pair = tuple(pair or self.symbol_list[:2])
         self.datetime = datetime.datetime.utcnow()
 
         self.long_market = False
@@ -141,15 +144,39 @@ class IntradayOLSMRStrategy(Strategy):
 
 
 if __name__ == "__main__":
+    import sys
+
     csv_dir = '/path/to/your/csv/file'  # CHANGE THIS!
-    symbol_list = ['AREX', 'WLL']
     initial_capital = 100000.0
     heartbeat = 0.0
     start_date = datetime.datetime(2007, 11, 8, 10, 41, 0)
 
-    backtest = Backtest(
-        csv_dir, symbol_list, initial_capital, heartbeat, 
-        start_date, HistoricCSVDataHandlerHFT, SimulatedExecutionHandler, 
-        PortfolioHFT, IntradayOLSMRStrategy
-    )
+    # A securities master with minute bars loaded by intraday_store.py
+    # can be given in place of the CSV directory
+    data_handler = HistoricCSVDataHandlerHFT
+    if csv_dir.endswith('.db'):
+        data_handler = HistoricSQLiteDataHandlerHFT
+
+    if len(sys.argv) > 1:
+        # Trade the top ranked pairs of a pair_scanner.py
+        # output file, e.g. python intraday_mr.py pairs.csv 5
+        top = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+        pairs = pd.read_csv(sys.argv[1]).head(top)
+        strategies = [
+            (IntradayOLSMRStrategy, {"pair": (row["y"], row["x"])})
+            for i, row in pairs.iterrows()
+        ]
+        symbol_list = sorted(set(pairs["y"]) | set(pairs["x"]))
+        backtest = MultiStrategyBacktest(
+            csv_dir, symbol_list, initial_capital, heartbeat,
+            start_date, data_handler, SimulatedExecutionHandler,
+            PortfolioHFT, strategies
+        )
+    else:
+        symbol_list = ['AREX', 'WLL']
+        backtest = Backtest(
+            csv_dir, symbol_list, initial_capital, heartbeat, 
+            start_date, data_handler, SimulatedExecutionHandler, 
+            PortfolioHFT, IntradayOLSMRStrategy
+        )
     backtest.simulate_trading()
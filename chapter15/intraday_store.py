@@ -0,0 +1,304 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# intraday_store.py
+
+from __future__ import print_function
+
+import glob
+import os, os.path
+import sqlite3
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from feature_store import DB_PATH
+
+
+# Both tables are clustered on (symbol_id, time), so a query for
+# one symbol over a time range is a single b-tree range scan.
+# Times are integers of the exchange's local wall-clock time, as
+# IQFeed reports it: seconds since 1970-01-01 for bars and
+# microseconds for ticks.
+MINUTE_BAR_TABLE = """
+    CREATE TABLE IF NOT EXISTS minute_bar (
+        symbol_id INTEGER NOT NULL,
+        bar_time INTEGER NOT NULL,
+        open_price REAL,
+        low_price REAL,
+        high_price REAL,
+        close_price REAL,
+        volume INTEGER,
+        oi INTEGER,
+        PRIMARY KEY(symbol_id, bar_time),
+        FOREIGN KEY(symbol_id) REFERENCES symbol(id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+"""
+
+# seq is the IQFeed tick ID, which orders ticks that share a time
+TICK_TABLE = """
+    CREATE TABLE IF NOT EXISTS tick (
+        symbol_id INTEGER NOT NULL,
+        tick_time INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        price REAL,
+        size INTEGER,
+        bid REAL,
+        ask REAL,
+        PRIMARY KEY(symbol_id, tick_time, seq),
+        FOREIGN KEY(symbol_id) REFERENCES symbol(id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+"""
+
+# The columns of an IQFeed minute bar CSV file, as read by
+# HistoricCSVDataHandlerHFT, and of an IQFeed tick CSV file
+BAR_COLUMNS = ['open', 'low', 'high', 'close', 'volume', 'oi']
+TICK_COLUMNS = ['price', 'size', 'total_volume', 'bid', 'ask', 'seq']
+
+BAR_INSERT_SQL = """
+    INSERT OR REPLACE INTO minute_bar
+    (symbol_id, bar_time, open_price, low_price, high_price,
+    close_price, volume, oi)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+TICK_INSERT_SQL = """
+    INSERT OR REPLACE INTO tick
+    (symbol_id, tick_time, seq, price, size, bid, ask)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _epoch(times, unit):
+    """
+    Converts datetimes to integer epoch seconds ('s') or
+    microseconds ('us'), without any time zone conversion.
+    """
+    return pd.DatetimeIndex(times).values.astype(
+        'datetime64[%s]' % unit
+    ).astype(np.int64)
+
+
+def _has_header(csv_path):
+    """
+    Whether a CSV file starts with a header line, rather than
+    a timestamped record as written by the IQFeed download.
+    """
+    with open(csv_path) as f:
+        first = f.readline()
+    return not first[:1].isdigit()
+
+
+def read_iqfeed_bars(csv_path):
+    """
+    Reads an IQFeed minute bar CSV file (a timestamp followed by
+    the BAR_COLUMNS) into a DataFrame indexed on datetime, with
+    or without a header line.
+    """
+    return pd.read_csv(
+        csv_path, header=0 if _has_header(csv_path) else None,
+        names=['datetime'] + BAR_COLUMNS, index_col=0,
+        parse_dates=True
+    ).sort_index()
+
+
+def read_iqfeed_ticks(csv_path):
+    """
+    Reads an IQFeed tick CSV file (a timestamp followed by the
+    TICK_COLUMNS, with any further fields ignored) into a
+    DataFrame indexed on datetime.
+    """
+    return pd.read_csv(
+        csv_path, header=0 if _has_header(csv_path) else None,
+        names=['datetime'] + TICK_COLUMNS, usecols=range(7),
+        index_col=0, parse_dates=True
+    ).sort_index()
+
+
+class IntradayStore(object):
+    """
+    IntradayStore keeps minute bars and ticks in the securities
+    master, alongside daily_price, so that the intraday history
+    of a symbol over any time range can be read with one indexed
+    query rather than by parsing whole CSV files.
+    """
+
+    def __init__(self, db_path=None):
+        """
+        Opens the database, creating the intraday tables if needed.
+
+        Parameters:
+        db_path - The securities master SQLite database, defaulting
+            to the DB_PATH environment variable.
+        """
+        self.db_path = db_path or DB_PATH
+        if self.db_path is None:
+            raise ValueError("No securities master database given")
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.execute(MINUTE_BAR_TABLE)
+        self.conn.execute(TICK_TABLE)
+        self.conn.commit()
+        self.symbol_ids = {}
+
+    def close(self):
+        self.conn.close()
+
+    def symbol_id(self, symbol, create=False, instrument='stock'):
+        """
+        Returns the ID of a ticker in the symbol table, adding
+        the ticker if it is missing and create is True.
+        """
+        if symbol not in self.symbol_ids:
+            row = self.conn.execute(
+                "SELECT MIN(id) FROM symbol WHERE ticker = ?", (symbol,)
+            ).fetchone()
+            if row[0] is None:
+                if not create:
+                    raise KeyError("Unknown symbol %s" % symbol)
+                cur = self.conn.execute(
+                    "INSERT INTO symbol (ticker, instrument) VALUES (?, ?)",
+                    (symbol, instrument)
+                )
+                self.conn.commit()
+                row = (cur.lastrowid,)
+            self.symbol_ids[symbol] = row[0]
+        return self.symbol_ids[symbol]
+
+    def write_bars(self, symbol, bars):
+        """
+        Upserts minute bars in one transaction.
+
+        Parameters:
+        symbol - The ticker symbol, added to the symbol table
+            if missing.
+        bars - A DataFrame of the BAR_COLUMNS indexed on datetime.
+
+        Returns:
+        The number of bars written.
+        """
+        n = len(bars)
+        symbol_id = self.symbol_id(symbol, create=True)
+        with self.conn:
+            self.conn.executemany(BAR_INSERT_SQL, zip(
+                [symbol_id] * n, _epoch(bars.index, 's').tolist(),
+                *[bars[c].tolist() for c in BAR_COLUMNS]
+            ))
+        return n
+
+    def write_ticks(self, symbol, ticks):
+        """
+        Upserts ticks in one transaction.
+
+        Parameters:
+        symbol - The ticker symbol, added to the symbol table
+            if missing.
+        ticks - A DataFrame of price, size, bid, ask and seq
+            indexed on datetime.
+
+        Returns:
+        The number of ticks written.
+        """
+        n = len(ticks)
+        symbol_id = self.symbol_id(symbol, create=True)
+        with self.conn:
+            self.conn.executemany(TICK_INSERT_SQL, zip(
+                [symbol_id] * n, _epoch(ticks.index, 'us').tolist(),
+                ticks['seq'].tolist(), ticks['price'].tolist(),
+                ticks['size'].tolist(), ticks['bid'].tolist(),
+                ticks['ask'].tolist()
+            ))
+        return n
+
+    def _range_params(self, symbol, start, end, unit):
+        start = -2 ** 62 if start is None else int(_epoch([start], unit)[0])
+        end = 2 ** 62 if end is None else int(_epoch([end], unit)[0])
+        return (self.symbol_id(symbol), start, end)
+
+    def load_bars(self, symbol, start=None, end=None):
+        """
+        Loads the minute bars of a symbol between two (inclusive)
+        datetimes, either of which may be None for no limit.
+
+        Returns:
+        A DataFrame of the BAR_COLUMNS indexed on datetime, as
+        HistoricCSVDataHandlerHFT reads from a CSV file.
+        """
+        rows = self.conn.execute(
+            """SELECT bar_time, open_price, low_price, high_price,
+                      close_price, volume, oi
+               FROM minute_bar
+               WHERE symbol_id = ? AND bar_time BETWEEN ? AND ?
+               ORDER BY bar_time""",
+            self._range_params(symbol, start, end, 's')
+        ).fetchall()
+        bars = pd.DataFrame(rows, columns=['datetime'] + BAR_COLUMNS)
+        bars['datetime'] = pd.to_datetime(bars['datetime'], unit='s')
+        return bars.set_index('datetime')
+
+    def load_ticks(self, symbol, start=None, end=None):
+        """
+        Loads the ticks of a symbol between two (inclusive)
+        datetimes, either of which may be None for no limit.
+
+        Returns:
+        A DataFrame of seq, price, size, bid and ask indexed
+        on datetime.
+        """
+        rows = self.conn.execute(
+            """SELECT tick_time, seq, price, size, bid, ask
+               FROM tick
+               WHERE symbol_id = ? AND tick_time BETWEEN ? AND ?
+               ORDER BY tick_time, seq""",
+            self._range_params(symbol, start, end, 'us')
+        ).fetchall()
+        ticks = pd.DataFrame(
+            rows, columns=['datetime', 'seq', 'price', 'size', 'bid', 'ask']
+        )
+        ticks['datetime'] = pd.to_datetime(ticks['datetime'], unit='us')
+        return ticks.set_index('datetime')
+
+    def ingest_iqfeed(self, csv_dir, ticks=False):
+        """
+        Loads every 'symbol.csv' file of a directory of IQFeed
+        downloads into the store.
+
+        Parameters:
+        csv_dir - The directory of CSV files.
+        ticks - Whether the files hold ticks rather than minute bars.
+
+        Returns:
+        A dictionary of symbol to the number of rows written.
+        """
+        read, write = (
+            (read_iqfeed_ticks, self.write_ticks) if ticks
+            else (read_iqfeed_bars, self.write_bars)
+        )
+        written = {}
+        for csv_path in sorted(glob.glob(os.path.join(csv_dir, '*.csv'))):
+            symbol = os.path.splitext(os.path.basename(csv_path))[0]
+            written[symbol] = write(symbol, read(csv_path))
+        return written
+
+
+if __name__ == "__main__":
+    # python intraday_store.py csv_dir [db_path] [ticks]
+    if len(sys.argv) < 2:
+        print("Usage: python intraday_store.py CSV_DIR [DB_PATH] [ticks]")
+        sys.exit(1)
+    store = IntradayStore(sys.argv[2] if len(sys.argv) > 2 else None)
+    started = time.time()
+    try:
+        written = store.ingest_iqfeed(
+            sys.argv[1], ticks=len(sys.argv) > 3 and sys.argv[3] == 'ticks'
+        )
+    finally:
+        store.close()
+    print(
+        "Ingested %s rows of %s symbols in %0.1fs" % (
+            sum(written.values()), len(written), time.time() - started
+        )
+    )
@@ -0,0 +1,325 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# order_store.py
+
+from __future__ import print_function
+
+import json
+import os, os.path
+
+
+# Order lifecycle states
+SUBMITTED = 'SUBMITTED'
+PARTIALLY_FILLED = 'PARTIALLY_FILLED'
+FILLED = 'FILLED'
+CANCELLED = 'CANCELLED'
+REJECTED = 'REJECTED'
+
+# The states each state can move to. A partially filled order
+# can still be rejected, e.g. when the broker refuses the rest
+TRANSITIONS = {
+    SUBMITTED: (PARTIALLY_FILLED, FILLED, CANCELLED, REJECTED),
+    PARTIALLY_FILLED: (PARTIALLY_FILLED, FILLED, CANCELLED, REJECTED),
+    FILLED: (),
+    CANCELLED: (),
+    REJECTED: ()
+}
+
+
+class OrderRecord(object):
+    """
+    The state of a single order: what was asked for, how
+    much of it has been filled and at what average price.
+    """
+
+    __slots__ = (
+        'order_id', 'symbol', 'exchange', 'direction', 'quantity',
+        'order_type', 'price', 'status', 'filled', 'avg_price'
+    )
+
+    def __init__(
+        self, order_id, symbol, exchange, direction, quantity,
+        order_type='MKT', price=None
+    ):
+        self.order_id = order_id
+        self.symbol = symbol
+        self.exchange = exchange
+        self.direction = direction
+        self.quantity = quantity
+        self.order_type = order_type
+        self.price = price
+        self.status = SUBMITTED
+        self.filled = 0
+        self.avg_price = 0.0
+
+    @property
+    def remaining(self):
+        return self.quantity - self.filled
+
+    @property
+    def is_open(self):
+        return bool(TRANSITIONS[self.status])
+
+    def to_dict(self):
+        return dict((k, getattr(self, k)) for k in self.__slots__)
+
+
+class OrderStore(object):
+    """
+    OrderStore tracks the lifecycle of every order sent to a
+    broker (submitted, partially filled, filled, cancelled or
+    rejected), along with the cumulative quantity filled and
+    the average fill price.
+
+    Orders are indexed by order ID and, while open, by symbol,
+    so that lookups and updates are O(1). Every change is
+    appended to an optional JSON-lines write-ahead log before
+    it is applied, so that a restarted process can rebuild its
+    open orders by replaying the log with OrderStore.recover,
+    rather than querying the broker.
+    """
+
+    def __init__(self, wal_path=None, sync=False):
+        """
+        Initialises the store, appending to the write-ahead
+        log if one is given.
+
+        Parameters:
+        wal_path - Optional path of the write-ahead log file.
+        sync - Whether to fsync the log after every write.
+        """
+        self.wal_path = wal_path
+        self.sync = sync
+        self.orders = {}
+        self.open_by_symbol = {}
+        self.wal = None
+        if self.wal_path is not None:
+            self.wal = open(self.wal_path, 'a')
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __contains__(self, order_id):
+        return order_id in self.orders
+
+    def _log(self, entry):
+        """
+        Appends an entry to the write-ahead log.
+        """
+        if self.wal is not None:
+            self.wal.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            self.wal.flush()
+            if self.sync:
+                os.fsync(self.wal.fileno())
+
+    def _apply(self, entry):
+        """
+        Applies a logged change to the in-memory state.
+        """
+        op = entry['op']
+        if op == 'add':
+            order = OrderRecord(
+                entry['order_id'], entry['symbol'], entry['exchange'],
+                entry['direction'], entry['quantity'],
+                entry['order_type'], entry['price']
+            )
+            self.orders[order.order_id] = order
+            self.open_by_symbol.setdefault(
+                order.symbol, {}
+            )[order.order_id] = order
+            return order
+
+        order = self.orders[entry['order_id']]
+        if op == 'fill':
+            order.filled = entry['filled']
+            order.avg_price = entry['avg_price']
+        order.status = entry['status']
+        if not order.is_open:
+            symbol_orders = self.open_by_symbol[order.symbol]
+            symbol_orders.pop(order.order_id, None)
+            if not symbol_orders:
+                del self.open_by_symbol[order.symbol]
+        return order
+
+    def _transition(self, order, status):
+        """
+        Checks that an order can move to a new state.
+        """
+        if status not in TRANSITIONS[order.status]:
+            raise ValueError(
+                "Order %s cannot move from %s to %s" % (
+                    order.order_id, order.status, status
+                )
+            )
+
+    def add(
+        self, order_id, symbol, exchange, direction, quantity,
+        order_type='MKT', price=None
+    ):
+        """
+        Records a newly submitted order.
+
+        Returns:
+        The OrderRecord for the order.
+        """
+        if order_id in self.orders:
+            raise ValueError("Order %s already exists" % order_id)
+        entry = {
+            'op': 'add', 'order_id': order_id, 'symbol': symbol,
+            'exchange': exchange, 'direction': direction,
+            'quantity': quantity, 'order_type': order_type, 'price': price
+        }
+        self._log(entry)
+        return self._apply(entry)
+
+    def fill(self, order_id, filled, avg_price):
+        """
+        Records the cumulative quantity filled and average fill
+        price of an order, as reported by the broker. Reports
+        that don't increase the filled quantity (such as repeated
+        or out of date status messages) are ignored.
+
+        Parameters:
+        order_id - The ID of the order.
+        filled - The total quantity filled so far.
+        avg_price - The average price of the total quantity filled.
+
+        Returns:
+        The quantity and cost of the new fill, (0, 0.0) if none.
+        """
+        order = self.orders[order_id]
+        if filled <= order.filled or not order.is_open:
+            return 0, 0.0
+
+        status = FILLED if filled >= order.quantity else PARTIALLY_FILLED
+        self._transition(order, status)
+        quantity = filled - order.filled
+        cost = avg_price * filled - order.avg_price * order.filled
+        entry = {
+            'op': 'fill', 'order_id': order_id, 'status': status,
+            'filled': filled, 'avg_price': avg_price
+        }
+        self._log(entry)
+        self._apply(entry)
+        return quantity, cost
+
+    def set_status(self, order_id, status):
+        """
+        Moves an open order to a new state, typically CANCELLED
+        or REJECTED. Orders that are already closed are left
+        unchanged.
+
+        Returns:
+        True if the state changed.
+        """
+        order = self.orders[order_id]
+        if not order.is_open:
+            return False
+        self._transition(order, status)
+        entry = {'op': 'status', 'order_id': order_id, 'status': status}
+        self._log(entry)
+        self._apply(entry)
+        return True
+
+    def get(self, order_id):
+        """
+        Returns the OrderRecord for an order ID, or None.
+        """
+        return self.orders.get(order_id)
+
+    def open_orders(self, symbol=None):
+        """
+        Returns a list of the open orders, optionally only
+        those for a single symbol.
+        """
+        if symbol is not None:
+            return list(self.open_by_symbol.get(symbol, {}).values())
+        return [
+            order for orders in self.open_by_symbol.values()
+            for order in orders.values()
+        ]
+
+    def max_order_id(self):
+        """
+        Returns the largest order ID seen, or None.
+        """
+        return max(self.orders) if self.orders else None
+
+    def compact(self):
+        """
+        Rewrites the write-ahead log so that it only holds the
+        open orders, keeping the time taken by recover small.
+        Closed orders are dropped from memory as well.
+        """
+        open_orders = self.open_orders()
+        self.orders = dict((o.order_id, o) for o in open_orders)
+        if self.wal is None:
+            return
+
+        tmp_path = self.wal_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for order in sorted(open_orders, key=lambda o: o.order_id):
+                entry = order.to_dict()
+                entry['op'] = 'restore'
+                f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.wal.close()
+        os.rename(tmp_path, self.wal_path)
+        self.wal = open(self.wal_path, 'a')
+
+    def close(self):
+        """
+        Closes the write-ahead log.
+        """
+        if self.wal is not None:
+            self.wal.close()
+            self.wal = None
+
+    @classmethod
+    def recover(cls, wal_path, sync=False, compact=True):
+        """
+        Rebuilds an OrderStore by replaying its write-ahead log.
+        A partly written final line, left by a crash in the
+        middle of a write, is discarded.
+
+        Parameters:
+        wal_path - The path of the write-ahead log file.
+        sync - Whether to fsync the log after every write.
+        compact - Whether to compact the log once replayed.
+        """
+        store = cls(sync=sync)
+        if os.path.exists(wal_path):
+            with open(wal_path, 'rb') as f:
+                data = f.read()
+
+            good = 0
+            for line in data.splitlines(True):
+                try:
+                    entry = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    break
+                if entry['op'] == 'restore':
+                    order = store._apply(dict(entry, op='add'))
+                    order.status = entry['status']
+                    order.filled = entry['filled']
+                    order.avg_price = entry['avg_price']
+                else:
+                    store._apply(entry)
+                good += len(line)
+
+            # Drop anything after the last complete entry, so
+            # that new entries start on a line of their own
+            if good < len(data) or not data.endswith(b'\n'):
+                with open(wal_path, 'r+b') as f:
+                    f.truncate(good)
+                    if good and not data[:good].endswith(b'\n'):
+                        f.seek(good)
+                        f.write(b'\n')
+
+        store.wal_path = wal_path
+        store.wal = open(wal_path, 'a')
+        if compact:
+            store.compact()
+        return store
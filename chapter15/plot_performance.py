@@ -4,17 +4,25 @@
 # plot_performance.py
 
 import os.path
+import sys
 
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
 
+from results import read_results
+
 
 if __name__ == "__main__":
-    data = pd.io.parsers.read_csv(
-        "equity.csv", header=0, 
-        parse_dates=True, index_col=0
-    ).sort()
+    # Read the streamed 'equity' table of a results directory
+    # if one is given, otherwise fall back to equity.csv
+    if len(sys.argv) > 1:
+        data = read_results(os.path.join(sys.argv[1], "equity"))
+    else:
+        data = pd.io.parsers.read_csv(
+            "equity.csv", header=0, 
+            parse_dates=True, index_col=0
+        ).sort()
 
     # Plot three charts: Equity curve, 
     # period returns, drawdowns
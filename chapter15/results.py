@@ -0,0 +1,307 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# results.py
+
+from __future__ import print_function
+
+import json
+import os, os.path
+
+import numpy as np
+import pandas as pd
+
+
+class ResultsWriter(object):
+    """
+    ResultsWriter streams a table of numeric records to disk in
+    a simple columnar binary layout: one directory per table,
+    containing a 'schema.json' file and one raw little-endian
+    file per column. The 'datetime' column is stored as int64
+    nanoseconds since the epoch and all others as float64.
+
+    Records are buffered in a fixed-size NumPy block and the
+    block is appended to the column files whenever it fills up,
+    so memory use is independent of the length of the backtest.
+    """
+
+    def __init__(self, path, columns, chunk_size=10000):
+        """
+        Initialises the writer, truncating any existing table.
+
+        Parameters:
+        path - The directory the table is written to.
+        columns - The list of (non-datetime) column names.
+        chunk_size - The number of records buffered before a flush.
+        """
+        self.path = path
+        self.columns = list(columns)
+        self.chunk_size = chunk_size
+
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+        with open(os.path.join(self.path, 'schema.json'), 'w') as f:
+            json.dump({'columns': self.columns}, f)
+
+        self.datetimes = np.empty(self.chunk_size, dtype='<i8')
+        self.values = np.empty((len(self.columns), self.chunk_size), dtype='<f8')
+        self.n = 0
+        self.rows = 0
+
+        self.files = {}
+        for col in ['datetime'] + self.columns:
+            self.files[col] = open(_column_file(self.path, col), 'wb')
+
+    def append(self, record):
+        """
+        Adds a dictionary record to the buffer, flushing the
+        buffer to disk if it is full.
+        """
+        self.datetimes[self.n] = pd.Timestamp(record['datetime']).value
+        for i, col in enumerate(self.columns):
+            self.values[i, self.n] = record[col]
+        self.n += 1
+        if self.n == self.chunk_size:
+            self.flush()
+
+    def append_arrays(self, datetimes, arrays):
+        """
+        Appends whole columns at once, used when deriving a
+        table from another one chunk by chunk.
+
+        Parameters:
+        datetimes - An int64 array of nanosecond timestamps.
+        arrays - A dictionary of float arrays, keyed by column.
+        """
+        self.flush()
+        datetimes.astype('<i8').tofile(self.files['datetime'])
+        for col in self.columns:
+            np.asarray(arrays[col], dtype='<f8').tofile(self.files[col])
+        self.rows += len(datetimes)
+
+    def flush(self):
+        """
+        Appends the buffered block to the column files.
+        """
+        if self.n == 0:
+            return
+        self.datetimes[:self.n].tofile(self.files['datetime'])
+        for i, col in enumerate(self.columns):
+            self.values[i, :self.n].tofile(self.files[col])
+        for f in self.files.values():
+            f.flush()
+        self.rows += self.n
+        self.n = 0
+
+    def close(self):
+        """
+        Flushes any remaining records and closes the files.
+        """
+        self.flush()
+        for f in self.files.values():
+            f.close()
+
+
+def _column_file(path, col):
+    """
+    Returns the file name used for a column of a table.
+    """
+    return os.path.join(path, '%s.bin' % col)
+
+
+def _open_columns(path, columns=None):
+    """
+    Memory maps the column files of a table, returning the
+    column names, the mapped arrays and the number of rows.
+    """
+    with open(os.path.join(path, 'schema.json')) as f:
+        schema = json.load(f)
+    if columns is None:
+        columns = schema['columns']
+
+    arrays = {}
+    for col in ['datetime'] + list(columns):
+        dtype = '<i8' if col == 'datetime' else '<f8'
+        fname = _column_file(path, col)
+        if os.path.getsize(fname) == 0:
+            arrays[col] = np.empty(0, dtype=dtype)
+        else:
+            arrays[col] = np.memmap(fname, dtype=dtype, mode='r')
+
+    # A partially flushed block is ignored
+    rows = min(len(a) for a in arrays.values())
+    return columns, arrays, rows
+
+
+def iter_results(path, columns=None, chunk_size=100000):
+    """
+    Yields a table as a sequence of pandas DataFrames of at
+    most chunk_size rows, indexed on datetime.
+
+    Parameters:
+    path - The directory of the table.
+    columns - Optional list of columns to read.
+    chunk_size - Maximum number of rows per DataFrame.
+    """
+    columns, arrays, rows = _open_columns(path, columns)
+    for start in range(0, rows, chunk_size):
+        stop = min(start + chunk_size, rows)
+        yield pd.DataFrame(
+            dict((col, np.array(arrays[col][start:stop])) for col in columns),
+            index=pd.to_datetime(np.array(arrays['datetime'][start:stop])),
+            columns=columns
+        )
+
+
+def read_results(path, columns=None, start=0, stop=None):
+    """
+    Reads a table, or a slice of its rows, into a pandas
+    DataFrame indexed on datetime. Negative start values
+    count from the end of the table.
+    """
+    columns, arrays, rows = _open_columns(path, columns)
+    start, stop, _ = slice(start, stop).indices(rows)
+    return pd.DataFrame(
+        dict((col, np.array(arrays[col][start:stop])) for col in columns),
+        index=pd.to_datetime(np.array(arrays['datetime'][start:stop])),
+        columns=columns
+    )
+
+
+class StreamingResults(object):
+    """
+    StreamingResults writes the positions and holdings records
+    produced by a Portfolio to the 'positions' and 'holdings'
+    tables of a results directory while the backtest runs. At
+    the end of the backtest it derives the 'equity' table
+    (total, returns, equity_curve, drawdown) and the summary
+    statistics in a single chunked pass over the holdings.
+    """
+
+    def __init__(self, results_dir, symbol_list, chunk_size=10000):
+        """
+        Initialises the positions and holdings writers.
+
+        Parameters:
+        results_dir - The directory for the result tables.
+        symbol_list - The list of symbol strings.
+        chunk_size - The number of records buffered before a flush.
+        """
+        self.results_dir = results_dir
+        self.chunk_size = chunk_size
+        self.positions = ResultsWriter(
+            os.path.join(results_dir, 'positions'), symbol_list, chunk_size
+        )
+        self.holdings = ResultsWriter(
+            os.path.join(results_dir, 'holdings'),
+            list(symbol_list) + ['cash', 'commission', 'total'], chunk_size
+        )
+
+    def append(self, positions, holdings):
+        """
+        Appends one bar's positions and holdings records.
+        """
+        self.positions.append(positions)
+        self.holdings.append(holdings)
+
+    def close(self):
+        """
+        Flushes and closes the positions and holdings tables.
+        """
+        self.positions.close()
+        self.holdings.close()
+
+    def create_equity_curve(self, periods=252):
+        """
+        Creates the 'equity' table from the holdings, one chunk
+        at a time, and calculates the summary statistics along
+        the way, carrying the last total, the high water mark
+        and the drawdown state across chunk boundaries.
+
+        The figures match those of create_sharpe_ratio and
+        create_drawdowns applied to the full equity curve.
+
+        Parameters:
+        periods - Daily (252), Hourly (252*6.5), Minutely(252*6.5*60) etc.
+
+        Returns:
+        A dictionary of summary statistics.
+        """
+        writer = ResultsWriter(
+            os.path.join(self.results_dir, 'equity'),
+            ['total', 'returns', 'equity_curve', 'drawdown'], self.chunk_size
+        )
+        columns, arrays, rows = _open_columns(
+            os.path.join(self.results_dir, 'holdings'), ['total']
+        )
+
+        last_total = np.nan
+        equity = 1.0
+        hwm = 0.0
+        last_zero = 0
+        count, mean, m2 = 0, 0.0, 0.0
+        max_dd, max_duration = np.nan, np.nan
+
+        for start in range(0, rows, self.chunk_size):
+            stop = min(start + self.chunk_size, rows)
+            total = np.array(arrays['total'][start:stop])
+
+            # Period returns, using the last total of the prior chunk
+            prev = np.concatenate(([last_total], total[:-1]))
+            returns = total / prev - 1.0
+            last_total = total[-1]
+
+            # Cumulative returns curve, skipping the leading NaN
+            # return in the same way as pandas cumprod
+            growth = np.where(np.isnan(returns), 1.0, 1.0 + returns)
+            equity_curve = equity * np.cumprod(growth)
+            equity = equity_curve[-1]
+            equity_curve[np.isnan(returns)] = np.nan
+
+            # High water mark and drawdown from the first bar on
+            idx = np.arange(start, stop)
+            pnl = np.where(idx == 0, -np.inf, equity_curve)
+            hwm_curve = np.maximum.accumulate(np.concatenate(([hwm], pnl)))[1:]
+            hwm = hwm_curve[-1]
+            drawdown = np.where(idx == 0, np.nan, hwm_curve - equity_curve)
+
+            # Duration is the number of bars since drawdown was zero
+            zeros = np.where(drawdown == 0, idx, last_zero)
+            zeros = np.maximum.accumulate(zeros)
+            last_zero = zeros[-1]
+            duration = (idx - zeros)[idx > 0]
+
+            # Welford update of the mean and (population) variance
+            valid = returns[~np.isnan(returns)]
+            if len(valid):
+                n = len(valid)
+                chunk_mean = valid.mean()
+                chunk_m2 = ((valid - chunk_mean) ** 2).sum()
+                delta = chunk_mean - mean
+                total_n = count + n
+                mean += delta * n / total_n
+                m2 += chunk_m2 + delta ** 2 * count * n / total_n
+                count = total_n
+
+            if np.any(~np.isnan(drawdown)):
+                max_dd = np.nanmax(np.concatenate(([max_dd], drawdown)))
+            if len(duration):
+                max_duration = np.nanmax(np.concatenate(([max_duration], duration)))
+
+            writer.append_arrays(
+                np.array(arrays['datetime'][start:stop]), {
+                    'total': total, 'returns': returns,
+                    'equity_curve': equity_curve, 'drawdown': drawdown
+                }
+            )
+        writer.close()
+
+        sharpe_ratio = np.nan
+        if count > 0 and m2 > 0:
+            sharpe_ratio = np.sqrt(periods) * mean / np.sqrt(m2 / count)
+        return {
+            'total_return': equity,
+            'sharpe_ratio': sharpe_ratio,
+            'max_drawdown': max_dd,
+            'drawdown_duration': max_duration
+        }
@@ -0,0 +1,239 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# risk.py
+
+from __future__ import print_function
+
+from bisect import bisect_left, insort
+from collections import deque
+from math import sqrt
+
+import numpy as np
+from scipy.stats import norm
+
+
+class OnlineRiskMonitor(object):
+    """
+    OnlineRiskMonitor keeps a running estimate of the risk of a
+    portfolio, updated once per bar by the Portfolio object.
+
+    It tracks a Welford mean/variance of the portfolio returns,
+    an exponentially weighted (RiskMetrics style) covariance
+    matrix of the returns of the held symbols and a rolling
+    window of portfolio returns kept in sorted order. From these it
+    provides parametric and historical Value-at-Risk and
+    Conditional Value-at-Risk (expected shortfall) at a set
+    of confidence levels, without ever recomputing over the
+    full history.
+    """
+
+    def __init__(
+        self, symbol_list, confidence_levels=(0.95, 0.99),
+        window=250, decay=0.94, max_var=None
+    ):
+        """
+        Initialises the risk monitor.
+
+        Parameters:
+        symbol_list - The list of symbol strings.
+        confidence_levels - The VaR confidence levels, e.g. 0.99.
+        window - Number of bars used for the historical VaR.
+        decay - The EWMA decay factor (lambda) for the covariance.
+        max_var - Optional limit on the one-bar VaR (at the highest
+            confidence level) as a fraction of portfolio equity.
+        """
+        self.symbol_list = symbol_list
+        self.confidence_levels = tuple(sorted(confidence_levels))
+        self.window = window
+        self.decay = decay
+        self.max_var = max_var
+
+        # Normal quantiles and tail densities are fixed
+        # so they are calculated once here
+        self.z = dict(
+            (c, norm.ppf(1.0 - c)) for c in self.confidence_levels
+        )
+        self.tail_pdf = dict(
+            (c, norm.pdf(self.z[c]) / (1.0 - c))
+            for c in self.confidence_levels
+        )
+
+        # Welford state for the portfolio returns
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+        # EWMA state for the symbol returns: the mean and variance
+        # of every symbol, and the covariance of the held symbols
+        n = len(self.symbol_list)
+        self.ew_mean = np.zeros(n)
+        self.ew_var = np.zeros(n)
+        self.held = np.zeros(0, dtype=int)
+        self.held_cov = np.zeros((0, 0))
+        self.last_prices = None
+
+        # Rolling window of returns, both in arrival
+        # order and in sorted order
+        self.window_returns = deque()
+        self.sorted_returns = []
+
+        self.last_total = None
+        self.equity = 0.0
+        self.exposures = np.zeros(n)
+        self.metrics = {}
+
+    def _update_welford(self, ret):
+        """
+        Updates the running mean and sum of squared deviations
+        of the portfolio returns.
+        """
+        self.count += 1
+        delta = ret - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (ret - self.mean)
+
+    def _update_ewma(self, prices):
+        """
+        Updates the exponentially weighted mean and covariance
+        of the symbol returns from the latest price vector.
+        Symbols without a valid price on both bars are treated
+        as having a zero return.
+
+        The means and variances cost O(symbols) and the
+        covariances O(open positions^2), as only the held block
+        of the covariance matrix is kept.
+        """
+        if self.last_prices is not None:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rets = prices / self.last_prices - 1.0
+            rets[~np.isfinite(rets)] = 0.0
+
+            # Rank-one update of the covariance, done in place
+            delta = rets - self.ew_mean
+            self.ew_mean += (1.0 - self.decay) * delta
+            self.ew_var += (1.0 - self.decay) * delta * delta
+            self.ew_var *= self.decay
+            held_delta = delta[self.held]
+            self.held_cov += (1.0 - self.decay) * np.outer(held_delta, held_delta)
+            self.held_cov *= self.decay
+        self.last_prices = prices
+
+    def _update_held(self, exposures):
+        """
+        Resizes the covariance matrix to the symbols now held.
+        Covariances between symbols that stay held are kept, and
+        a newly opened position starts from its EWMA variance with
+        zero covariance to the others, which then builds up from
+        the following bars.
+        """
+        held = np.flatnonzero(exposures)
+        if np.array_equal(held, self.held):
+            return
+        cov = np.diag(self.ew_var[held])
+        _, new_idx, old_idx = np.intersect1d(
+            held, self.held, assume_unique=True, return_indices=True
+        )
+        cov[np.ix_(new_idx, new_idx)] = self.held_cov[np.ix_(old_idx, old_idx)]
+        self.held = held
+        self.held_cov = cov
+
+    def _update_window(self, ret):
+        """
+        Adds the latest return to the rolling window, dropping
+        the oldest return once the window is full.
+        """
+        self.window_returns.append(ret)
+        insort(self.sorted_returns, ret)
+        if len(self.window_returns) > self.window:
+            oldest = self.window_returns.popleft()
+            del self.sorted_returns[
+                bisect_left(self.sorted_returns, oldest)
+            ]
+
+    def update(self, total, prices, exposures):
+        """
+        Updates all of the risk estimators with the latest bar
+        and recalculates the risk metrics.
+
+        Parameters:
+        total - The total portfolio equity.
+        prices - Array of latest prices, ordered as symbol_list.
+        exposures - Array of market values, ordered as symbol_list.
+        """
+        self._update_ewma(np.asarray(prices, dtype=np.float64))
+        if self.last_total:
+            ret = total / self.last_total - 1.0
+            self._update_welford(ret)
+            self._update_window(ret)
+        self.last_total = total
+        self.equity = total
+        self.exposures = np.asarray(exposures, dtype=np.float64)
+        self._update_held(self.exposures)
+        self.metrics = self.calculate_metrics()
+
+    def calculate_metrics(self):
+        """
+        Calculates parametric, position-based and historical
+        VaR/CVaR in USD for each of the confidence levels.
+
+        The position-based figures use the covariance matrix of
+        the symbols currently held.
+        """
+        metrics = {}
+        if self.count < 2:
+            return metrics
+
+        std = sqrt(self.m2 / (self.count - 1))
+
+        w = self.exposures[self.held]
+        pos_mu = np.dot(w, self.ew_mean[self.held])
+        pos_sigma = sqrt(max(np.dot(w, np.dot(self.held_cov, w)), 0.0))
+
+        n_hist = len(self.sorted_returns)
+        for c in self.confidence_levels:
+            z = self.z[c]
+            tail_pdf = self.tail_pdf[c]
+
+            # Normal VaR from the Welford moments, as in var_cov_var
+            metrics[("VaR", c)] = -self.equity * (self.mean + z * std)
+            metrics[("CVaR", c)] = self.equity * (std * tail_pdf - self.mean)
+
+            # Normal VaR from the EWMA covariance of the positions
+            metrics[("PositionVaR", c)] = -(pos_mu + z * pos_sigma)
+            metrics[("PositionCVaR", c)] = pos_sigma * tail_pdf - pos_mu
+
+            # Historical VaR from the sorted rolling window
+            k = int((1.0 - c) * n_hist)
+            tail = self.sorted_returns[:k + 1]
+            metrics[("HistVaR", c)] = -self.equity * tail[-1]
+            metrics[("HistCVaR", c)] = -self.equity * sum(tail) / len(tail)
+        return metrics
+
+    def limit_breached(self):
+        """
+        Returns True if the VaR at the highest confidence level
+        exceeds the max_var fraction of the portfolio equity.
+        """
+        if self.max_var is None or not self.metrics:
+            return False
+        c = self.confidence_levels[-1]
+        var = max(
+            self.metrics[("VaR", c)], self.metrics[("PositionVaR", c)]
+        )
+        return var > self.max_var * self.equity
+
+    def output_summary_stats(self):
+        """
+        Creates a list of the latest risk statistics, in the
+        same format as the Portfolio summary statistics.
+        """
+        stats = []
+        for name in ("VaR", "CVaR", "HistVaR", "HistCVaR"):
+            for c in self.confidence_levels:
+                if (name, c) in self.metrics:
+                    stats.append((
+                        "%s (%0.1f%%)" % (name, c * 100.0),
+                        "$%0.2f" % self.metrics[(name, c)]
+                    ))
+        return stats
@@ -0,0 +1,271 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# sim_execution.py
+
+from __future__ import print_function
+
+from collections import deque
+import datetime
+import heapq
+import itertools
+
+from event import FillEvent, OrderEvent
+from execution import ExecutionHandler
+
+
+class SimulatedOrder(object):
+    """
+    A working order held by the EventTimeExecutionHandler,
+    along with its unfilled quantity.
+    """
+
+    __slots__ = (
+        'order_id', 'symbol', 'order_type', 'direction',
+        'price', 'quantity', 'remaining', 'active_at', 'cancelled'
+    )
+
+    def __init__(self, order_id, event, active_at):
+        self.order_id = order_id
+        self.symbol = event.symbol
+        self.order_type = event.order_type
+        self.direction = event.direction
+        self.price = getattr(event, 'price', None)
+        self.quantity = event.quantity
+        self.remaining = event.quantity
+        self.active_at = active_at
+        self.cancelled = False
+
+
+class SymbolOrderBook(object):
+    """
+    The working orders for a single symbol. Orders still in
+    flight are kept in arrival order, market orders in a FIFO
+    queue and resting limit orders in two heaps giving price
+    then time priority: a max-heap of bids and a min-heap of
+    offers.
+    """
+
+    def __init__(self):
+        self.in_flight = deque()
+        self.market = deque()
+        self.bids = []
+        self.asks = []
+
+    def __len__(self):
+        return (
+            len(self.in_flight) + len(self.market) +
+            len(self.bids) + len(self.asks)
+        )
+
+    def add(self, order, seq):
+        """
+        Places an order that has reached the exchange
+        onto the correct queue.
+        """
+        if order.order_type == 'LMT':
+            if order.direction == 'BUY':
+                heapq.heappush(self.bids, (-order.price, seq, order))
+            else:
+                heapq.heappush(self.asks, (order.price, seq, order))
+        else:
+            self.market.append(order)
+
+
+class EventTimeExecutionHandler(ExecutionHandler):
+    """
+    A simulated exchange that works in event (bar) time rather
+    than filling every order instantly.
+
+    Orders reach the exchange after a configurable latency and
+    are then matched against each subsequent bar of the
+    DataHandler: market orders fill at the open, buy limits
+    fill when the bar trades down through the limit price and
+    sell limits when it trades up through it. The quantity
+    filled per bar can be capped at a fraction of the bar
+    volume, in which case orders are partially filled and the
+    remainder keeps its place in the queue.
+
+    Only symbols with working orders are visited on each bar,
+    and activating or filling an order costs O(log n) in the
+    number of resting orders for that symbol.
+    """
+
+    # The Backtest passes the DataHandler to handlers that
+    # need to see the market data
+    requires_bars = True
+
+    def __init__(
+        self, events, bars, latency=1, max_volume_pct=None,
+        price_fields=("open", "high", "low", "volume"), exchange='ARCA'
+    ):
+        """
+        Initialises the simulated exchange.
+
+        Parameters:
+        events - The Queue of Event objects.
+        bars - The DataHandler object with current market data.
+        latency - Either a number of bars or a datetime.timedelta
+            between an order being sent and reaching the exchange.
+        max_volume_pct - Optional maximum fraction of each bar's
+            volume that can be filled, per symbol.
+        price_fields - The bar fields used for the open, high,
+            low and volume.
+        exchange - The exchange name placed on the FillEvents.
+        """
+        self.events = events
+        self.bars = bars
+        self.latency = latency
+        self.max_volume_pct = max_volume_pct
+        self.price_fields = price_fields
+        self.exchange = exchange
+
+        self.books = {}
+        self.orders = {}
+        self.active_symbols = set()
+        self.order_ids = itertools.count(1)
+        self.seq = itertools.count()
+        self.bar_count = 0
+        self.bar_datetime = None
+
+    def _event_time(self):
+        """
+        Returns the current time in the units of the latency.
+        """
+        if isinstance(self.latency, datetime.timedelta):
+            return self.bar_datetime
+        return self.bar_count
+
+    def execute_order(self, event):
+        """
+        Sends an order to the simulated exchange, where it
+        will arrive once the latency has elapsed.
+
+        Parameters:
+        event - Contains an Event object with order information.
+
+        Returns:
+        The order ID, which can be used with cancel_order.
+        """
+        if event.type == 'ORDER':
+            if event.order_type == 'LMT' and getattr(event, 'price', None) is None:
+                raise ValueError("Limit orders must have a price")
+            now = self._event_time()
+            if now is None:
+                now = datetime.datetime.min
+            order = SimulatedOrder(
+                next(self.order_ids), event, now + self.latency
+            )
+            self.orders[order.order_id] = order
+            book = self.books.setdefault(event.symbol, SymbolOrderBook())
+            book.in_flight.append(order)
+            self.active_symbols.add(event.symbol)
+            return order.order_id
+
+    def cancel_order(self, order_id):
+        """
+        Cancels the unfilled remainder of a working order. The
+        order is removed lazily when it reaches the top of its
+        queue, so cancelling is O(1).
+        """
+        order = self.orders.pop(order_id, None)
+        if order is not None:
+            order.cancelled = True
+
+    def _fill(self, order, quantity, price, timeindex):
+        """
+        Records a (possibly partial) fill of an order and
+        places the FillEvent onto the events queue.
+        """
+        order.remaining -= quantity
+        if order.remaining == 0:
+            self.orders.pop(order.order_id, None)
+        self.events.put(FillEvent(
+            timeindex, order.symbol, self.exchange, quantity,
+            order.direction, quantity * price
+        ))
+
+    def _match_limits(self, heap, crosses, fill_price, liquidity, timeindex):
+        """
+        Fills resting limit orders from the top of a heap while
+        the bar crosses their price and liquidity remains.
+        """
+        while heap and liquidity > 0:
+            key, seq, order = heap[0]
+            if order.cancelled:
+                heapq.heappop(heap)
+                continue
+            if not crosses(order.price):
+                break
+            quantity = min(order.remaining, liquidity)
+            self._fill(order, quantity, fill_price(order.price), timeindex)
+            liquidity -= quantity
+            if order.remaining == 0:
+                heapq.heappop(heap)
+        return liquidity
+
+    def _match_symbol(self, symbol, book, now):
+        """
+        Activates the orders that have reached the exchange and
+        matches the working orders against the latest bar.
+        """
+        while book.in_flight and book.in_flight[0].active_at <= now:
+            order = book.in_flight.popleft()
+            if not order.cancelled:
+                book.add(order, next(self.seq))
+
+        open_field, high_field, low_field, volume_field = self.price_fields
+        bar_open = self.bars.get_latest_bar_value(symbol, open_field)
+        bar_high = self.bars.get_latest_bar_value(symbol, high_field)
+        bar_low = self.bars.get_latest_bar_value(symbol, low_field)
+        timeindex = self.bars.get_latest_bar_datetime(symbol)
+
+        if self.max_volume_pct is None:
+            liquidity = float("inf")
+        else:
+            liquidity = int(
+                self.bars.get_latest_bar_value(symbol, volume_field) *
+                self.max_volume_pct
+            )
+
+        # Market orders are filled first, at the open
+        while book.market and liquidity > 0:
+            order = book.market[0]
+            if not order.cancelled:
+                quantity = min(order.remaining, liquidity)
+                self._fill(order, quantity, bar_open, timeindex)
+                liquidity -= quantity
+                if order.remaining > 0:
+                    break
+            book.market.popleft()
+
+        # Resting limits fill at their limit, or at the
+        # open if the bar gaps through the limit price
+        liquidity = self._match_limits(
+            book.bids, lambda p: bar_low <= p,
+            lambda p: min(p, bar_open), liquidity, timeindex
+        )
+        self._match_limits(
+            book.asks, lambda p: bar_high >= p,
+            lambda p: max(p, bar_open), liquidity, timeindex
+        )
+
+    def update_market(self, event):
+        """
+        Advances event time by one bar and matches the working
+        orders of every symbol that has any.
+
+        Parameters:
+        event - The MarketEvent for the latest bar.
+        """
+        if event.type == 'MARKET':
+            self.bar_count += 1
+            self.bar_datetime = self.bars.get_latest_bar_datetime(
+                self.bars.symbol_list[0]
+            )
+            now = self._event_time()
+            for symbol in list(self.active_symbols):
+                book = self.books[symbol]
+                self._match_symbol(symbol, book, now)
+                if len(book) == 0:
+                    self.active_symbols.discard(symbol)
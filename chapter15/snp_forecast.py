@@ -7,6 +7,7 @@ from __future__ import print_function
 
 import datetime
 
+import numpy as np
 import pandas as pd
 from sklearn.qda import QDA
 
@@ -15,8 +16,9 @@ from event import SignalEvent
 from backtest import Backtest
 from data import HistoricCSVDataHandler
 from execution import SimulatedExecutionHandler
+from feature_store import lagged_return_arrays
 from portfolio import Portfolio
-from create_lagged_series import create_lagged_series
+from walk_forward import WalkForwardTrainer
 
 
 class SPYDailyForecastStrategy(Strategy):
@@ -25,45 +27,128 @@ class SPYDailyForecastStrategy(Strategy):
     Analyser to predict the returns for a subsequent time
     period and then generated long/exit signals based on the
     prediction.
+
+    The model is retrained walk-forward on the bars seen so
+    far, on a rolling or expanding window, with fitted models
+    cached on disk and trained in a background process.
     """
-    def __init__(self, bars, events):
+    def __init__(
+        self, bars, events, window=504, retrain_every=21,
+        expanding=False, min_train=252, activation_lag=1,
+        cache_dir='model_cache', processes=1
+    ):
+        """
+        Initialises the forecast strategy.
+
+        Parameters:
+        bars - The DataHandler object that provides bar information.
+        events - The Event Queue object.
+        window - Number of bars in the rolling training window.
+        retrain_every - Number of bars between retraining.
+        expanding - Train on all bars so far instead of a window.
+        min_train - Number of bars before the first model is fitted.
+        activation_lag - Bars between a window ending and its model
+            being used to trade.
+        cache_dir - Directory of the fitted model cache.
+        processes - Number of background training processes.
+        """
         self.bars = bars
         self.symbol_list = self.bars.symbol_list
         self.events = events
         self.datetime_now = datetime.datetime.utcnow()
 
-        self.model_start_date = datetime.datetime(2001,1,10)
-        self.model_end_date = datetime.datetime(2005,12,31)
-        self.model_start_test_date = datetime.datetime(2005,1,1)
-
         self.long_market = False
         self.short_market = False
         self.bar_index = 0
 
-        self.model = self.create_symbol_forecast_model()
+        self.features = ["Lag1", "Lag2"]
+        self.trainer = WalkForwardTrainer(
+            QDA, window=window, retrain_every=retrain_every,
+            expanding=expanding, min_train=min_train,
+            activation_lag=activation_lag, cache_dir=cache_dir,
+            processes=processes
+        )
+        self.model = None
+
+        # Batch predictions for the current model
+        self.predictions = np.zeros(0)
+        self.predictions_start = 0
+        self.predictions_model = None
 
     def create_symbol_forecast_model(self):
-        # Create a lagged series of the S&P500 US stock market index
-        snpret = create_lagged_series(
-            self.symbol_list[0], self.model_start_date, 
-            self.model_end_date, lags=5
+        """
+        Builds the training set from the bars in the current
+        window and hands it to the walk-forward trainer.
+        """
+        sym = self.symbol_list[0]
+        bars = self.bars.get_latest_bars(
+            sym, N=self.trainer.lookback(self.bar_index)
         )
+        rets = np.array(
+            [b[1].returns for b in bars], dtype=np.float64
+        ) * 100.0
 
-        # Use the prior two days of returns as predictor 
+        # Use the prior two days of returns as predictor
         # values, with direction as the response
-        X = snpret[["Lag1","Lag2"]]
-        y = snpret["Direction"]
-
-        # Create training and test sets
-        start_test = self.model_start_test_date
-        X_train = X[X.index < start_test]
-        X_test = X[X.index >= start_test]
-        y_train = y[y.index < start_test]
-        y_test = y[y.index >= start_test]
-       
-        model = QDA()
-        model.fit(X_train, y_train)
-        return model
+        today, lag_matrix, y = lagged_return_arrays(rets, lags=2)
+        X = lag_matrix
+        valid = ~(np.isnan(X).any(axis=1) | np.isnan(today))
+
+        self.trainer.submit(
+            self.bar_index, X[valid], y[valid], self.features,
+            (sym, bars[0][0], bars[-1][0])
+        )
+
+    def predict_segment(self):
+        """
+        Predicts every bar from the current one up to the next
+        model change in a single call to the model, using the
+        full return series of the DataHandler. The features of
+        each bar only use the returns up to and including it.
+        """
+        rets = self.bars.get_all_bars_values(self.symbol_list[0], "returns")
+        end = min(
+            self.trainer.next_activation(self.bar_index), len(rets) + 1
+        )
+        idx = np.arange(self.bar_index, max(end, self.bar_index + 1))
+        X = np.column_stack((rets[idx - 2], rets[idx - 1])) * 100.0
+
+        # Bars with missing returns are given no prediction
+        valid = ~np.isnan(X).any(axis=1)
+        self.predictions = np.zeros(len(idx))
+        if valid.any():
+            self.predictions[valid] = self.model.predict(X[valid])
+        self.predictions_start = self.bar_index
+        self.predictions_model = self.model
+
+    def predict(self):
+        """
+        Returns the prediction for the current bar. Where the
+        DataHandler can provide the whole return series the
+        predictions for a segment are calculated together and
+        looked up by bar index, otherwise the model is called
+        on the latest bar alone.
+        """
+        if hasattr(self.bars, "get_all_bars_values"):
+            i = self.bar_index - self.predictions_start
+            if (
+                self.predictions_model is not self.model or
+                i >= len(self.predictions)
+            ):
+                self.predict_segment()
+                i = 0
+            return self.predictions[i]
+
+        lags = self.bars.get_latest_bars_values(
+            self.symbol_list[0], "returns", N=3
+        )
+        pred_series = pd.Series(
+            {
+                'Lag1': lags[1]*100.0, 
+                'Lag2': lags[2]*100.0
+            }
+        )
+        return self.model.predict(pred_series)
 
     def calculate_signals(self, event):
         """
@@ -74,17 +159,12 @@ class SPYDailyForecastStrategy(Strategy):
 
         if event.type == 'MARKET':
             self.bar_index += 1
-            if self.bar_index > 5:
-                lags = self.bars.get_latest_bars_values(
-                    self.symbol_list[0], "returns", N=3
-                )
-                pred_series = pd.Series(
-                    {
-                        'Lag1': lags[1]*100.0, 
-                        'Lag2': lags[2]*100.0
-                    }
-                )
-                pred = self.model.predict(pred_series)
+            if self.trainer.due(self.bar_index):
+                self.create_symbol_forecast_model()
+            self.model = self.trainer.get_model(self.bar_index)
+
+            if self.bar_index > 5 and self.model is not None:
+                pred = self.predict()
                 if pred > 0 and not self.long_market:
                     self.long_market = True
                     signal = SignalEvent(1, sym, dt, 'LONG', 1.0)
@@ -108,4 +188,8 @@ if __name__ == "__main__":
         start_date, HistoricCSVDataHandler, SimulatedExecutionHandler, 
         Portfolio, SPYDailyForecastStrategy
     )
-    backtest.simulate_trading()
+    try:
+        backtest.simulate_trading()
+    finally:
+        # Shut down the walk-forward training pool
+        backtest.strategy.trainer.close()
@@ -0,0 +1,344 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# tws_stub.py
+
+from __future__ import print_function
+
+import datetime
+import socket
+import threading
+import time
+
+try:
+    import SocketServer as socketserver
+except ImportError:
+    import socketserver
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+
+# Outgoing (client) message IDs of the TWS socket protocol
+PLACE_ORDER = 3
+CANCEL_ORDER = 4
+REQ_IDS = 8
+
+# Incoming (server) message IDs
+ORDER_STATUS = 3
+ERR_MSG = 4
+OPEN_ORDER = 5
+NEXT_VALID_ID = 9
+
+# The server version reported to clients. This is the lowest
+# version IbPy accepts, so that placeOrder sends the fewest
+# fields and the layout below stays fixed.
+SERVER_VERSION = 38
+
+# Number of fields of a version 38 placeOrder message either
+# side of the (BAG only) combo legs, after the message ID,
+# message version and orderId
+ORDER_FIELDS_HEAD = 29
+ORDER_FIELDS_TAIL = 37
+COMBO_LEG_FIELDS = 7
+
+
+class TWSStubHandler(socketserver.StreamRequestHandler):
+    """
+    Handles a single client connection to the StubTWS server.
+    """
+
+    def read_field(self):
+        """
+        Reads a single null-terminated field from the client,
+        raising EOFError if the connection has been closed.
+        """
+        buf = []
+        while True:
+            c = self.rfile.read(1)
+            if not c:
+                raise EOFError
+            if c == b"\0":
+                return b"".join(buf).decode("ascii")
+            buf.append(c)
+
+    def read_fields(self, n):
+        """
+        Reads the next n fields from the client.
+        """
+        return [self.read_field() for i in range(n)]
+
+    def send(self, *fields):
+        """
+        Sends a message made up of the fields to the client.
+        """
+        data = "".join("%s\0" % f for f in fields)
+        with self.write_lock:
+            if self.closed:
+                raise socket.error("Connection closed")
+            self.wfile.write(data.encode("ascii"))
+            self.wfile.flush()
+
+    def setup(self):
+        socketserver.StreamRequestHandler.setup(self)
+        self.write_lock = threading.Lock()
+        self.closed = False
+
+    def finish(self):
+        with self.write_lock:
+            self.closed = True
+        socketserver.StreamRequestHandler.finish(self)
+
+    def handle(self):
+        """
+        Carries out the connection handshake and then services
+        the client requests until the connection is closed.
+        """
+        tws = self.server.tws
+        try:
+            # Handshake: client version, then server version
+            # and time, then the clientId
+            self.read_field()
+            self.send(
+                SERVER_VERSION,
+                datetime.datetime.utcnow().strftime("%Y%m%d %H:%M:%S UTC")
+            )
+            self.client_id = int(self.read_field())
+            self.send(NEXT_VALID_ID, 1, tws.next_order_id())
+
+            while True:
+                msg_id = int(self.read_field())
+                if msg_id == REQ_IDS:
+                    self.read_fields(2)
+                    self.send(NEXT_VALID_ID, 1, tws.next_order_id())
+                elif msg_id == PLACE_ORDER:
+                    self.place_order()
+                elif msg_id == CANCEL_ORDER:
+                    version, order_id = self.read_fields(2)
+                    self.cancel_order(int(order_id))
+                else:
+                    self.send(
+                        ERR_MSG, 2, -1, 503,
+                        "Stub TWS does not support message %s" % msg_id
+                    )
+                    return
+        except (EOFError, socket.error):
+            pass
+
+    def place_order(self):
+        """
+        Parses a placeOrder message, acknowledges the order
+        and hands it to the server to be filled.
+        """
+        version, order_id = self.read_fields(2)
+        head = self.read_fields(ORDER_FIELDS_HEAD)
+        sec_type = head[1]
+        if sec_type == "BAG":
+            legs = int(self.read_field())
+            self.read_fields(legs * COMBO_LEG_FIELDS)
+        self.read_fields(ORDER_FIELDS_TAIL)
+
+        order = {
+            "order_id": int(order_id),
+            "symbol": head[0],
+            "sec_type": sec_type,
+            "exchange": head[6],
+            "currency": head[8],
+            "action": head[10],
+            "quantity": int(head[11]),
+            "order_type": head[12],
+            "lmt_price": float(head[13] or 0.0),
+            "filled": 0,
+            "cost": 0.0,
+            "cancelled": False,
+            "handler": self
+        }
+        if order["quantity"] <= 0:
+            self.send(
+                ERR_MSG, 2, order["order_id"], 201,
+                "Order rejected - invalid quantity"
+            )
+            return
+
+        self.send(
+            OPEN_ORDER, 2, order["order_id"], order["symbol"],
+            order["sec_type"], "", 0.0, "", order["exchange"],
+            order["currency"], order["symbol"], order["action"],
+            order["quantity"], order["order_type"], order["lmt_price"],
+            0.0, "DAY", "", "", "O", 0, ""
+        )
+        self.send_status(order, "Submitted", 0.0)
+        self.server.tws.submit(order)
+
+    def cancel_order(self, order_id):
+        """
+        Cancels the unfilled remainder of an order.
+        """
+        order = self.server.tws.orders.get(order_id)
+        if order is None or order["filled"] == order["quantity"]:
+            self.send(
+                ERR_MSG, 2, order_id, 135, "Can't find order with id"
+            )
+            return
+        order["cancelled"] = True
+        self.send_status(order, "Cancelled", 0.0)
+        self.send(ERR_MSG, 2, order_id, 202, "Order Canceled")
+
+    def send_status(self, order, status, last_price):
+        """
+        Sends a (version 5) orderStatus message with the
+        cumulative quantity filled and average fill price.
+        """
+        filled = order["filled"]
+        avg_price = order["cost"] / filled if filled else 0.0
+        self.send(
+            ORDER_STATUS, 5, order["order_id"], status, filled,
+            order["quantity"] - filled, avg_price, order["order_id"],
+            0, last_price, self.client_id
+        )
+
+
+class StubTWS(object):
+    """
+    StubTWS is a local stand-in for the Trader Workstation,
+    speaking enough of the legacy TWS socket protocol for the
+    IBExecutionHandler to be tested end to end without an
+    Interactive Brokers account.
+
+    It hands out order IDs through nextValidId, acknowledges
+    placed orders with openOrder and orderStatus messages and
+    then fills them on a background thread, in a configurable
+    number of partial fills at slightly different prices, so
+    that the cumulative fill reconciliation is exercised.
+    Orders can be cancelled until they are completely filled.
+    """
+
+    def __init__(
+        self, host="127.0.0.1", port=0, prices=None, default_price=100.0,
+        partial_fills=2, tick=0.01, fill_delay=0.0, first_order_id=1
+    ):
+        """
+        Initialises the stand-in TWS.
+
+        Parameters:
+        host - The interface to listen on.
+        port - The port to listen on, 0 picks a free port.
+        prices - Optional dictionary of fill prices, keyed by symbol.
+        default_price - The fill price of any other symbol.
+        partial_fills - The number of fills each order is split into.
+        tick - The price increment between successive partial fills.
+        fill_delay - Seconds to wait between partial fills.
+        first_order_id - The first order ID handed out.
+        """
+        self.prices = prices or {}
+        self.default_price = default_price
+        self.partial_fills = partial_fills
+        self.tick = tick
+        self.fill_delay = fill_delay
+
+        self.orders = {}
+        self.order_id = first_order_id
+        self.lock = threading.Lock()
+        self.pending = queue.Queue()
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer(
+            (host, port), TWSStubHandler
+        )
+        self.server.daemon_threads = True
+        self.server.tws = self
+        self.host, self.port = self.server.server_address
+
+    def next_order_id(self):
+        """
+        Returns the next valid order ID, which is one greater
+        than any order ID seen so far.
+        """
+        with self.lock:
+            return self.order_id
+
+    def submit(self, order):
+        """
+        Accepts an order and queues it to be filled.
+        """
+        with self.lock:
+            self.orders[order["order_id"]] = order
+            self.order_id = max(self.order_id, order["order_id"] + 1)
+        self.pending.put(order)
+
+    def _fill_orders(self):
+        """
+        Fills the queued orders in the order they arrived.
+        """
+        while True:
+            order = self.pending.get()
+            if order is None:
+                return
+            price = self.prices.get(order["symbol"], self.default_price)
+            quantity = order["quantity"]
+            parts = max(1, min(self.partial_fills, quantity))
+            for i in range(parts):
+                if order["cancelled"]:
+                    break
+                if self.fill_delay:
+                    time.sleep(self.fill_delay)
+                size = quantity // parts + (1 if i < quantity % parts else 0)
+                fill_price = price + i * self.tick
+                order["filled"] += size
+                order["cost"] += size * fill_price
+                status = "Filled" if order["filled"] == quantity else "Submitted"
+                try:
+                    order["handler"].send_status(order, status, fill_price)
+                except socket.error:
+                    break
+
+    def start(self):
+        """
+        Starts serving connections and filling orders on
+        background threads.
+        """
+        for target in (self.server.serve_forever, self._fill_orders):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops the server.
+        """
+        self.pending.put(None)
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    from event import OrderEvent
+    from ib_execution import IBExecutionHandler
+
+    # Send a basket of 40 orders through the IBExecutionHandler
+    # to the stand-in TWS and wait for all of them to be filled
+    tws = StubTWS(partial_fills=3).start()
+    events = queue.Queue()
+    ib = IBExecutionHandler(events, port=tws.port)
+
+    symbols = ["S%02d" % i for i in range(40)]
+    start = time.time()
+    for symbol in symbols:
+        ib.execute_order(OrderEvent(symbol, 'MKT', 100, 'BUY'))
+    print("Sent %s orders in %0.3fs" % (len(symbols), time.time() - start))
+
+    filled = dict((symbol, 0) for symbol in symbols)
+    while sum(filled.values()) < 100 * len(symbols):
+        fill = events.get(timeout=10)
+        filled[fill.symbol] += fill.quantity
+    print(
+        "Received all fills in %0.3fs, %s orders still working" % (
+            time.time() - start, ib.working_orders()
+        )
+    )
+
+    ib.disconnect()
+    tws.stop()
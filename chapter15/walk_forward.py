@@ -0,0 +1,242 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# walk_forward.py
+
+from __future__ import print_function
+
+import hashlib
+import multiprocessing
+import os, os.path
+import pickle
+
+import numpy as np
+
+
+def fit_model(model_class, params, X, y):
+    """
+    Fits a new model instance. This is a module level function
+    so that it can be sent to a worker process.
+    """
+    model = model_class(**params)
+    model.fit(X, y)
+    return model
+
+
+class ModelCache(object):
+    """
+    ModelCache stores fitted models on disk as pickles, keyed
+    by a SHA1 digest of everything that determines the fit:
+    the model class and hyperparameters, the feature names, the
+    training window and a digest of the training data itself.
+    Repeated walk-forward runs therefore reuse prior fits.
+    """
+
+    def __init__(self, cache_dir='model_cache'):
+        """
+        Parameters:
+        cache_dir - The directory the fitted models are kept in.
+        """
+        self.cache_dir = cache_dir
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def make_key(self, model_class, params, features, window, X, y):
+        """
+        Returns the cache key for a fit.
+
+        Parameters:
+        model_class - The class of the model.
+        params - Dictionary of hyperparameters.
+        features - The list of feature names.
+        window - A (symbol, start, end) tuple for the training window.
+        X, y - The training features and responses.
+        """
+        sha = hashlib.sha1()
+        sha.update(repr((
+            model_class.__module__, model_class.__name__,
+            sorted(params.items()), list(features),
+            tuple(str(w) for w in window)
+        )).encode('utf-8'))
+        sha.update(np.ascontiguousarray(X, dtype=np.float64).tobytes())
+        sha.update(np.ascontiguousarray(y, dtype=np.float64).tobytes())
+        return sha.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, '%s.pkl' % key)
+
+    def load(self, key):
+        """
+        Returns the cached model for a key, or None.
+        """
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def save(self, key, model):
+        """
+        Stores a fitted model, writing to a temporary file
+        first so that a partly written pickle is never read.
+        """
+        tmp_path = '%s.%s.tmp' % (self._path(key), os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(model, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, self._path(key))
+
+
+class WalkForwardTrainer(object):
+    """
+    WalkForwardTrainer retrains a model on a rolling (or
+    expanding) window of bars at a fixed cadence during a
+    backtest.
+
+    Each fit is first looked up in a ModelCache. Fits that are
+    not cached are sent to a background process pool, so the
+    backtest carries on with the current model while the next
+    one is trained. A model trained on the bars up to index t
+    becomes active at bar t + activation_lag, blocking only if
+    it is not ready by then, so the results do not depend on
+    how long the training takes.
+    """
+
+    def __init__(
+        self, model_class, params=None, window=504, retrain_every=21,
+        expanding=False, min_train=252, activation_lag=1,
+        cache_dir='model_cache', processes=1
+    ):
+        """
+        Initialises the trainer.
+
+        Parameters:
+        model_class - The (scikit-learn style) model class to fit.
+        params - Dictionary of hyperparameters for the model.
+        window - Number of bars in a rolling training window.
+        retrain_every - Number of bars between retraining.
+        expanding - Train on every bar so far rather than a
+            rolling window.
+        min_train - Minimum number of bars before the first fit.
+        activation_lag - Bars between the end of a training
+            window and the model being used.
+        cache_dir - Directory for the ModelCache, None to disable.
+        processes - Size of the training pool, 0 to train in
+            the calling process.
+        """
+        self.model_class = model_class
+        self.params = params or {}
+        self.window = window
+        self.retrain_every = retrain_every
+        self.expanding = expanding
+        self.min_train = min_train
+        self.activation_lag = activation_lag
+        self.processes = processes
+
+        self.cache = None
+        if cache_dir is not None:
+            self.cache = ModelCache(cache_dir)
+        self.pool = None
+
+        self.model = None
+        self.pending = []
+        self.last_fit = None
+        self.fits = 0
+        self.cache_hits = 0
+
+    def lookback(self, bar_index):
+        """
+        Returns the number of bars to train on at a bar index.
+        """
+        if self.expanding:
+            return bar_index
+        return min(bar_index, self.window)
+
+    def due(self, bar_index):
+        """
+        Returns True if a new model should be trained on
+        the bars up to this index.
+        """
+        if bar_index < self.min_train:
+            return False
+        return (
+            self.last_fit is None or
+            bar_index - self.last_fit >= self.retrain_every
+        )
+
+    def submit(self, bar_index, X, y, features, window):
+        """
+        Starts training a model on the given data, or takes it
+        from the cache, to become active at
+        bar_index + activation_lag.
+
+        Parameters:
+        bar_index - The index of the last bar in the window.
+        X, y - The training features and responses.
+        features - The list of feature names.
+        window - A (symbol, start, end) tuple for the training window.
+        """
+        self.last_fit = bar_index
+        activate_at = bar_index + self.activation_lag
+
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(
+                self.model_class, self.params, features, window, X, y
+            )
+            model = self.cache.load(key)
+            if model is not None:
+                self.cache_hits += 1
+                self.pending.append((activate_at, key, model, None))
+                return
+
+        self.fits += 1
+        if self.processes == 0:
+            model = fit_model(self.model_class, self.params, X, y)
+            if key is not None:
+                self.cache.save(key, model)
+            self.pending.append((activate_at, key, model, None))
+        else:
+            if self.pool is None:
+                self.pool = multiprocessing.Pool(self.processes)
+            result = self.pool.apply_async(
+                fit_model, (self.model_class, self.params, X, y)
+            )
+            self.pending.append((activate_at, key, None, result))
+
+    def get_model(self, bar_index):
+        """
+        Returns the model to use at a bar index, swapping in
+        any newly trained models that are now due.
+        """
+        while self.pending and self.pending[0][0] <= bar_index:
+            activate_at, key, model, result = self.pending.pop(0)
+            if result is not None:
+                model = result.get()
+                if key is not None:
+                    self.cache.save(key, model)
+            self.model = model
+        return self.model
+
+    def next_activation(self, bar_index):
+        """
+        Returns the first bar index after bar_index at which
+        the model may change, so that the current model is
+        known to be fixed until then.
+        """
+        for activate_at, key, model, result in self.pending:
+            if activate_at > bar_index:
+                return activate_at
+        if self.last_fit is None:
+            next_fit = max(self.min_train, bar_index)
+        else:
+            next_fit = max(self.last_fit + self.retrain_every, bar_index)
+        return max(next_fit + self.activation_lag, bar_index + 1)
+
+    def close(self):
+        """
+        Shuts down the training pool.
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
@@ -8,44 +8,60 @@ from __future__ import print_function
 import datetime
 
 import sklearn
-from sklearn import cross_validation
-from sklearn.cross_validation import train_test_split
-from sklearn.grid_search import GridSearchCV
 from sklearn.metrics import classification_report
 from sklearn.svm import SVC
 
 from create_lagged_series import create_lagged_series
+from hyperparameter_search import HyperparameterSearch
+from ts_cross_val import time_series_folds
 
 
 if __name__ == "__main__":
     # Create a lagged series of the S&P500 US stock market index
     snpret = create_lagged_series(
-        "^GSPC", datetime.datetime(2001,1,10), 
+        "^GSPC", datetime.datetime(2001,1,10),
         datetime.datetime(2005,12,31), lags=5
-    )
+    ).dropna()
 
-    # Use the prior two days of returns as predictor 
+    # Use the prior two days of returns as predictor
     # values, with direction as the response
-    X = snpret[["Lag1","Lag2"]]
-    y = snpret["Direction"]
+    X = snpret[["Lag1","Lag2"]].values
+    y = snpret["Direction"].values
 
-    # Train/test split
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.5, random_state=42
-    )
+    # Train/test split, keeping the test set after the
+    # training set in time
+    split = len(snpret) // 2
+    X_train, X_test = X[:split], X[split:]
+    y_train, y_test = y[:split], y[split:]
 
     # Set the parameters by cross-validation
     tuned_parameters = [
         {'kernel': ['rbf'], 'gamma': [1e-3, 1e-4], 'C': [1, 10, 100, 1000]}
     ]
 
-    # Perform the grid search on the tuned parameters
-    model = GridSearchCV(SVC(C=1), tuned_parameters, cv=10)
-    model.fit(X_train, y_train)
+    # Perform the search on the tuned parameters over 10
+    # expanding time-series folds, with successive halving.
+    # As in k_fold_cross_val, no purge is needed, since each
+    # label is the direction of its own day. Scores are cached
+    # in search_cache, so a rerun (or a run with a larger grid)
+    # only fits the new combinations
+    folds = time_series_folds(len(X_train), n_splits=10)
+    search = HyperparameterSearch(
+        SVC, tuned_parameters, folds, method='halving', eta=2
+    )
+    results = search.search(X_train, y_train)
 
     print("Optimised parameters found on training set:")
-    print(model.best_estimator_, "\n")
-    
+    print(search.best_params, "\n")
+
     print("Grid scores calculated on training set:")
-    for params, mean_score, scores in model.grid_scores_:
-        print("%0.3f for %r" % (mean_score, params))
+    for i, row in results.iterrows():
+        print("%0.3f (+/-%0.03f) on %s folds for %r" % (
+            row["mean_hit_rate"], row["std_hit_rate"],
+            row["folds"], row["params"])
+        )
+    print("\n%s fits, %s cached scores" % (search.fits, search.cache_hits))
+
+    print("\nDetailed classification report on test set:")
+    model = search.best_estimator(X_train, y_train)
+    print(classification_report(y_test, model.predict(X_test)))
@@ -0,0 +1,331 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# hyperparameter_search.py
+
+from __future__ import print_function
+
+import hashlib
+import itertools
+import multiprocessing
+import os, os.path
+import pickle
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import ts_cross_val
+
+
+def parameter_grid(param_grid):
+    """
+    Expands a dictionary (or list of dictionaries) of parameter
+    name to list of values into the list of every combination,
+    in the same way as scikit-learn's ParameterGrid.
+    """
+    if isinstance(param_grid, dict):
+        param_grid = [param_grid]
+    candidates = []
+    for grid in param_grid:
+        names = sorted(grid)
+        for values in itertools.product(*[grid[n] for n in names]):
+            candidates.append(dict(zip(names, values)))
+    return candidates
+
+
+def _score_fold(task):
+    """
+    Fits a model with one set of parameters on one fold and
+    returns its hit rate on the test block. The data are the
+    memory mapped arrays opened by ts_cross_val._init_worker.
+    """
+    key, model_class, params, train_index, test_index = task
+    X, y = ts_cross_val._X, ts_cross_val._y
+
+    start = time.time()
+    model = model_class(**params)
+    model.fit(X[train_index], y[train_index])
+    fit_time = time.time() - start
+    pred = model.predict(X[test_index])
+    return key, np.mean(pred == y[test_index]), fit_time
+
+
+class ScoreCache(object):
+    """
+    ScoreCache stores the score of each completed (parameters,
+    fold) fit on disk, keyed by a SHA1 digest of the model class,
+    the parameters, the fold indices and the data. An interrupted
+    search, or one extended with new parameters, therefore only
+    fits what it has not seen before.
+    """
+
+    def __init__(self, cache_dir='search_cache'):
+        """
+        Parameters:
+        cache_dir - The directory the scores are kept in.
+        """
+        self.cache_dir = cache_dir
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+    def make_key(self, model_class, params, data_key, train_index, test_index):
+        """
+        Returns the cache key for one fit.
+
+        Parameters:
+        model_class - The class of the model.
+        params - Dictionary of hyperparameters.
+        data_key - A digest of the features and responses.
+        train_index, test_index - The index arrays of the fold.
+        """
+        sha = hashlib.sha1()
+        sha.update(repr((
+            model_class.__module__, model_class.__name__,
+            sorted(params.items()), data_key
+        )).encode('utf-8'))
+        sha.update(np.ascontiguousarray(train_index, dtype=np.int64).tobytes())
+        sha.update(b'|')
+        sha.update(np.ascontiguousarray(test_index, dtype=np.int64).tobytes())
+        return sha.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, '%s.pkl' % key)
+
+    def load(self, key):
+        """
+        Returns the cached (score, fit_time) for a key, or None.
+        """
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def save(self, key, score, fit_time):
+        """
+        Stores a score, writing to a temporary file first so
+        that a partly written entry is never read.
+        """
+        tmp_path = '%s.%s.tmp' % (self._path(key), os.getpid())
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((score, fit_time), f, pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, self._path(key))
+
+
+class HyperparameterSearch(object):
+    """
+    HyperparameterSearch scores every combination of a parameter
+    grid across a set of (time-series) cross-validation folds.
+
+    Each (parameters, fold) fit is an independent task, so all
+    of them are spread over a process pool that memory maps the
+    features rather than receiving a copy with each task.
+    Completed scores are written to a ScoreCache as they arrive.
+
+    With method='halving' the candidates are first scored on
+    min_folds folds, spread across the history. Only the best
+    1/eta of them go on to the next round, which uses eta times
+    as many folds (reusing the scores already computed), until
+    the survivors have been scored on every fold.
+    """
+
+    def __init__(
+        self, model_class, param_grid, folds, method='grid', eta=3,
+        min_folds=None, cache_dir='search_cache', processes=None
+    ):
+        """
+        Initialises the search.
+
+        Parameters:
+        model_class - The (scikit-learn style) model class.
+        param_grid - A dictionary, or list of dictionaries, of
+            parameter name to a list of values.
+        folds - A list of (train_index, test_index) tuples, e.g.
+            from ts_cross_val.time_series_folds.
+        method - 'grid' for an exhaustive search or 'halving'
+            for successive halving.
+        eta - The factor by which each halving round cuts the
+            candidates and grows the folds.
+        min_folds - Folds in the first halving round, by default
+            enough that the last round uses every fold.
+        cache_dir - Directory for the ScoreCache, None to disable.
+        processes - Number of worker processes, default all cores.
+        """
+        if method not in ('grid', 'halving'):
+            raise ValueError("Unknown search method '%s'" % method)
+        self.model_class = model_class
+        self.candidates = parameter_grid(param_grid)
+        self.folds = folds
+        self.method = method
+        self.eta = eta
+        self.min_folds = min_folds
+        self.processes = processes or multiprocessing.cpu_count()
+
+        self.cache = None
+        if cache_dir is not None:
+            self.cache = ScoreCache(cache_dir)
+
+        self.fits = 0
+        self.cache_hits = 0
+
+    def _fold_order(self):
+        """
+        Orders the folds so that any leading subset of them
+        is spread evenly across the history.
+        """
+        n = len(self.folds)
+        order = []
+        step = n
+        while len(order) < n:
+            for i in range(0, n, step):
+                if i not in order:
+                    order.append(i)
+            step = max(step // 2, 1)
+        return order
+
+    def _rounds(self):
+        """
+        Returns the number of folds to score the survivors on in
+        each round, ending with every fold.
+        """
+        n = len(self.folds)
+        if self.method == 'grid':
+            return [n]
+        min_folds = self.min_folds
+        if min_folds is None:
+            rounds = 1
+            while self.eta ** rounds < len(self.candidates):
+                rounds += 1
+            min_folds = int(np.ceil(float(n) / self.eta ** (rounds - 1)))
+        sizes = []
+        size = max(1, min_folds)
+        while size < n:
+            sizes.append(size)
+            size *= self.eta
+        return sizes + [n]
+
+    def _evaluate(self, pool, data_key, candidates, folds, scores):
+        """
+        Scores the candidates on the given folds, taking what it
+        can from the cache and fitting the rest in the pool.
+        """
+        tasks = []
+        for c in candidates:
+            for f in folds:
+                if (c, f) in scores:
+                    continue
+                train_index, test_index = self.folds[f]
+                key = None
+                if self.cache is not None:
+                    key = self.cache.make_key(
+                        self.model_class, self.candidates[c],
+                        data_key, train_index, test_index
+                    )
+                    cached = self.cache.load(key)
+                    if cached is not None:
+                        self.cache_hits += 1
+                        scores[(c, f)] = cached
+                        continue
+                tasks.append(((c, f, key), self.model_class,
+                    self.candidates[c], train_index, test_index))
+
+        if tasks:
+            self.fits += len(tasks)
+            for (c, f, key), score, fit_time in pool.imap_unordered(
+                _score_fold, tasks
+            ):
+                if key is not None:
+                    self.cache.save(key, score, fit_time)
+                scores[(c, f)] = (score, fit_time)
+
+    def search(self, X, y, tmp_dir=None):
+        """
+        Runs the search and returns the results as a DataFrame
+        with one row per candidate, ordered best first, of the
+        mean and standard deviation of the hit rate, the number
+        of folds scored, the last round reached and the total
+        fit time. The best parameters are kept in best_params
+        and their mean hit rate in best_score.
+
+        Parameters:
+        X - The feature matrix.
+        y - The responses.
+        tmp_dir - Directory for the memory mapped .npy files.
+        """
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        y = np.asarray(y)
+        sha = hashlib.sha1(X.tobytes())
+        sha.update(np.ascontiguousarray(y, dtype=np.float64).tobytes())
+        data_key = sha.hexdigest()
+
+        order = self._fold_order()
+        candidates = list(range(len(self.candidates)))
+        reached = dict((c, 0) for c in candidates)
+        scores = {}
+
+        tmp = tempfile.mkdtemp(dir=tmp_dir)
+        pool = None
+        try:
+            X_path = os.path.join(tmp, 'X.npy')
+            y_path = os.path.join(tmp, 'y.npy')
+            np.save(X_path, X)
+            np.save(y_path, y)
+            pool = multiprocessing.Pool(
+                self.processes, initializer=ts_cross_val._init_worker,
+                initargs=(X_path, y_path)
+            )
+
+            rounds = self._rounds()
+            for r, size in enumerate(rounds):
+                folds = order[:size]
+                self._evaluate(pool, data_key, candidates, folds, scores)
+                for c in candidates:
+                    reached[c] = r
+                if r < len(rounds) - 1:
+                    keep = max(1, len(candidates) // self.eta)
+                    candidates = sorted(candidates, key=lambda c: -np.mean(
+                        [scores[(c, f)][0] for f in folds]
+                    ))[:keep]
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            shutil.rmtree(tmp)
+
+        rows = []
+        for c, params in enumerate(self.candidates):
+            fold_scores = [
+                scores[(c, f)] for f in range(len(self.folds))
+                if (c, f) in scores
+            ]
+            hit_rates = [s[0] for s in fold_scores]
+            rows.append({
+                "params": params,
+                "mean_hit_rate": np.mean(hit_rates),
+                "std_hit_rate": np.std(hit_rates),
+                "folds": len(fold_scores),
+                "round": reached[c],
+                "fit_time": sum(s[1] for s in fold_scores)
+            })
+        results = pd.DataFrame(rows, columns=[
+            "params", "mean_hit_rate", "std_hit_rate",
+            "folds", "round", "fit_time"
+        ]).sort_values(
+            ["round", "mean_hit_rate"], ascending=False
+        )
+
+        self.best_params = results["params"].iloc[0]
+        self.best_score = results["mean_hit_rate"].iloc[0]
+        return results
+
+    def best_estimator(self, X, y):
+        """
+        Returns a model with the best parameters fitted on all
+        of the given data.
+        """
+        model = self.model_class(**self.best_params)
+        model.fit(X, y)
+        return model
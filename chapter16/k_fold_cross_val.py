@@ -9,57 +9,43 @@ import datetime
 
 import pandas as pd
 import sklearn
-from sklearn import cross_validation
-from sklearn.metrics import confusion_matrix
 from sklearn.svm import SVC
 
 from create_lagged_series import create_lagged_series
+from ts_cross_val import cross_validate, print_report, time_series_folds
 
 
 if __name__ == "__main__":
     # Create a lagged series of the S&P500 US stock market index
     snpret = create_lagged_series(
-        "^GSPC", datetime.datetime(2001,1,10), 
+        "^GSPC", datetime.datetime(2001,1,10),
         datetime.datetime(2005,12,31), lags=5
-    )
+    ).dropna()
 
-    # Use the prior two days of returns as predictor 
+    # Use the prior two days of returns as predictor
     # values, with direction as the response
     X = snpret[["Lag1","Lag2"]]
     y = snpret["Direction"]
 
-    # Create a k-fold cross validation object
-    kf = cross_validation.KFold(
-        len(snpret), n_folds=10, indices=False, 
-        shuffle=True, random_state=42
+    # Create 10 contiguous (unshuffled) folds, with each test
+    # block trained on all the data before it. No purge is
+    # needed, as each label is the direction of its own day
+    # and so no training label overlaps a test block
+    folds = time_series_folds(
+        len(snpret), n_splits=10, mode='expanding'
     )
 
-    # Use the kf object to create index arrays that
-    # state which elements have been retained for training
-    # and which elements have beenr retained for testing
-    # for each k-element iteration
-    for train_index, test_index in kf:
-        X_train = X.ix[X.index[train_index]]
-        X_test = X.ix[X.index[test_index]]
-        y_train = y.ix[y.index[train_index]]
-        y_test = y.ix[y.index[test_index]]
-
-        # In this instance only use the 
-        # Radial Support Vector Machine (SVM)
-        print("Hit Rate/Confusion Matrix:")
-        model = SVC(
-            C=1000000.0, cache_size=200, class_weight=None,
-            coef0=0.0, degree=3, gamma=0.0001, kernel='rbf',
-            max_iter=-1, probability=False, random_state=None,
-            shrinking=True, tol=0.001, verbose=False
-        )
-
-        # Train the model on the retained training data
-        model.fit(X_train, y_train)
-
-        # Make an array of predictions on the test set
-        pred = model.predict(X_test)
+    # In this instance only use the
+    # Radial Support Vector Machine (SVM)
+    model = SVC(
+        C=1000000.0, cache_size=200, class_weight=None,
+        coef0=0.0, degree=3, gamma=0.0001, kernel='rbf',
+        max_iter=-1, probability=False, random_state=None,
+        shrinking=True, tol=0.001, verbose=False
+    )
 
-        # Output the hit-rate and the confusion matrix for each model
-        print("%0.3f" % model.score(X_test, y_test))
-        print("%s\n" % confusion_matrix(pred, y_test))
\ No newline at end of file
+    # Train and test the folds in parallel, then output the
+    # hit-rate of each fold and the aggregated results
+    report = cross_validate(model, X.values, y.values, folds)
+    print("Hit Rate/Confusion Matrix:")
+    print_report(report)
@@ -0,0 +1,181 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# model_comparison.py
+
+from __future__ import print_function
+
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import confusion_matrix
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_memory_mb():
+    """
+    Returns the peak resident memory of the current process
+    in megabytes, or NaN where it is not available.
+    """
+    if resource is None:
+        return np.nan
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on Mac OS X and kilobytes elsewhere
+    if sys.platform == 'darwin':
+        return maxrss / 1024.0 / 1024.0
+    return maxrss / 1024.0
+
+
+def fit_and_score(task):
+    """
+    Fits one model on one training set and scores it on the
+    test set. Run in a fresh worker process for each task. A
+    forked worker's peak memory starts at the footprint it
+    inherits from the parent, so the growth of the peak above
+    its value at the start of the task is reported, which is
+    the memory used by this model alone.
+
+    Parameters:
+    task - A (symbol, name, model, X_train, X_test, y_train,
+        y_test) tuple.
+    """
+    symbol, name, model, X_train, X_test, y_train, y_test = task
+    baseline_mb = peak_memory_mb()
+
+    start = time.time()
+    model.fit(X_train, y_train)
+    fit_time = time.time() - start
+
+    start = time.time()
+    pred = model.predict(X_test)
+    predict_time = time.time() - start
+
+    y_test = np.asarray(y_test)
+    labels = np.unique(np.concatenate([np.asarray(y_train), y_test]))
+    return {
+        "symbol": symbol,
+        "model": name,
+        "hit_rate": np.mean(pred == y_test),
+        "confusion_matrix": confusion_matrix(pred, y_test, labels=labels),
+        "fit_time": fit_time,
+        "predict_time": predict_time,
+        "model_memory_mb": peak_memory_mb() - baseline_mb
+    }
+
+
+def compare_models(models, datasets, processes=None, inner_jobs=None):
+    """
+    Fits and scores every model on every dataset concurrently
+    in a process pool, collecting the results into a single
+    DataFrame.
+
+    Models that support internal parallelism (an n_jobs
+    parameter, such as RandomForestClassifier) are given a
+    share of the cores, so that the pool and the models do not
+    oversubscribe the machine between them.
+
+    Parameters:
+    models - A list of (name, unfitted model) tuples.
+    datasets - A dictionary keyed by symbol of
+        (X_train, X_test, y_train, y_test) tuples.
+    processes - Number of worker processes, default all cores.
+    inner_jobs - n_jobs given to the models that accept it,
+        default the cores left per worker.
+
+    Returns:
+    A DataFrame of hit rate, confusion matrix, fit and predict
+    times and the peak memory used by the model, indexed by
+    (symbol, model).
+    """
+    cores = multiprocessing.cpu_count()
+    if processes is None:
+        processes = cores
+    tasks = [
+        (symbol, name, model) + tuple(datasets[symbol])
+        for symbol in datasets for name, model in models
+    ]
+    processes = max(1, min(processes, len(tasks)))
+    if inner_jobs is None:
+        inner_jobs = max(1, cores // processes)
+    for name, model in models:
+        if "n_jobs" in model.get_params():
+            model.set_params(n_jobs=inner_jobs)
+
+    # A fresh process per task keeps the peak memory figures
+    # separate and returns memory to the OS after large models
+    pool = multiprocessing.Pool(processes, maxtasksperchild=1)
+    try:
+        results = list(pool.imap_unordered(fit_and_score, tasks))
+    finally:
+        pool.close()
+        pool.join()
+
+    order = dict(((t[0], t[1]), i) for i, t in enumerate(tasks))
+    results.sort(key=lambda r: order[(r["symbol"], r["model"])])
+    return pd.DataFrame(
+        results, columns=[
+            "symbol", "model", "hit_rate", "confusion_matrix",
+            "fit_time", "predict_time", "model_memory_mb"
+        ]
+    ).set_index(["symbol", "model"])
+
+
+def print_comparison(results):
+    """
+    Outputs the hit rate and confusion matrix of each model,
+    followed by the timings and memory use.
+    """
+    print("Hit Rates/Confusion Matrices:\n")
+    for (symbol, name), row in results.iterrows():
+        print("%s %s:\n%0.3f" % (symbol, name, row["hit_rate"]))
+        print("%s\n" % row["confusion_matrix"])
+    print(results.drop("confusion_matrix", axis=1))
+
+
+if __name__ == "__main__":
+    import datetime
+
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.lda import LDA
+    from sklearn.qda import QDA
+    from sklearn.svm import LinearSVC, SVC
+
+    from create_lagged_series import create_lagged_series
+
+    # Compare the models on every symbol given on the command
+    # line, e.g. python model_comparison.py SPY AAPL MSFT
+    symbols = sys.argv[1:] or ["^GSPC"]
+    start_test = datetime.datetime(2005,1,1)
+
+    datasets = {}
+    for symbol in symbols:
+        snpret = create_lagged_series(
+            symbol, datetime.datetime(2001,1,10),
+            datetime.datetime(2005,12,31), lags=5
+        ).dropna()
+        X = snpret[["Lag1","Lag2"]]
+        y = snpret["Direction"]
+        datasets[symbol] = (
+            X[X.index < start_test], X[X.index >= start_test],
+            y[y.index < start_test], y[y.index >= start_test]
+        )
+
+    models = [
+        ("LR", LogisticRegression()),
+        ("LDA", LDA()),
+        ("QDA", QDA()),
+        ("LSVC", LinearSVC()),
+        ("RSVM", SVC(C=1000000.0, gamma=0.0001, kernel='rbf')),
+        ("RF", RandomForestClassifier(n_estimators=1000))
+    ]
+    results = compare_models(models, datasets)
+    print_comparison(results)
+    print(results.groupby(level="model")["hit_rate"].describe())
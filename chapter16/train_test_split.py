@@ -12,11 +12,11 @@ from sklearn.cross_validation import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.lda import LDA
-from sklearn.metrics import confusion_matrix
 from sklearn.qda import QDA
 from sklearn.svm import LinearSVC, SVC
 
 from create_lagged_series import create_lagged_series
+from model_comparison import compare_models, print_comparison
 
 
 if __name__ == "__main__":
@@ -37,7 +37,6 @@ if __name__ == "__main__":
     )
    
     # Create the (parametrised) models
-    print("Hit Rates/Confusion Matrices:\n")
     models = [("LR", LogisticRegression()), 
               ("LDA", LDA()), 
               ("QDA", QDA()),
@@ -56,15 +55,9 @@ if __name__ == "__main__":
                 random_state=None, verbose=0)
               )]
 
-    # Iterate through the models
-    for m in models:
-        
-        # Train each of the models on the training set
-        m[1].fit(X_train, y_train)
-
-        # Make an array of predictions on the test set
-        pred = m[1].predict(X_test)
-
-        # Output the hit-rate and the confusion matrix for each model
-        print("%s:\n%0.3f" % (m[0], m[1].score(X_test, y_test)))
-        print("%s\n" % confusion_matrix(pred, y_test))
\ No newline at end of file
+    # Train and test each of the models concurrently, outputting
+    # the hit-rate and the confusion matrix for each model
+    results = compare_models(
+        models, {"^GSPC": (X_train, X_test, y_train, y_test)}
+    )
+    print_comparison(results)
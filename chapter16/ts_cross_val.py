@@ -0,0 +1,220 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# ts_cross_val.py
+
+from __future__ import print_function
+
+import multiprocessing
+import os, os.path
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import confusion_matrix
+
+
+def time_series_folds(
+    n_samples, n_splits=5, mode='expanding', train_size=None,
+    test_size=None, purge=0, embargo=0
+):
+    """
+    Creates the train/test index arrays for cross-validating a
+    model on time-ordered samples, without shuffling.
+
+    In 'expanding' mode each test block is trained on every
+    sample before it and in 'rolling' mode on the train_size
+    samples before it. In 'kfold' mode the samples are cut into
+    n_splits contiguous blocks and each block is tested against
+    a model trained on all the others, on both sides of it.
+
+    Purging removes the purge samples immediately before each
+    test block from the training set, so that features or labels
+    that look ahead (e.g. multi-day returns) cannot overlap the
+    test period. The embargo removes the embargo samples
+    immediately after each test block, which only applies in
+    'kfold' mode, where training data follows the test block.
+
+    Parameters:
+    n_samples - The number of samples.
+    n_splits - The number of folds.
+    mode - 'expanding', 'rolling' or 'kfold'.
+    train_size - The rolling training window length.
+    test_size - The length of each test block for the expanding
+        and rolling modes, default n_samples // (n_splits + 1).
+    purge - Samples dropped from training before each test block.
+    embargo - Samples dropped from training after each test block.
+
+    Returns:
+    A list of (train_index, test_index) integer array tuples.
+    """
+    if n_splits < 1:
+        raise ValueError("n_splits must be at least 1")
+    indices = np.arange(n_samples)
+    folds = []
+
+    if mode == 'kfold':
+        bounds = np.linspace(0, n_samples, n_splits + 1).astype(int)
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            keep = (indices < start - purge) | (indices >= stop + embargo)
+            folds.append((indices[keep], indices[start:stop]))
+        return folds
+
+    if mode not in ('expanding', 'rolling'):
+        raise ValueError("Unknown cross-validation mode '%s'" % mode)
+    if mode == 'rolling' and train_size is None:
+        raise ValueError("Rolling folds need a train_size")
+    if test_size is None:
+        test_size = n_samples // (n_splits + 1)
+    if test_size < 1:
+        raise ValueError("test_size must be at least 1")
+
+    first_test = n_samples - n_splits * test_size
+    if first_test - purge <= 0:
+        raise ValueError(
+            "%d samples leave no training data for %d test blocks of %d"
+            " with a purge of %d" % (n_samples, n_splits, test_size, purge)
+        )
+    for i in range(n_splits):
+        start = first_test + i * test_size
+        train_stop = max(start - purge, 0)
+        train_start = 0
+        if mode == 'rolling':
+            train_start = max(train_stop - train_size, 0)
+        folds.append((
+            indices[train_start:train_stop], indices[start:start + test_size]
+        ))
+    return folds
+
+
+# The shared (memory mapped) data of each worker process
+_X = None
+_y = None
+
+
+def _init_worker(X_path, y_path):
+    """
+    Opens the feature matrix and responses read-only through
+    memory mapping, once per worker process.
+    """
+    global _X, _y
+    _X = np.load(X_path, mmap_mode='r')
+    _y = np.load(y_path, mmap_mode='r')
+
+
+def _run_fold(task):
+    """
+    Fits and scores the model on one fold.
+    """
+    fold, model, train_index, test_index = task
+    X_train, y_train = _X[train_index], _y[train_index]
+    X_test, y_test = _X[test_index], _y[test_index]
+
+    start = time.time()
+    model.fit(X_train, y_train)
+    fit_time = time.time() - start
+    pred = model.predict(X_test)
+
+    return {
+        "fold": fold,
+        "train_start": train_index[0] if len(train_index) else -1,
+        "train_end": train_index[-1] if len(train_index) else -1,
+        "test_start": test_index[0],
+        "test_end": test_index[-1],
+        "train_size": len(train_index),
+        "test_size": len(test_index),
+        "hit_rate": np.mean(pred == y_test),
+        # Fix the labels so that every fold's matrix has the same
+        # shape, even when a fold only sees one class
+        "confusion_matrix": confusion_matrix(
+            pred, y_test, labels=np.unique(_y)
+        ),
+        "fit_time": fit_time
+    }
+
+
+def cross_validate(model, X, y, folds, processes=None, tmp_dir=None):
+    """
+    Runs the folds in parallel worker processes and returns
+    the per-fold results as a DataFrame.
+
+    The feature matrix and responses are written once to .npy
+    files (unless X and y are already paths to .npy files) and
+    memory mapped read-only by each worker, rather than being
+    pickled and sent with every fold.
+
+    Parameters:
+    model - The unfitted (scikit-learn style) model.
+    X - The feature matrix, or the path of a .npy file.
+    y - The responses, or the path of a .npy file.
+    folds - A list of (train_index, test_index) tuples.
+    processes - Number of worker processes, default all cores.
+    tmp_dir - Directory for the temporary .npy files.
+    """
+    tmp = None
+    try:
+        if isinstance(X, str) and isinstance(y, str):
+            X_path, y_path = X, y
+        else:
+            tmp = tempfile.mkdtemp(dir=tmp_dir)
+            X_path = os.path.join(tmp, 'X.npy')
+            y_path = os.path.join(tmp, 'y.npy')
+            np.save(X_path, np.ascontiguousarray(X, dtype=np.float64))
+            np.save(y_path, np.asarray(y))
+
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(
+            max(1, min(processes, len(folds))),
+            initializer=_init_worker, initargs=(X_path, y_path)
+        )
+        try:
+            results = pool.map(_run_fold, [
+                (i, model, train_index, test_index)
+                for i, (train_index, test_index) in enumerate(folds)
+            ], chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp)
+
+    return pd.DataFrame(results, columns=[
+        "fold", "train_start", "train_end", "test_start", "test_end",
+        "train_size", "test_size", "hit_rate", "confusion_matrix", "fit_time"
+    ]).set_index("fold")
+
+
+def summarise_report(report):
+    """
+    Aggregates the per-fold results: the mean and standard
+    deviation of the hit rate, the hit rate over all test
+    samples, the summed confusion matrix and the total fit time.
+    """
+    return {
+        "folds": len(report),
+        "mean_hit_rate": report["hit_rate"].mean(),
+        "std_hit_rate": report["hit_rate"].std(),
+        "pooled_hit_rate": (
+            (report["hit_rate"] * report["test_size"]).sum() /
+            report["test_size"].sum()
+        ),
+        "confusion_matrix": sum(report["confusion_matrix"]),
+        "fit_time": report["fit_time"].sum()
+    }
+
+
+def print_report(report):
+    """
+    Outputs the per-fold results followed by the aggregates.
+    """
+    print(report.drop("confusion_matrix", axis=1))
+    summary = summarise_report(report)
+    print("\nHit Rate: %0.3f (+/- %0.3f) over %s folds, pooled %0.3f" % (
+        summary["mean_hit_rate"], summary["std_hit_rate"],
+        summary["folds"], summary["pooled_hit_rate"])
+    )
+    print("%s\n" % summary["confusion_matrix"])
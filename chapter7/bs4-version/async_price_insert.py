@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import logging
+import random
+import sqlite3
+import sys
+import time
+import aiohttp
+import numpy as np
+
+from price_insert import (
+    CHART_URL, HEADERS, UPSERT_SQL, chart_params, yahoo_ticker
+)
+from price_validation import ValidationReport, chart_rows, validate_chart
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+from shared_config import DB_PATH
+from price_sync import get_sync_plan, record_sync
+
+# Responses worth retrying, as the server may succeed later
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """Token-bucket rate limiter: allows bursts of up to `capacity`
+    requests, refilling at `rate` tokens per second"""
+
+    def __init__(self, rate: float, capacity: int = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+class BatchedPriceWriter:
+    """The single SQLite writer: consumes (symbol_id, price columns) items
+    from a queue and upserts them in batches of `batch_size` rows, one transaction
+    per batch, off the event loop"""
+
+    def __init__(self, db_path=DB_PATH, vendor_id: int = 1, batch_size: int = 5000):
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.vendor_id = vendor_id
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self.batches = 0
+
+    def close(self):
+        self.conn.close()
+
+    def _flush(self, rows: List[tuple]):
+        try:
+            with self.conn:
+                self.conn.executemany(UPSERT_SQL, rows)
+            self.rows_written += len(rows)
+            self.batches += 1
+            logger.info(f"Upserted batch of {len(rows)} prices")
+        except sqlite3.Error as e:
+            logger.error(f"Database error: {e}")
+            raise
+
+    async def run(self, queue: asyncio.Queue):
+        """Write until a None sentinel arrives on the queue"""
+        rows = []
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            symbol_id, prices = item
+            rows.extend(chart_rows(self.vendor_id, symbol_id, prices))
+            if len(rows) >= self.batch_size:
+                await asyncio.to_thread(self._flush, rows)
+                rows = []
+        if rows:
+            await asyncio.to_thread(self._flush, rows)
+
+class AsyncPriceDownloader:
+    """Downloads chart data for many tickers concurrently over one pooled
+    HTTP session, with a token-bucket rate limit, bounded concurrency,
+    a per-host connection limit and retries with exponential backoff"""
+
+    def __init__(self, chart_url: str = CHART_URL, rate: float = 5.0, burst: int = 5,
+                 concurrency: int = 16, per_host: int = 8, retries: int = 4,
+                 backoff: float = 1.0, timeout: float = 10.0):
+        self.chart_url = chart_url
+        self.rate = rate
+        self.burst = burst
+        self.concurrency = concurrency
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.failed: List[str] = []
+        self.fetched: List[int] = []
+        self.reports: List[ValidationReport] = []
+
+    def _retry_delay(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after is not None:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+
+    async def fetch(self, session: aiohttp.ClientSession, bucket: TokenBucket, ticker: str,
+                    start_date: Tuple[int, int, int], end_date: Tuple[int, int, int] = None) -> Dict[str, np.ndarray]:
+        """Get the validated price columns of one ticker, retrying
+        transient failures"""
+        ticker = yahoo_ticker(ticker)
+        params = chart_params(ticker, start_date, end_date)
+        url = self.chart_url.format(ticker=ticker)
+
+        for attempt in range(self.retries + 1):
+            await bucket.acquire()
+            retry_after = None
+            try:
+                async with session.get(url, params=params) as response:
+                    if response.status in RETRY_STATUSES:
+                        retry_after = response.headers.get('Retry-After')
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history,
+                            status=response.status, message=response.reason
+                        )
+                    response.raise_for_status()
+                    data = await response.json(content_type=None)
+                columns, report = validate_chart(data, ticker)
+                self.reports.append(report)
+                return columns
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status = getattr(e, 'status', None)
+                if status is not None and status not in RETRY_STATUSES:
+                    raise
+                if attempt == self.retries:
+                    raise
+                delay = self._retry_delay(attempt, retry_after)
+                logger.warning(f"Retrying {ticker} in {delay:.1f}s after: {e}")
+                await asyncio.sleep(delay)
+
+    async def _worker(self, session: aiohttp.ClientSession, bucket: TokenBucket,
+                      jobs: asyncio.Queue, results: asyncio.Queue,
+                      start_date: Tuple[int, int, int], end_date: Tuple[int, int, int]):
+        while True:
+            try:
+                symbol_id, ticker, *start = jobs.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                prices = await self.fetch(session, bucket, ticker, start[0] if start else start_date, end_date)
+                await results.put((symbol_id, prices))
+                self.fetched.append(symbol_id)
+            except Exception as e:
+                logger.error(f"Error fetching data for {ticker}: {e}")
+                self.failed.append(ticker)
+
+    async def download(self, tickers: List[Tuple[int, str]], writer: BatchedPriceWriter,
+                       start_date: Tuple[int, int, int] = (1900, 1, 1),
+                       end_date: Tuple[int, int, int] = None) -> Dict[str, int]:
+        """Download every (symbol_id, ticker) and hand the prices to the writer.
+        A job may also be (symbol_id, ticker, start_date), e.g. from
+        price_sync.get_sync_plan, to override start_date for that ticker"""
+        self.failed = []
+        self.fetched = []
+        self.reports = []
+        jobs: asyncio.Queue = asyncio.Queue()
+        for job in tickers:
+            jobs.put_nowait(job)
+        # A bounded results queue stops the downloads running far
+        # ahead of the writer
+        results: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 4)
+        bucket = TokenBucket(self.rate, self.burst)
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.per_host)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout, headers=HEADERS) as session:
+            writer_task = asyncio.create_task(writer.run(results))
+            workers = [
+                asyncio.create_task(self._worker(session, bucket, jobs, results, start_date, end_date))
+                for _ in range(min(self.concurrency, len(tickers)))
+            ]
+            downloads = asyncio.gather(*workers)
+            try:
+                # The writer only stops early on an error, after which
+                # nothing drains the results queue, so the workers are
+                # cancelled rather than left blocked on a full queue
+                await asyncio.wait([downloads, writer_task], return_when=asyncio.FIRST_COMPLETED)
+                if writer_task.done():
+                    writer_task.result()
+            finally:
+                if not downloads.done():
+                    downloads.cancel()
+                    await asyncio.gather(downloads, return_exceptions=True)
+                if not writer_task.done():
+                    await results.put(None)
+                await writer_task
+
+        return {
+            'tickers': len(tickers),
+            'failed': len(self.failed),
+            'rows': writer.rows_written,
+            'rejected': sum(report.rejected for report in self.reports),
+            'batches': writer.batches
+        }
+
+def get_db_tickers(db_path=DB_PATH) -> List[Tuple[int, str]]:
+    """Get list of tickers from database"""
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT id, ticker FROM symbol").fetchall()
+
+async def main(chart_url: str = CHART_URL, db_path=DB_PATH):
+    # Only request the range missing since each symbol's last stored bar
+    with sqlite3.connect(db_path) as conn:
+        plan = get_sync_plan(conn)
+    if not plan:
+        return
+    downloader = AsyncPriceDownloader(chart_url=chart_url)
+    writer = BatchedPriceWriter(db_path)
+    try:
+        started = time.monotonic()
+        summary = await downloader.download(plan, writer)
+        logger.info(f"Downloaded {summary} in {time.monotonic() - started:.1f}s")
+        if downloader.failed:
+            logger.warning(f"Failed tickers: {', '.join(downloader.failed)}")
+        record_sync(writer.conn, downloader.fetched)
+    finally:
+        writer.close()
+
+if __name__ == "__main__":
+    # python async_price_insert.py [chart_url], where the chart URL can
+    # point at chart_stub.py, e.g. http://127.0.0.1:8765/v8/finance/chart/{ticker}
+    try:
+        asyncio.run(main(chart_url=sys.argv[1] if len(sys.argv) > 1 else CHART_URL))
+        logger.info("Price insertion completed successfully")
+    except Exception as e:
+        logger.error(f"Script failed: {e}")
+        exit(1)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Tuple
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from migrate_price_table import migrate
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The schema 3.0 price table, with a rowid surrogate key and ISO text dates
+V3_PRICE_TABLE = """
+    CREATE TABLE daily_price (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        data_vendor_id INTEGER NOT NULL,
+        symbol_id INTEGER NOT NULL,
+        price_date TEXT NOT NULL,
+        created_date TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        last_updated_date TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        open_price REAL,
+        high_price REAL,
+        low_price REAL,
+        close_price REAL,
+        adj_close_price REAL,
+        volume INTEGER,
+        UNIQUE(symbol_id, price_date)
+    )
+"""
+
+V3_INSERT_SQL = """
+    INSERT INTO daily_price
+    (data_vendor_id, symbol_id, price_date, created_date, last_updated_date,
+    open_price, high_price, low_price, close_price, adj_close_price, volume)
+    VALUES (1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+EPOCH = date(1970, 1, 1)
+
+def business_days(n: int, end: date = date(2024, 12, 31)) -> List[date]:
+    """The last n weekdays up to end"""
+    days = []
+    day = end
+    while len(days) < n:
+        if day.weekday() < 5:
+            days.append(day)
+        day -= timedelta(days=1)
+    return days[::-1]
+
+def build_v3_database(db_path: str, symbols: int, days: List[date], seed: int = 42):
+    """Write a synthetic schema 3.0 database of symbols x days prices.
+
+    Rows are written one trading day at a time, across all symbols, the
+    order in which daily incremental syncs append them, so one symbol's
+    history is spread over the whole rowid table."""
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(db_path)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("CREATE TABLE symbol (id INTEGER PRIMARY KEY, ticker TEXT NOT NULL UNIQUE)")
+        conn.execute("CREATE TABLE schema_version (version TEXT PRIMARY KEY, applied_date TEXT)")
+        conn.execute("INSERT INTO schema_version (version) VALUES ('3.0')")
+        conn.execute(V3_PRICE_TABLE)
+        ids = list(range(1, symbols + 1))
+        conn.executemany("INSERT INTO symbol VALUES (?, ?)", [(i, f'S{i:05d}') for i in ids])
+
+        close = 50.0 * np.exp(rng.normal(0, 0.5, symbols))
+        now = str(date.today())
+        started = time.monotonic()
+        for day in days:
+            close = close * np.exp(rng.normal(0, 0.02, symbols))
+            spread = close * rng.uniform(0, 0.02, symbols)
+            volume = rng.integers(10 ** 5, 10 ** 7, symbols)
+            stamp = f"{day.isoformat()} 14:30:00+00:00"
+            conn.executemany(V3_INSERT_SQL, zip(
+                ids, [stamp] * symbols, [now] * symbols, [now] * symbols,
+                close.tolist(), (close + spread).tolist(), (close - spread).tolist(),
+                close.tolist(), close.tolist(), volume.tolist()
+            ))
+        conn.commit()
+        logger.info(f"Built {symbols * len(days)} prices in {time.monotonic() - started:.1f}s")
+    finally:
+        conn.close()
+
+def day_number(day: date) -> int:
+    return (day - EPOCH).days
+
+def v3_bound(day: date) -> str:
+    return day.isoformat()
+
+def v3_end_bound(day: date) -> str:
+    return f"{day.isoformat()} 23:59:59"
+
+def benchmark_queries(symbols: int, days: List[date], seed: int = 7) -> Dict[str, Tuple[str, Callable]]:
+    """Each benchmark as (SQL, params(bound, end_bound)), where the bound
+    functions convert dates to the stored form of the schema"""
+    rng = np.random.default_rng(seed)
+    sample = [int(i) for i in rng.choice(np.arange(1, symbols + 1), min(100, symbols), replace=False)]
+    year_start, last = days[max(0, len(days) - 252)], days[-1]
+    month_start = days[max(0, len(days) - 21)]
+    panel_start = days[max(0, len(days) - 5 * 252)]
+    return {
+        'range scan (100 symbols x 1y)': (
+            """SELECT price_date, close_price FROM daily_price
+               WHERE symbol_id = ? AND price_date >= ? AND price_date <= ?
+               ORDER BY price_date""",
+            lambda lo, hi: [(s, lo(year_start), hi(last)) for s in sample]
+        ),
+        'full history (100 symbols)': (
+            """SELECT price_date, open_price, high_price, low_price, close_price, volume
+               FROM daily_price WHERE symbol_id = ? ORDER BY price_date""",
+            lambda lo, hi: [(s,) for s in sample]
+        ),
+        'date slice (all symbols x 1m)': (
+            """SELECT symbol_id, price_date, adj_close_price FROM daily_price
+               WHERE price_date >= ? AND price_date <= ?""",
+            lambda lo, hi: [(lo(month_start), hi(last))]
+        ),
+        'panel load (all symbols x 5y)': (
+            """SELECT sym.ticker, dp.price_date, dp.adj_close_price
+               FROM daily_price AS dp
+               INNER JOIN symbol AS sym ON dp.symbol_id = sym.id
+               WHERE dp.price_date >= ? AND dp.price_date <= ?""",
+            lambda lo, hi: [(lo(panel_start), hi(last))]
+        ),
+    }
+
+def time_queries(db_path: str, sql: str, params: list, panel: bool, repeat: int = 3) -> float:
+    """Best of `repeat` runs, in seconds, on a fresh connection each run.
+    A panel query is also pivoted into a (date x ticker) DataFrame."""
+    best = float('inf')
+    for _ in range(repeat):
+        conn = sqlite3.connect(db_path)
+        try:
+            started = time.perf_counter()
+            for p in params:
+                rows = conn.execute(sql, p).fetchall()
+            if panel:
+                frame = pd.DataFrame(rows, columns=['ticker', 'price_date', 'adj_close_price'])
+                frame.pivot(index='price_date', columns='ticker', values='adj_close_price')
+            best = min(best, time.perf_counter() - started)
+        finally:
+            conn.close()
+    return best
+
+def run(symbols: int = 2000, days: int = 5000, work_dir: str = '.') -> pd.DataFrame:
+    """Benchmark the schema 3.0 and 4.0 price tables on the same
+    synthetic prices, returning the timings in milliseconds"""
+    trading_days = business_days(days)
+    v3_path = os.path.join(work_dir, 'benchmark_v3.db')
+    v4_path = os.path.join(work_dir, 'benchmark_v4.db')
+    build_v3_database(v3_path, symbols, trading_days)
+    shutil.copyfile(v3_path, v4_path)
+    started = time.monotonic()
+    migrate(v4_path)
+    logger.info(f"Migration took {time.monotonic() - started:.1f}s")
+
+    results = []
+    for name, (sql, params) in benchmark_queries(symbols, trading_days).items():
+        panel = name.startswith('panel')
+        v3 = time_queries(v3_path, sql, params(v3_bound, v3_end_bound), panel)
+        v4 = time_queries(v4_path, sql, params(day_number, day_number), panel)
+        results.append({'query': name, 'v3_ms': v3 * 1000, 'v4_ms': v4 * 1000, 'speedup': v3 / v4})
+    results.append({
+        'query': 'database size (MB)',
+        'v3_ms': os.path.getsize(v3_path) / 2 ** 20,
+        'v4_ms': os.path.getsize(v4_path) / 2 ** 20,
+        'speedup': os.path.getsize(v3_path) / os.path.getsize(v4_path)
+    })
+    return pd.DataFrame(results).set_index('query')
+
+if __name__ == "__main__":
+    # python benchmark_price_table.py [symbols] [days] [work_dir], by
+    # default 2000 symbols x 5000 days, i.e. 10M prices
+    args = sys.argv[1:]
+    report = run(
+        int(args[0]) if len(args) > 0 else 2000,
+        int(args[1]) if len(args) > 1 else 5000,
+        args[2] if len(args) > 2 else '.'
+    )
+    print(report.round(2).to_string())
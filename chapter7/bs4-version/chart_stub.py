@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+from datetime import datetime, timezone, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+from typing import Optional
+import hashlib
+import json
+import logging
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHART_PATH = '/v8/finance/chart/'
+
+def synthetic_chart(ticker: str, period1: int, period2: int) -> dict:
+    """Build a chart response of random-walk daily prices for the weekdays
+    between period1 and period2, seeded by the ticker so it is repeatable"""
+    rng = random.Random(int(hashlib.sha1(ticker.encode('utf-8')).hexdigest()[:8], 16))
+    day = datetime.fromtimestamp(period1, tz=timezone.utc).replace(hour=14, minute=30)
+    end = min(datetime.fromtimestamp(period2, tz=timezone.utc), datetime.now(timezone.utc))
+
+    price = rng.uniform(20.0, 200.0)
+    timestamps, opens, highs, lows, closes, volumes = [], [], [], [], [], []
+    while day <= end:
+        if day.weekday() < 5:
+            open_ = price
+            price = max(1.0, price * (1.0 + rng.gauss(0.0, 0.02)))
+            timestamps.append(int(day.timestamp()))
+            opens.append(round(open_, 4))
+            highs.append(round(max(open_, price) * 1.01, 4))
+            lows.append(round(min(open_, price) * 0.99, 4))
+            closes.append(round(price, 4))
+            volumes.append(rng.randint(100000, 10000000))
+        day += timedelta(days=1)
+
+    return {
+        'chart': {
+            'result': [{
+                'meta': {'symbol': ticker, 'dataGranularity': '1d'},
+                'timestamp': timestamps,
+                'indicators': {
+                    'quote': [{
+                        'open': opens, 'high': highs, 'low': lows,
+                        'close': closes, 'volume': volumes
+                    }],
+                    'adjclose': [{'adjclose': list(closes)}]
+                }
+            }],
+            'error': None
+        }
+    }
+
+class ChartStubHandler(BaseHTTPRequestHandler):
+    """Serves the chart endpoint from recorded JSON files, falling back
+    to synthetic prices, with optional latency and injected failures"""
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, status: int, body: dict, headers: Optional[dict] = None):
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        stub = self.server.stub
+        url = urlparse(self.path)
+        if not url.path.startswith(CHART_PATH):
+            self._send_json(404, {'error': 'not found'})
+            return
+        ticker = url.path[len(CHART_PATH):]
+
+        with stub.lock:
+            stub.requests += 1
+            stub.in_flight += 1
+            stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+            now = time.monotonic()
+            stub.recent = [t for t in stub.recent if now - t < 1.0] + [now]
+            throttled = stub.max_rps is not None and len(stub.recent) > stub.max_rps
+            failed = stub.rng.random() < stub.fail_rate
+        try:
+            if stub.latency:
+                time.sleep(stub.latency)
+            if throttled:
+                stub.throttled += 1
+                self._send_json(429, {'error': 'Too Many Requests'}, {'Retry-After': '1'})
+                return
+            if failed:
+                stub.failures += 1
+                self._send_json(503, {'error': 'Service Unavailable'})
+                return
+
+            recording = stub.recordings_dir / f'{ticker}.json' if stub.recordings_dir else None
+            if recording is not None and recording.exists():
+                self._send_json(200, json.loads(recording.read_text()))
+            elif stub.synthetic:
+                query = parse_qs(url.query)
+                period1 = int(query.get('period1', ['0'])[0])
+                period2 = int(query.get('period2', [str(int(time.time()))])[0])
+                self._send_json(200, synthetic_chart(ticker, period1, period2))
+            else:
+                self._send_json(404, {'chart': {'result': None, 'error': {
+                    'code': 'Not Found', 'description': 'No data found, symbol may be delisted'
+                }}})
+        finally:
+            with stub.lock:
+                stub.in_flight -= 1
+
+class ChartStub:
+    """A local stand-in for the Yahoo chart endpoint, for exercising the
+    price downloaders without network access. Point the downloader's
+    base URL at stub.chart_url."""
+
+    def __init__(self, recordings_dir: Optional[str] = None, synthetic: bool = True,
+                 host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 fail_rate: float = 0.0, max_rps: Optional[int] = None, seed: int = 0):
+        self.recordings_dir = Path(recordings_dir) if recordings_dir else None
+        self.synthetic = synthetic
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.max_rps = max_rps
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+        self.requests = 0
+        self.failures = 0
+        self.throttled = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.recent = []
+
+        self.server = ThreadingHTTPServer((host, port), ChartStubHandler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.thread = None
+
+    @property
+    def chart_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}{CHART_PATH}{{ticker}}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info(f"Chart stub serving {self.chart_url}")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+def record_charts(tickers, recordings_dir: str, days: int = 365):
+    """Save real chart responses to recordings_dir for the stub to replay"""
+    import requests
+    from price_insert import CHART_URL, HEADERS, chart_params, yahoo_ticker
+
+    start = (datetime.now() - timedelta(days=days)).timetuple()[:3]
+    Path(recordings_dir).mkdir(parents=True, exist_ok=True)
+    for ticker in tickers:
+        ticker = yahoo_ticker(ticker)
+        response = requests.get(
+            CHART_URL.format(ticker=ticker), params=chart_params(ticker, start),
+            headers=HEADERS, timeout=10
+        )
+        response.raise_for_status()
+        (Path(recordings_dir) / f'{ticker}.json').write_text(response.text)
+        logger.info(f"Recorded {ticker}")
+        time.sleep(random.uniform(1.0, 3.0))
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == 'record':
+        # python chart_stub.py record recordings AAPL MSFT ...
+        record_charts(sys.argv[3:], sys.argv[2])
+    else:
+        # python chart_stub.py [recordings_dir] [port]
+        stub = ChartStub(
+            recordings_dir=sys.argv[1] if len(sys.argv) > 1 else None,
+            port=int(sys.argv[2]) if len(sys.argv) > 2 else 8765
+        ).start()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            stub.stop()
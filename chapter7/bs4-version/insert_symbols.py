@@ -1,5 +1,5 @@
 #!/usr/bin/env python3
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 from datetime import datetime, timezone
 import logging
 import sqlite3
@@ -12,6 +12,61 @@ logger = logging.getLogger(__name__)
 
 from shared_config import DB_PATH
 
+# The details compared to decide whether an existing symbol has changed
+SYMBOL_DETAILS = ('name', 'sector', 'sub_industry', 'headquarter',
+                  'date_added', 'cik', 'founded', 'currency')
+
+SYMBOL_CHANGED = ' OR '.join(f'sym.{c} IS NOT stage.{c}' for c in SYMBOL_DETAILS)
+
+SYMBOL_STAGE_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS symbol_stage (
+        exchange_id INTEGER,
+        ticker TEXT NOT NULL,
+        instrument TEXT NOT NULL,
+        name TEXT,
+        sector TEXT,
+        sub_industry TEXT,
+        headquarter TEXT,
+        date_added TEXT,
+        cik TEXT,
+        founded TEXT,
+        currency TEXT,
+        created_date TEXT,
+        last_updated_date TEXT,
+        PRIMARY KEY(ticker, exchange_id)
+    )
+"""
+
+STAGE_INSERT_SQL = """
+    INSERT OR REPLACE INTO symbol_stage 
+    (exchange_id, ticker, instrument, name, sector, sub_industry, 
+    headquarter, date_added, cik, founded, currency, created_date, last_updated_date)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+SYMBOL_COUNTS_SQL = f"""
+    SELECT SUM(sym.id IS NULL),
+           SUM(sym.id IS NOT NULL AND ({SYMBOL_CHANGED})),
+           SUM(sym.id IS NOT NULL AND NOT ({SYMBOL_CHANGED}))
+    FROM symbol_stage AS stage
+    LEFT JOIN symbol AS sym
+    ON sym.ticker = stage.ticker AND sym.exchange_id = stage.exchange_id
+"""
+
+# "WHERE true" stops SQLite parsing ON CONFLICT as a join constraint
+SYMBOL_UPSERT_SQL = f"""
+    INSERT INTO symbol AS sym
+    (exchange_id, ticker, instrument, name, sector, sub_industry, 
+    headquarter, date_added, cik, founded, currency, created_date, last_updated_date)
+    SELECT exchange_id, ticker, instrument, name, sector, sub_industry,
+           headquarter, date_added, cik, founded, currency, created_date, last_updated_date
+    FROM symbol_stage WHERE true
+    ON CONFLICT(ticker, exchange_id) DO UPDATE SET
+        {', '.join(f'{c} = excluded.{c}' for c in SYMBOL_DETAILS)},
+        last_updated_date = excluded.last_updated_date
+    WHERE {SYMBOL_CHANGED.replace('stage.', 'excluded.')}
+"""
+
 class SymbolManager:
     def __init__(self, db_path=DB_PATH):
         self.conn = sqlite3.connect(db_path)
@@ -21,6 +76,15 @@ class SymbolManager:
     def __del__(self):
         self.conn.close()
 
+    def get_exchange_ids(self) -> Dict[str, int]:
+        """Get every exchange ID, keyed by abbreviation, in one query"""
+        try:
+            self.cursor.execute("SELECT abbrev, id FROM exchange")
+            return {row['abbrev']: row['id'] for row in self.cursor.fetchall()}
+        except sqlite3.Error as e:
+            logger.error(f"Error getting exchange IDs: {e}")
+            return {}
+
     def get_exchange_id(self, exchange_abbrev: str) -> int:
         """Get exchange ID from abbreviation"""
         try:
@@ -43,6 +107,7 @@ class SymbolManager:
             
             soup = BeautifulSoup(response.text, 'html.parser')
             symbolslist = soup.select('table.wikitable')[0].select('tr')[1:]
+            exchange_ids = self.get_exchange_ids()
             
             symbols = []
             for symbol in symbolslist:
@@ -59,7 +124,8 @@ class SymbolManager:
                 else:
                     exchange = 'NYSE'  # Default
                     
-                exchange_id = self.get_exchange_id(exchange)
+                # XNYS is the NYSE market identifier code
+                exchange_id = exchange_ids.get(exchange, exchange_ids.get('NYSE'))
 
                 symbols.append((
                     exchange_id,
@@ -79,76 +145,30 @@ class SymbolManager:
             logger.error(f"Error fetching S&P500 symbols: {e}")
             raise
 
-    def insert_symbols(self, symbols: List[Tuple]):
-        """Insert or update symbols in database"""
+    def insert_symbols(self, symbols: List[Tuple]) -> Dict[str, int]:
+        """Insert or update symbols in database with one set-based upsert.
+
+        The rows are staged in a temporary table, counted against the symbol
+        table, then upserted on (ticker, exchange_id), only rewriting the
+        rows whose details have changed. Returns the insert, update and
+        unchanged counts."""
         try:
-            now = datetime.now(timezone.utc)
-            
-            # Prepare SQL for checking existing records
-            check_sql = """
-                SELECT ticker, name, sector, sub_industry, headquarter, 
-                    date_added, cik, founded, currency
-                FROM symbol 
-                WHERE ticker = ?
-            """
-            
-            # Prepare update SQL
-            update_sql = """
-                UPDATE symbol 
-                SET name = ?, 
-                    sector = ?, 
-                    sub_industry = ?, 
-                    headquarter = ?,
-                    date_added = ?,
-                    cik = ?,
-                    founded = ?,
-                    currency = ?,
-                    last_updated_date = ?
-                WHERE ticker = ?
-            """
-            
-            # Prepare insert SQL - Make sure this matches your table structure exactly
-            insert_sql = """
-                INSERT INTO symbol 
-                (exchange_id, ticker, instrument, name, sector, sub_industry, 
-                headquarter, date_added, cik, founded, currency, created_date, last_updated_date)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """
-            
-            updates = 0
-            inserts = 0
-            
-            for symbol in symbols:
-                # Assuming symbol tuple structure matches:
-                # (exchange_id, ticker, instrument, name, sector, sub_industry, headquarter, date_added, cik, founded, currency)
-                ticker = symbol[1]
-                
-                # Check if symbol exists - only using ticker for simplicity
-                self.cursor.execute(check_sql, (ticker,))
-                existing = self.cursor.fetchone()
-                
-                if existing:
-                    # Compare relevant fields to see if an update is needed
-                    # Adjust indices based on your tuple structure
-                    current_values = symbol[3:11]  # name through currency
-                    existing_values = tuple(existing)[1:9]  # corresponding values from existing record
-                    
-                    if current_values != existing_values:
-                        # Update if there are differences
-                        # Prepare update values: all fields plus ticker for WHERE clause
-                        update_values = list(symbol[3:11])  # name through currency
-                        update_values.append(now)  # last_updated_date
-                        update_values.append(ticker)  # WHERE clause value
-                        self.cursor.execute(update_sql, update_values)
-                        updates += 1
-                else:
-                    # Insert new record
-                    insert_values = list(symbol)
-                    self.cursor.execute(insert_sql, insert_values)
-                    inserts += 1
-            
+            self.cursor.execute(SYMBOL_STAGE_SQL)
+            self.cursor.execute("DELETE FROM symbol_stage")
+            # Symbol tuple structure:
+            # (exchange_id, ticker, instrument, name, sector, sub_industry, headquarter,
+            #  date_added, cik, founded, currency, created_date, last_updated_date)
+            self.cursor.executemany(STAGE_INSERT_SQL, symbols)
+
+            self.cursor.execute(SYMBOL_COUNTS_SQL)
+            inserts, updates, unchanged = (count or 0 for count in self.cursor.fetchone())
+
+            self.cursor.execute(SYMBOL_UPSERT_SQL)
+            self.cursor.execute("DELETE FROM symbol_stage")
             self.conn.commit()
-            logger.info(f"Symbols processed: {len(symbols)} - Updated: {updates}, Inserted: {inserts}")
+            logger.info(f"Symbols processed: {len(symbols)} - Updated: {updates}, "
+                        f"Inserted: {inserts}, Unchanged: {unchanged}")
+            return {'inserted': inserts, 'updated': updates, 'unchanged': unchanged}
             
         except sqlite3.Error as e:
             self.conn.rollback()
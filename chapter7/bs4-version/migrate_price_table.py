@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+import logging
+import sqlite3
+import sys
+import time
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+from shared_config import DB_PATH
+
+SCHEMA_VERSION = '4.0'
+
+# Prices clustered on (symbol_id, price_date), so one symbol's history
+# is stored contiguously in the table b-tree and a range scan needs no
+# rowid lookups. price_date is the day number since 1970-01-01 (UTC).
+PRICE_TABLE = """
+    CREATE TABLE IF NOT EXISTS daily_price (
+        symbol_id INTEGER NOT NULL,
+        price_date INTEGER NOT NULL,
+        data_vendor_id INTEGER NOT NULL,
+        open_price REAL,
+        high_price REAL,
+        low_price REAL,
+        close_price REAL,
+        adj_close_price REAL,
+        volume INTEGER,
+        created_date TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        last_updated_date TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY(symbol_id, price_date),
+        FOREIGN KEY(data_vendor_id) REFERENCES data_vendor(id) ON DELETE CASCADE,
+        FOREIGN KEY(symbol_id) REFERENCES symbol(id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+"""
+
+# Covers date-slice queries across symbols; the index entries also
+# carry the primary key, so symbol_id comes for free
+PRICE_DATE_INDEX = """
+    CREATE INDEX IF NOT EXISTS idx_daily_price_date
+    ON daily_price(price_date, adj_close_price, volume)
+"""
+
+# Old ISO text timestamps become day numbers. Several bars on one day
+# (e.g. an intraday snapshot of the last bar) keep the latest.
+COPY_SQL = """
+    INSERT OR REPLACE INTO daily_price_v4
+    (symbol_id, price_date, data_vendor_id, open_price, high_price,
+    low_price, close_price, adj_close_price, volume,
+    created_date, last_updated_date)
+    SELECT symbol_id,
+           CAST(julianday(substr(price_date, 1, 10)) - 2440587.5 AS INTEGER),
+           data_vendor_id, open_price, high_price, low_price, close_price,
+           adj_close_price, volume, created_date, last_updated_date
+    FROM daily_price
+    ORDER BY symbol_id, price_date
+"""
+
+def is_migrated(conn: sqlite3.Connection) -> bool:
+    """Whether daily_price already has the clustered layout, i.e. no
+    rowid surrogate key"""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(daily_price)")]
+    return bool(columns) and 'id' not in columns
+
+def migrate(db_path=DB_PATH, vacuum: bool = True) -> int:
+    """Rebuild daily_price in the clustered layout of schema 4.0 in one
+    transaction, returning the number of rows copied. Does nothing if the
+    table is already migrated."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        if is_migrated(conn):
+            logger.info(f"{db_path} already has schema {SCHEMA_VERSION} prices")
+            return 0
+
+        started = time.monotonic()
+        conn.execute("PRAGMA foreign_keys = OFF")
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(PRICE_TABLE.replace('daily_price', 'daily_price_v4', 1))
+            conn.execute(COPY_SQL)
+            rows = conn.execute("SELECT COUNT(*) FROM daily_price_v4").fetchone()[0]
+            conn.execute("DROP TABLE daily_price")
+            conn.execute("ALTER TABLE daily_price_v4 RENAME TO daily_price")
+            conn.execute(PRICE_DATE_INDEX)
+            conn.execute(
+                "INSERT OR REPLACE INTO schema_version (version) VALUES (?)",
+                (SCHEMA_VERSION,)
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+        logger.info(f"Migrated {rows} prices in {time.monotonic() - started:.1f}s")
+
+        if vacuum:
+            # Return the pages of the old table and its index
+            conn.execute("VACUUM")
+        return rows
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    try:
+        migrate(sys.argv[1] if len(sys.argv) > 1 else DB_PATH)
+    except Exception as e:
+        logger.error(f"Migration failed: {e}")
+        exit(1)
@@ -1,47 +1,69 @@
 #!/usr/bin/env python3
 from datetime import datetime, date, timezone, timedelta
 import logging
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 import sqlite3
 import requests
 import random
 import time
 from json import loads
-from pydantic import BaseModel, field_validator
+import numpy as np
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class PriceData(BaseModel):
-    date: datetime
-    open: float
-    high: float
-    low: float
-    close: float
-    adj_close: float
-    volume: int
-
-    @field_validator('date')
-    def validate_date(cls, value):
-        if value > datetime.now(timezone.utc):
-            raise ValueError('Date cannot be in the future')
-        return value
-
 from shared_config import DB_PATH
+from price_sync import get_sync_plan, record_sync
+from price_validation import ValidationReport, chart_rows, validate_chart
+
+CHART_URL = 'https://query1.finance.yahoo.com/v8/finance/chart/{ticker}'
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:133.0) Gecko/20100101 Firefox/133.0',
+    'Accept': '*/*',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Referer': 'https://finance.yahoo.com',
+    'Origin': 'https://finance.yahoo.com',
+}
+
+# Use INSERT OR REPLACE (upsert) with a unique constraint on symbol_id and price_date
+UPSERT_SQL = """
+    INSERT OR REPLACE INTO daily_price 
+    (data_vendor_id, symbol_id, price_date, created_date, last_updated_date,
+    open_price, high_price, low_price, close_price, adj_close_price, volume)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def yahoo_ticker(ticker: str) -> str:
+    """Convert a ticker to Yahoo's form, e.g. BRK.B to BRK-B"""
+    return ticker.replace('.', '-') if '.' in ticker else ticker
+
+def chart_params(ticker: str, start_date: Tuple[int, int, int] = (1900, 1, 1),
+                 end_date: Tuple[int, int, int] = None) -> dict:
+    """Build the query parameters of a chart request"""
+    if end_date is None:
+        end_date = date.today().timetuple()[:3]
+    return {
+        'events': 'capitalGain|div|split',
+        'formatted': 'true',
+        'includeAdjustedClose': 'true',
+        'interval': '1d',
+        'period1': str(int(datetime(*start_date, tzinfo=timezone.utc).timestamp())),
+        'period2': str(int(datetime(*end_date, tzinfo=timezone.utc).timestamp())),
+        'symbol': ticker,
+        'userYfid': 'true',
+        'lang': 'en-US',
+        'region': 'US',
+    }
 
 class PriceManager:
     def __init__(self, db_path=DB_PATH):
         self.conn = sqlite3.connect(db_path)
         self.conn.row_factory = sqlite3.Row
         self.cursor = self.conn.cursor()
-        self.headers = {
-            'User-Agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:133.0) Gecko/20100101 Firefox/133.0',
-            'Accept': '*/*',
-            'Accept-Language': 'en-US,en;q=0.5',
-            'Referer': 'https://finance.yahoo.com',
-            'Origin': 'https://finance.yahoo.com',
-        }
+        self.headers = HEADERS
+        self.reports: List[ValidationReport] = []
 
     def __del__(self):
         self.conn.close()
@@ -59,96 +81,42 @@ class PriceManager:
             raise
 
     def get_historical_data(self, ticker: str, start_date: Tuple[int, int, int] = (1900, 1, 1),
-                          end_date: Tuple[int, int, int] = None) -> List[PriceData]:
-        """Get historical data from Yahoo Finance"""
-        if end_date is None:
-            end_date = date.today().timetuple()[:3]
-            
+                          end_date: Tuple[int, int, int] = None) -> Dict[str, np.ndarray]:
+        """Get historical data from Yahoo Finance, as the validated price
+        columns of price_validation.validate_chart"""
         try:
-            ticker = ticker.replace('.', '-') if '.' in ticker else ticker
+            ticker = yahoo_ticker(ticker)
 
             print(f"Fetching data for {ticker}")
-            params = {
-                'events': 'capitalGain|div|split',
-                'formatted': 'true',
-                'includeAdjustedClose': 'true',
-                'interval': '1d',
-                'period1': str(int(datetime(*start_date, tzinfo=timezone.utc).timestamp())),
-                'period2': str(int(datetime(*end_date, tzinfo=timezone.utc).timestamp())),
-                'symbol': ticker,
-                'userYfid': 'true',
-                'lang': 'en-US',
-                'region': 'US',
-            }
+            params = chart_params(ticker, start_date, end_date)
 
             time.sleep(random.uniform(1.0, 3.0))
 
             response = requests.get(
-                f'https://query1.finance.yahoo.com/v8/finance/chart/{ticker}',
+                CHART_URL.format(ticker=ticker),
                 params=params,
                 headers=self.headers,
                 timeout=10
             )
             response.raise_for_status()
             
-            data = loads(response.text)
-            result = data['chart']['result'][0]
-            quote = result['indicators']['quote'][0]
-            
-            prices = []
-            timestamps = result['timestamp']
-            opens = quote['open']
-            highs = quote['high']
-            lows = quote['low']
-            closes = quote['close']
-            volumes = quote['volume']
-            adj_closes = result['indicators']['adjclose'][0]['adjclose']
-
-            for i in range(len(timestamps)):
-                # Skip if any required value is None
-                if any(x[i] is None for x in [opens, highs, lows, closes, volumes, adj_closes]):
-                    continue
-                    
-                prices.append(PriceData(
-                    date=datetime.fromtimestamp(timestamps[i], tz=timezone.utc),
-                    open=opens[i],
-                    high=highs[i],
-                    low=lows[i],
-                    close=closes[i],
-                    adj_close=adj_closes[i],
-                    volume=int(volumes[i])
-                ))
-            return prices
+            columns, report = validate_chart(loads(response.text), ticker)
+            self.reports.append(report)
+            logger.info(f"Validated {report.valid} of {report.total} bars for {ticker}")
+            return columns
         except Exception as e:
             logger.error(f"Error fetching data for {ticker}: {e}")
             raise
 
-    def insert_prices(self, vendor_id: int, symbol_id: int, prices: List[PriceData]):
+    def insert_prices(self, vendor_id: int, symbol_id: int, prices: Dict[str, np.ndarray]):
         """Insert or update prices in database"""
         try:
-            # First, prepare the data
-            now = datetime.now(timezone.utc)
-            data_to_insert = [
-                (
-                    vendor_id, symbol_id, price.date, now, now,
-                    price.open, price.high, price.low, price.close,
-                    price.adj_close, price.volume
-                )
-                for price in prices
-            ]
-            
-            # Use INSERT OR REPLACE (upsert) with a unique constraint on symbol_id and price_date
-            upsert_sql = """
-                INSERT OR REPLACE INTO daily_price 
-                (data_vendor_id, symbol_id, price_date, created_date, last_updated_date,
-                open_price, high_price, low_price, close_price, adj_close_price, volume)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """
+            data_to_insert = chart_rows(vendor_id, symbol_id, prices)
             
             # Execute the upsert
-            self.cursor.executemany(upsert_sql, data_to_insert)
+            self.cursor.executemany(UPSERT_SQL, data_to_insert)
             self.conn.commit()
-            logger.info(f"Upserted {len(prices)} prices for symbol ID {symbol_id}")
+            logger.info(f"Upserted {len(data_to_insert)} prices for symbol ID {symbol_id}")
             
         except sqlite3.Error as e:
             self.conn.rollback()
@@ -162,15 +130,16 @@ class PriceManager:
 if __name__ == "__main__":
     try:
         manager = PriceManager()
-        tickers = manager.get_db_tickers()
-        
-        for symbol_id, ticker in tickers:
-            logger.info(f"Processing {ticker} (ID: {symbol_id})")
-            start_date = datetime.now() - timedelta(days=1)
-            prices = manager.get_historical_data(ticker, start_date=(start_date.year, start_date.month, start_date.day))
+
+        # Only request the range missing since each symbol's last stored bar
+        for symbol_id, ticker, start_date in get_sync_plan(manager.conn):
+            logger.info(f"Processing {ticker} (ID: {symbol_id}) from {start_date}")
+            prices = manager.get_historical_data(ticker, start_date=start_date)
             manager.insert_prices(1, symbol_id, prices)
+            record_sync(manager.conn, [symbol_id])
             
-        logger.info("Price insertion completed successfully")
+        rejected = sum(report.rejected for report in manager.reports)
+        logger.info(f"Price insertion completed successfully, {rejected} bars rejected")
     except Exception as e:
         logger.error(f"Script failed: {e}")
         exit(1)
\ No newline at end of file
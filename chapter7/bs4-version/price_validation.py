@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+import logging
+import numpy as np
+from pydantic import BaseModel
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PRICE_FIELDS = ('open', 'high', 'low', 'close', 'adj_close', 'volume')
+
+class ValidationReport(BaseModel):
+    """Counts of the bars dropped from a chart response, by reason. A bar
+    failing several checks is counted under each of them"""
+    ticker: str = ''
+    total: int = 0
+    valid: int = 0
+    missing: int = 0
+    inconsistent: int = 0
+    negative_volume: int = 0
+    future: int = 0
+    duplicate: int = 0
+
+    @property
+    def rejected(self) -> int:
+        return self.total - self.valid
+
+def chart_arrays(data: dict) -> Dict[str, np.ndarray]:
+    """Convert the arrays of a chart JSON response straight to NumPy, with
+    missing (null) prices as NaN"""
+    result = data['chart']['result'][0]
+    quote = result['indicators']['quote'][0]
+    timestamps = result.get('timestamp') or []
+    n = len(timestamps)
+
+    def column(values):
+        if values is None:
+            return np.full(n, np.nan)
+        return np.array(values, dtype=np.float64)
+
+    return {
+        'timestamp': np.array(timestamps, dtype=np.int64),
+        'open': column(quote.get('open')),
+        'high': column(quote.get('high')),
+        'low': column(quote.get('low')),
+        'close': column(quote.get('close')),
+        'adj_close': column(result['indicators']['adjclose'][0].get('adjclose')),
+        'volume': column(quote.get('volume')),
+    }
+
+def validate_chart(data: dict, ticker: str = '', now: Optional[datetime] = None,
+                   tolerance: float = 1e-6) -> Tuple[Dict[str, np.ndarray], ValidationReport]:
+    """Validate every bar of a chart response at once.
+
+    Bars are dropped if any price or the volume is missing, if the low is
+    above the open, close or high (or the high below the open or close, by
+    more than a relative tolerance for rounding), if the volume is negative,
+    if the timestamp is in the future, or if the timestamp repeats an
+    earlier bar. Returns the valid columns and a ValidationReport."""
+    columns = chart_arrays(data)
+    now = now or datetime.now(timezone.utc)
+    o, h, l, c = columns['open'], columns['high'], columns['low'], columns['close']
+
+    missing = np.zeros(len(columns['timestamp']), dtype=bool)
+    for field in PRICE_FIELDS:
+        missing |= np.isnan(columns[field])
+
+    # NaNs compare False, so missing bars are not also inconsistent
+    slack = tolerance * np.abs(h)
+    with np.errstate(invalid='ignore'):
+        inconsistent = (
+            (l > np.minimum(o, c) + slack) |
+            (h < np.maximum(o, c) - slack) |
+            (l > h + slack)
+        )
+        negative_volume = columns['volume'] < 0
+    future = columns['timestamp'] > int(now.timestamp())
+    duplicate = np.zeros_like(missing)
+    if len(duplicate):
+        _, first = np.unique(columns['timestamp'], return_index=True)
+        duplicate[:] = True
+        duplicate[first] = False
+
+    valid = ~(missing | inconsistent | negative_volume | future | duplicate)
+    report = ValidationReport(
+        ticker=ticker,
+        total=len(valid),
+        valid=int(valid.sum()),
+        missing=int(missing.sum()),
+        inconsistent=int(inconsistent.sum()),
+        negative_volume=int(negative_volume.sum()),
+        future=int(future.sum()),
+        duplicate=int(duplicate.sum()),
+    )
+    if report.rejected:
+        logger.warning(f"Validation of {ticker}: {report}")
+    return {k: v[valid] for k, v in columns.items()}, report
+
+def price_days(timestamps: np.ndarray) -> List[int]:
+    """Convert UTC epoch seconds to the price_date day numbers since
+    1970-01-01"""
+    return (timestamps // 86400).tolist()
+
+def chart_rows(vendor_id: int, symbol_id: int, columns: Dict[str, np.ndarray]) -> List[tuple]:
+    """Build the daily_price rows of UPSERT_SQL from validated columns,
+    without creating an object per bar"""
+    n = len(columns['timestamp'])
+    now = str(datetime.now(timezone.utc))
+    return list(zip(
+        [vendor_id] * n, [symbol_id] * n, price_days(columns['timestamp']),
+        [now] * n, [now] * n,
+        columns['open'].tolist(), columns['high'].tolist(),
+        columns['low'].tolist(), columns['close'].tolist(),
+        columns['adj_close'].tolist(), columns['volume'].astype(np.int64).tolist()
+    ))
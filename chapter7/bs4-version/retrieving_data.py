@@ -1,9 +1,12 @@
 #!/usr/bin/env python3
 import sys
+import json
 import logging
 import sqlite3
+from collections import OrderedDict
+from datetime import date
 import pandas as pd
-from typing import Optional  # Add this line
+from typing import Optional, Sequence, Union  # Add this line
 from pydantic import BaseModel, field_validator
 
 # Configure logging
@@ -12,24 +15,64 @@ logger = logging.getLogger(__name__)
 
 from shared_config import DB_PATH
 
+# price_date is stored as the day number since 1970-01-01
+EPOCH = date(1970, 1, 1)
+
+# Columns of daily_price a panel can be built from
+PRICE_FIELDS = (
+    'open_price', 'high_price', 'low_price',
+    'close_price', 'adj_close_price', 'volume'
+)
+
+# The tickers are bound as one JSON array, so the statement text (and
+# its cached query plan) is the same for any number of tickers
+# A ticker listed on several exchanges is resolved to its first
+# symbol (MIN(id)), so that each ticker is one column of the panel.
+# The date bounds are only added when given: an "(:start IS NULL OR ...)"
+# predicate keeps SQLite from seeking the (symbol_id, price_date) key
+PANEL_SQL = """
+    SELECT dp.price_date, sym.ticker, {fields}
+    FROM (SELECT ticker, MIN(id) AS id FROM symbol
+          WHERE ticker IN (SELECT value FROM json_each(:tickers))
+          GROUP BY ticker) AS sym
+    INNER JOIN daily_price AS dp
+    ON dp.symbol_id = sym.id
+    {where}
+"""
+
 class DataRetriever:
-    def __init__(self, db_path=DB_PATH):
+    def __init__(self, db_path=DB_PATH, cache_size: int = 32):
+        """Keeps one connection open for all queries, and the last
+        `cache_size` panels in memory (0 turns the cache off)"""
         self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()
+        self._data_version = None
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        if getattr(self, 'conn', None) is not None:
+            self.conn.close()
+            self.conn = None
 
     def get_historical_data(self, ticker: str) -> Optional[pd.DataFrame]:
         """Retrieve historical data for a specific ticker"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                query = """
-                    SELECT dp.price_date, dp.open_price, dp.high_price, dp.low_price, 
-                           dp.close_price, dp.adj_close_price, dp.volume
-                    FROM symbol AS sym
-                    INNER JOIN daily_price AS dp
-                    ON dp.symbol_id = sym.id
-                    WHERE sym.ticker = ?
-                    ORDER BY dp.price_date ASC;
-                """
-                return pd.read_sql_query(query, conn, params=(ticker,), index_col='price_date')
+            query = """
+                SELECT dp.price_date, dp.open_price, dp.high_price, dp.low_price, 
+                       dp.close_price, dp.adj_close_price, dp.volume
+                FROM symbol AS sym
+                INNER JOIN daily_price AS dp
+                ON dp.symbol_id = sym.id
+                WHERE sym.ticker = ?
+                ORDER BY dp.price_date ASC;
+            """
+            data = pd.read_sql_query(query, self.conn, params=(ticker,), index_col='price_date')
+            data.index = pd.to_datetime(data.index, unit='D')
+            return data
         except sqlite3.Error as e:
             logger.error(f"Database error: {e}")
             return None
@@ -37,6 +80,67 @@ class DataRetriever:
             logger.error(f"Error retrieving data for {ticker}: {e}")
             return None
 
+    def _check_cache(self):
+        """Drop cached panels once another connection has written to
+        the database"""
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._cache.clear()
+            self._data_version = version
+
+    def get_panel(self, tickers: Sequence[str], fields: Union[str, Sequence[str]] = 'adj_close_price',
+                  start_date: Optional[date] = None, end_date: Optional[date] = None) -> pd.DataFrame:
+        """Retrieve a (date x ticker) panel for many tickers with one query.
+
+        With a single field the columns are the tickers, in the order
+        given; with a list of fields they are (field, ticker) pairs. Dates
+        the tickers do not share are NaN, and the panel is limited to
+        start_date and end_date inclusive when given. Use .to_numpy() for
+        the bare array. Repeated requests are served from the cache, so
+        the returned panel must not be modified in place."""
+        single = isinstance(fields, str)
+        field_list = [fields] if single else list(fields)
+        unknown = set(field_list) - set(PRICE_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown price fields: {', '.join(sorted(unknown))}")
+        tickers = list(tickers)
+
+        key = (tuple(tickers), tuple(field_list), single, start_date, end_date)
+        if self.cache_size:
+            self._check_cache()
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        params = {'tickers': json.dumps(tickers)}
+        bounds = []
+        if start_date:
+            params['start'] = (start_date - EPOCH).days
+            bounds.append('dp.price_date >= :start')
+        if end_date:
+            params['end'] = (end_date - EPOCH).days
+            bounds.append('dp.price_date <= :end')
+        query = PANEL_SQL.format(
+            fields=', '.join(f'dp.{f}' for f in field_list),
+            where=f"WHERE {' AND '.join(bounds)}" if bounds else ''
+        )
+        frame = pd.read_sql_query(query, self.conn, params=params)
+        frame['price_date'] = pd.to_datetime(frame['price_date'], unit='D')
+
+        panel = frame.pivot(index='price_date', columns='ticker', values=fields if single else field_list)
+        if single:
+            panel = panel.reindex(columns=tickers)
+        else:
+            panel = panel.reindex(columns=pd.MultiIndex.from_product([field_list, tickers]))
+        panel = panel.sort_index()
+        panel.columns.names = [None] * panel.columns.nlevels
+
+        if self.cache_size:
+            self._cache[key] = panel
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return panel
+
 class DataRequest(BaseModel):
     ticker: str
     
@@ -48,12 +152,18 @@ class DataRequest(BaseModel):
 
 if __name__ == "__main__":
     try:
-        if len(sys.argv) != 2:
-            print('Usage: python retrieving_data.py TICKER')
+        if len(sys.argv) < 2:
+            print('Usage: python retrieving_data.py TICKER [TICKER ...]')
             sys.exit(1)
-            
-        request = DataRequest(ticker=sys.argv[1])
+
         retriever = DataRetriever()
+        if len(sys.argv) > 2:
+            # Several tickers give an aligned panel of adjusted closes
+            tickers = [DataRequest(ticker=t).ticker for t in sys.argv[1:]]
+            print(retriever.get_panel(tickers).tail())
+            sys.exit(0)
+
+        request = DataRequest(ticker=sys.argv[1])
         
         data = retriever.get_historical_data(request.ticker)
         if data is not None:
@@ -1,5 +1,5 @@
 -- SQLite-compatible Securities Master Database Schema
--- Version 3.0
+-- Version 4.0
 -- Simplified for SQLite compatibility
 -- sqlite3 securities_master.db < securities_master.sql
 
@@ -47,24 +47,65 @@ CREATE TABLE IF NOT EXISTS symbol (
 );
 
 -- Daily Price Table
+-- Clustered on (symbol_id, price_date), with price_date the day number
+-- since 1970-01-01, so a symbol's history is one contiguous range scan
 CREATE TABLE IF NOT EXISTS daily_price (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    data_vendor_id INTEGER NOT NULL,
     symbol_id INTEGER NOT NULL,
-    price_date TEXT NOT NULL,
-    created_date TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
-    last_updated_date TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    price_date INTEGER NOT NULL,
+    data_vendor_id INTEGER NOT NULL,
     open_price REAL,
     high_price REAL,
     low_price REAL,
     close_price REAL,
     adj_close_price REAL,
     volume INTEGER,
-    UNIQUE(symbol_id, price_date),
+    created_date TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_updated_date TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY(symbol_id, price_date),
     FOREIGN KEY(data_vendor_id) REFERENCES data_vendor(id) ON DELETE CASCADE,
     FOREIGN KEY(symbol_id) REFERENCES symbol(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+-- Covering index for date-slice queries across symbols
+CREATE INDEX IF NOT EXISTS idx_daily_price_date
+ON daily_price(price_date, adj_close_price, volume);
+
+-- Price Sync Watermark Table
+CREATE TABLE IF NOT EXISTS price_sync (
+    symbol_id INTEGER PRIMARY KEY,
+    last_price_date TEXT,
+    synced_date TEXT NOT NULL,
+    FOREIGN KEY(symbol_id) REFERENCES symbol(id) ON DELETE CASCADE
 );
 
+-- Intraday Tables, clustered on (symbol_id, time) with times as integer
+-- local exchange time: seconds since 1970-01-01 for minute bars and
+-- microseconds for ticks. Loaded by chapter15/intraday_store.py
+CREATE TABLE IF NOT EXISTS minute_bar (
+    symbol_id INTEGER NOT NULL,
+    bar_time INTEGER NOT NULL,
+    open_price REAL,
+    low_price REAL,
+    high_price REAL,
+    close_price REAL,
+    volume INTEGER,
+    oi INTEGER,
+    PRIMARY KEY(symbol_id, bar_time),
+    FOREIGN KEY(symbol_id) REFERENCES symbol(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS tick (
+    symbol_id INTEGER NOT NULL,
+    tick_time INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    price REAL,
+    size INTEGER,
+    bid REAL,
+    ask REAL,
+    PRIMARY KEY(symbol_id, tick_time, seq),
+    FOREIGN KEY(symbol_id) REFERENCES symbol(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
 -- Version Tracking Table
 CREATE TABLE IF NOT EXISTS schema_version (
     version TEXT PRIMARY KEY,
@@ -81,4 +122,4 @@ INSERT INTO exchange (abbrev, name, city, country, currency) VALUES
 ('CBOE', 'Chicago Board Options Exchange', 'Chicago', 'USA', 'USD');
 
 -- Insert initial version
-INSERT INTO schema_version (version) VALUES ('3.0');
\ No newline at end of file
+INSERT INTO schema_version (version) VALUES ('4.0');
\ No newline at end of file
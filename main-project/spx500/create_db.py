@@ -60,24 +60,40 @@ def create_database(db_path='securities_master.db'):
             )
         ''')
 
-        # Create daily_price table
+        # Create daily_price table, clustered on (symbol_id, price_date)
+        # with price_date the day number since 1970-01-01
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS daily_price (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                data_vendor_id INTEGER NOT NULL,
                 symbol_id INTEGER NOT NULL,
-                price_date TEXT NOT NULL,
-                created_date TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                last_updated_date TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                price_date INTEGER NOT NULL,
+                data_vendor_id INTEGER NOT NULL,
                 open_price REAL,
                 high_price REAL,
                 low_price REAL,
                 close_price REAL,
                 adj_close_price REAL,
                 volume INTEGER,
-                UNIQUE(symbol_id, price_date),
+                created_date TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                last_updated_date TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY(symbol_id, price_date),
                 FOREIGN KEY(data_vendor_id) REFERENCES data_vendor(id) ON DELETE CASCADE,
                 FOREIGN KEY(symbol_id) REFERENCES symbol(id) ON DELETE CASCADE
+            ) WITHOUT ROWID
+        ''')
+
+        # Covering index for date-slice queries across symbols
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_daily_price_date
+            ON daily_price(price_date, adj_close_price, volume)
+        ''')
+
+        # Create price_sync table, the watermark of incremental price syncs
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS price_sync (
+                symbol_id INTEGER PRIMARY KEY,
+                last_price_date TEXT,
+                synced_date TEXT NOT NULL,
+                FOREIGN KEY(symbol_id) REFERENCES symbol(id) ON DELETE CASCADE
             )
         ''')
 
@@ -110,7 +126,7 @@ def create_database(db_path='securities_master.db'):
         cursor.execute("SELECT COUNT(*) FROM schema_version")
         if cursor.fetchone()[0] == 0:
             cursor.execute(
-                "INSERT INTO schema_version (version) VALUES ('3.0')"
+                "INSERT INTO schema_version (version) VALUES ('4.0')"
             )
 
         conn.commit()
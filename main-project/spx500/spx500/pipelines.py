@@ -1,26 +1,126 @@
 import sqlite3
 from itemadapter import ItemAdapter
-from datetime import datetime
 import logging
+import time
+
+from spx500.price_sync import ensure_sync_table, record_sync
 
 logger = logging.getLogger(__name__)
 
+# Use INSERT OR REPLACE for price data
+PRICE_UPSERT_SQL = """
+    INSERT OR REPLACE INTO daily_price 
+    (data_vendor_id, symbol_id, price_date, created_date,
+    last_updated_date, open_price, high_price, low_price,
+    close_price, adj_close_price, volume)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# The details compared to decide whether an existing symbol has changed
+SYMBOL_DETAILS = ('name', 'sector', 'sub_industry', 'headquarter',
+                  'date_added', 'cik', 'founded', 'currency')
+
+SYMBOL_CHANGED = ' OR '.join(f'sym.{c} IS NOT stage.{c}' for c in SYMBOL_DETAILS)
+
+SYMBOL_STAGE_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS symbol_stage (
+        exchange_id INTEGER,
+        ticker TEXT NOT NULL,
+        instrument TEXT NOT NULL,
+        name TEXT,
+        sector TEXT,
+        sub_industry TEXT,
+        headquarter TEXT,
+        date_added TEXT,
+        cik TEXT,
+        founded TEXT,
+        currency TEXT,
+        created_date TEXT,
+        last_updated_date TEXT,
+        PRIMARY KEY(ticker, exchange_id)
+    )
+"""
+
+STAGE_INSERT_SQL = """
+    INSERT OR REPLACE INTO symbol_stage 
+    (exchange_id, ticker, instrument, name, sector, sub_industry,
+    headquarter, date_added, cik, founded, currency,
+    created_date, last_updated_date)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+SYMBOL_COUNTS_SQL = f"""
+    SELECT SUM(sym.id IS NULL),
+           SUM(sym.id IS NOT NULL AND ({SYMBOL_CHANGED})),
+           SUM(sym.id IS NOT NULL AND NOT ({SYMBOL_CHANGED}))
+    FROM symbol_stage AS stage
+    LEFT JOIN symbol AS sym
+    ON sym.ticker = stage.ticker AND sym.exchange_id = stage.exchange_id
+"""
+
+# The same staged upsert as chapter7/bs4-version/insert_symbols.py,
+# which explains its "WHERE true"
+SYMBOL_UPSERT_SQL = f"""
+    INSERT INTO symbol AS sym
+    (exchange_id, ticker, instrument, name, sector, sub_industry,
+    headquarter, date_added, cik, founded, currency,
+    created_date, last_updated_date)
+    SELECT exchange_id, ticker, instrument, name, sector, sub_industry,
+           headquarter, date_added, cik, founded, currency,
+           created_date, last_updated_date
+    FROM symbol_stage WHERE true
+    ON CONFLICT(ticker, exchange_id) DO UPDATE SET
+        {', '.join(f'{c} = excluded.{c}' for c in SYMBOL_DETAILS)},
+        last_updated_date = excluded.last_updated_date
+    WHERE {SYMBOL_CHANGED.replace('stage.', 'excluded.')}
+"""
+
+# WAL lets readers carry on during ingest, and with synchronous=NORMAL
+# a commit no longer waits on an fsync of the database file
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA busy_timeout=5000",
+)
+
 class SqlitePipeline:
-    def __init__(self, db_path):
+    def __init__(self, db_path, batch_size=5000, flush_interval=5.0):
         self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
 
     @classmethod
     def from_crawler(cls, crawler):
         return cls(
-            db_path=crawler.settings.get('SQLITE_DB_PATH', 'securities_master.db')
+            db_path=crawler.settings.get('SQLITE_DB_PATH', 'securities_master.db'),
+            batch_size=crawler.settings.getint('SQLITE_BATCH_SIZE', 5000),
+            flush_interval=crawler.settings.getfloat('SQLITE_FLUSH_INTERVAL', 5.0)
         )
 
     def open_spider(self, spider):
         self.conn = sqlite3.connect(self.db_path)
+        for pragma in SQLITE_PRAGMAS:
+            self.conn.execute(pragma)
         self.cursor = self.conn.cursor()
+        # Price rows waiting to be written, flushed every batch_size
+        # items or flush_interval seconds
+        self.price_buffer = []
+        self.symbol_buffer = []
+        self.last_flush = time.monotonic()
 
     def close_spider(self, spider):
-        self.conn.close()
+        try:
+            self._flush_symbols()
+            self._flush_prices()
+            # Record the sync watermark of every symbol the price spider
+            # parsed, once all of its prices have been written
+            if spider.name == 'spx500_prices':
+                ensure_sync_table(self.conn)
+                record_sync(self.conn, getattr(spider, 'synced_symbol_ids', ()))
+        finally:
+            self.conn.close()
 
     def process_item(self, item, spider):
         adapter = ItemAdapter(item)
@@ -33,76 +133,90 @@ class SqlitePipeline:
         return item
 
     def _process_symbol(self, adapter):
+        self.symbol_buffer.append((
+            adapter['exchange_id'], adapter['ticker'], adapter['instrument'],
+            adapter['name'], adapter['sector'], adapter['sub_industry'],
+            adapter['headquarter'], adapter['date_added'], adapter['cik'],
+            adapter['founded'], adapter['currency'],
+            adapter['created_date'], adapter['last_updated_date']
+        ))
+        if len(self.symbol_buffer) >= self.batch_size:
+            self._flush_symbols()
+
+    def _upsert_symbols(self, rows):
+        """Stage symbols in a temp table and upsert them with one statement,
+        only rewriting the symbols whose details have changed. Returns the
+        inserted, updated and unchanged counts; the caller commits"""
+        self.cursor.execute(SYMBOL_STAGE_SQL)
+        self.cursor.execute("DELETE FROM symbol_stage")
+        self.cursor.executemany(STAGE_INSERT_SQL, rows)
+        self.cursor.execute(SYMBOL_COUNTS_SQL)
+        counts = tuple(count or 0 for count in self.cursor.fetchone())
+        self.cursor.execute(SYMBOL_UPSERT_SQL)
+        self.cursor.execute("DELETE FROM symbol_stage")
+        return counts
+
+    def _flush_symbols(self):
+        """Write the buffered symbols in one transaction. If the batch fails,
+        each symbol is retried on its own so only the bad ones are dropped"""
+        if not self.symbol_buffer:
+            return
         try:
-            # Check if symbol exists
-            self.cursor.execute(
-                "SELECT id FROM symbol WHERE ticker = ? AND exchange_id = ?",
-                (adapter['ticker'], adapter['exchange_id'])
-            )
-            existing = self.cursor.fetchone()
-            
-            if existing:
-                # Update existing symbol
-                update_sql = """
-                    UPDATE symbol 
-                    SET name = ?, sector = ?, sub_industry = ?, 
-                        headquarter = ?, date_added = ?, cik = ?,
-                        founded = ?, currency = ?, last_updated_date = ?
-                    WHERE ticker = ? AND exchange_id = ?
-                """
-                self.cursor.execute(update_sql, (
-                    adapter['name'], adapter['sector'], adapter['sub_industry'],
-                    adapter['headquarter'], adapter['date_added'], adapter['cik'],
-                    adapter['founded'], adapter['currency'], datetime.now().isoformat(),
-                    adapter['ticker'], adapter['exchange_id']
-                ))
-            else:
-                # Insert new symbol
-                insert_sql = """
-                    INSERT INTO symbol 
-                    (exchange_id, ticker, instrument, name, sector, sub_industry,
-                    headquarter, date_added, cik, founded, currency,
-                    created_date, last_updated_date)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """
-                now = datetime.now().isoformat()
-                self.cursor.execute(insert_sql, (
-                    adapter['exchange_id'], adapter['ticker'], adapter['instrument'],
-                    adapter['name'], adapter['sector'], adapter['sub_industry'],
-                    adapter['headquarter'], adapter['date_added'], adapter['cik'],
-                    adapter['founded'], adapter['currency'], now, now
-                ))
-            
+            inserts, updates, unchanged = self._upsert_symbols(self.symbol_buffer)
             self.conn.commit()
-            
-        except Exception as e:
+            logger.info(f"Symbols processed: {len(self.symbol_buffer)} - Updated: {updates}, "
+                        f"Inserted: {inserts}, Unchanged: {unchanged}")
+        except sqlite3.Error as e:
             self.conn.rollback()
-            logger.error(f"Error processing symbol {adapter.get('ticker')}: {e}")
-            raise
+            logger.error(f"Error writing batch of {len(self.symbol_buffer)} symbols, "
+                         f"retrying one at a time: {e}")
+            for row in self.symbol_buffer:
+                try:
+                    self._upsert_symbols([row])
+                    self.conn.commit()
+                except sqlite3.Error as e:
+                    self.conn.rollback()
+                    logger.error(f"Dropping symbol {row[1]}: {e}")
+        finally:
+            self.symbol_buffer = []
 
     def _process_price(self, adapter):
+        self.price_buffer.append((
+            adapter['data_vendor_id'], adapter['symbol_id'],
+            adapter['price_date'], adapter['created_date'],
+            adapter['last_updated_date'], adapter['open_price'],
+            adapter['high_price'], adapter['low_price'],
+            adapter['close_price'], adapter['adj_close_price'],
+            adapter['volume']
+        ))
+        if (len(self.price_buffer) >= self.batch_size or
+                time.monotonic() - self.last_flush >= self.flush_interval):
+            self._flush_prices()
+
+    def _flush_prices(self):
+        """Write the buffered prices with one executemany in one transaction.
+        If the batch fails, the rows are written one at a time so only the
+        bad ones are dropped"""
+        self.last_flush = time.monotonic()
+        if not self.price_buffer:
+            return
         try:
-            # Use INSERT OR REPLACE for price data
-            upsert_sql = """
-                INSERT OR REPLACE INTO daily_price 
-                (data_vendor_id, symbol_id, price_date, created_date,
-                last_updated_date, open_price, high_price, low_price,
-                close_price, adj_close_price, volume)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """
-            
-            self.cursor.execute(upsert_sql, (
-                adapter['data_vendor_id'], adapter['symbol_id'],
-                adapter['price_date'], adapter['created_date'],
-                adapter['last_updated_date'], adapter['open_price'],
-                adapter['high_price'], adapter['low_price'],
-                adapter['close_price'], adapter['adj_close_price'],
-                adapter['volume']
-            ))
-            
-            self.conn.commit()
-            
-        except Exception as e:
-            self.conn.rollback()
-            logger.error(f"Error processing price for symbol_id {adapter.get('symbol_id')}: {e}")
-            raise
\ No newline at end of file
+            with self.conn:
+                self.conn.executemany(PRICE_UPSERT_SQL, self.price_buffer)
+            logger.info(f"Upserted batch of {len(self.price_buffer)} prices")
+        except sqlite3.Error as e:
+            logger.error(f"Error writing batch of {len(self.price_buffer)} prices, "
+                         f"retrying one at a time: {e}")
+            # A failed statement only undoes itself, so the good rows
+            # still commit together
+            written = 0
+            with self.conn:
+                for row in self.price_buffer:
+                    try:
+                        self.conn.execute(PRICE_UPSERT_SQL, row)
+                        written += 1
+                    except sqlite3.Error as e:
+                        logger.error(f"Dropping price of symbol ID {row[1]} on {row[2]}: {e}")
+            logger.info(f"Upserted {written} of {len(self.price_buffer)} prices")
+        finally:
+            self.price_buffer = []
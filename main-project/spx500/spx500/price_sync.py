@@ -0,0 +1,95 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Tuple
+import logging
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+# One row per symbol: the latest stored price date after the last
+# sync, and when that sync ran
+SYNC_TABLE = """
+    CREATE TABLE IF NOT EXISTS price_sync (
+        symbol_id INTEGER PRIMARY KEY,
+        last_price_date TEXT,
+        synced_date TEXT NOT NULL,
+        FOREIGN KEY(symbol_id) REFERENCES symbol(id) ON DELETE CASCADE
+    )
+"""
+
+FULL_HISTORY_START = (1900, 1, 1)
+
+def ensure_sync_table(conn: sqlite3.Connection):
+    conn.execute(SYNC_TABLE)
+    conn.commit()
+
+def utc_today() -> date:
+    """Today's date in UTC, the zone of the synced_date timestamps"""
+    return datetime.now(timezone.utc).date()
+
+def last_trading_day(today: Optional[date] = None) -> date:
+    """The most recent weekday before today (in UTC, like the stored
+    bars), i.e. the last daily bar that should be complete"""
+    day = (today or utc_today()) - timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+def get_sync_plan(conn: sqlite3.Connection, today: Optional[date] = None) -> List[Tuple[int, str, Tuple[int, int, int]]]:
+    """Work out the missing range of every symbol from one grouped query.
+
+    Returns (symbol_id, ticker, start_date) for each symbol that needs
+    prices, where start_date is the day after its last stored price (or
+    the start of the full history for a new symbol). Symbols that already
+    have the last trading day, or were synced today, are skipped."""
+    ensure_sync_table(conn)
+    today = today or utc_today()
+    target = last_trading_day(today).isoformat()
+
+    rows = conn.execute("""
+        SELECT sym.id, sym.ticker, latest.last_price_date, ps.synced_date
+        FROM symbol AS sym
+        LEFT JOIN (
+            SELECT symbol_id, date(MAX(price_date) * 86400, 'unixepoch') AS last_price_date
+            FROM daily_price
+            GROUP BY symbol_id
+        ) AS latest ON latest.symbol_id = sym.id
+        LEFT JOIN price_sync AS ps ON ps.symbol_id = sym.id
+    """).fetchall()
+
+    plan = []
+    skipped = 0
+    for symbol_id, ticker, last_price_date, synced_date in rows:
+        # synced_date is an ISO timestamp, so only its date part is
+        # compared with the ISO date of the last price
+        last_day = last_price_date
+        if last_day is not None and (
+            last_day >= target or (synced_date or '')[:10] == today.isoformat()
+        ):
+            skipped += 1
+            continue
+        if last_day is None:
+            start = FULL_HISTORY_START
+        else:
+            start = (date.fromisoformat(last_day) + timedelta(days=1)).timetuple()[:3]
+        plan.append((symbol_id, ticker, start))
+
+    logger.info(f"Sync plan: {len(plan)} symbols to update, {skipped} already current")
+    return plan
+
+def record_sync(conn: sqlite3.Connection, symbol_ids: Iterable[int]):
+    """Record the sync watermark of the given symbols, i.e. their latest
+    stored price date and the time of this sync"""
+    ids = list(symbol_ids)
+    now = datetime.now(timezone.utc).isoformat()
+    # Stay under SQLite's limit on the number of bound parameters
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        conn.execute(f"""
+            INSERT OR REPLACE INTO price_sync (symbol_id, last_price_date, synced_date)
+            SELECT sym.id, date(MAX(dp.price_date) * 86400, 'unixepoch'), ?
+            FROM symbol AS sym
+            LEFT JOIN daily_price AS dp ON dp.symbol_id = sym.id
+            WHERE sym.id IN ({','.join('?' * len(chunk))})
+            GROUP BY sym.id
+        """, [now] + chunk)
+    conn.commit()
@@ -6,3 +6,8 @@ NEWSPIDER_MODULE = 'spx500.spiders'
 ITEM_PIPELINES = {
     'spx500.pipelines.SqlitePipeline': 300,
 }
+
+# Price items are written to SQLite in batches of SQLITE_BATCH_SIZE rows,
+# or every SQLITE_FLUSH_INTERVAL seconds, whichever comes first
+SQLITE_BATCH_SIZE = 5000
+SQLITE_FLUSH_INTERVAL = 5.0
@@ -4,6 +4,7 @@ import json
 from datetime import datetime, timezone
 import sqlite3
 from spx500.items import PriceItem
+from spx500.price_sync import get_sync_plan, FULL_HISTORY_START
 from urllib.parse import urlencode
 
 class SPX500PricesSpider(scrapy.Spider):
@@ -14,9 +15,15 @@ class SPX500PricesSpider(scrapy.Spider):
         'RANDOMIZE_DOWNLOAD_DELAY': True
     }
     
-    def __init__(self, db_path='securities_master.db', *args, **kwargs):
+    def __init__(self, db_path='securities_master.db', full='false', *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.db_path = db_path
+        # By default only the range missing since each symbol's last
+        # stored bar is requested; pass -a full=true to fetch everything
+        self.full = str(full).lower() in ('1', 'true', 'yes')
+        # Symbols whose responses were parsed, for the pipeline to
+        # record as synced
+        self.synced_symbol_ids = set()
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:133.0) Gecko/20100101 Firefox/133.0',
             'Accept': '*/*',
@@ -26,19 +33,23 @@ class SPX500PricesSpider(scrapy.Spider):
         }
 
     def start_requests(self):
-        # Connect to database and get symbols
+        # Connect to database and get symbols, with the start of the
+        # range each one is missing
         conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT id, ticker FROM symbol")
-        symbols = cursor.fetchall()
+        if self.full:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, ticker FROM symbol")
+            symbols = [(symbol_id, ticker, FULL_HISTORY_START) for symbol_id, ticker in cursor.fetchall()]
+        else:
+            symbols = get_sync_plan(conn)
         conn.close()
 
         # Generate requests for each symbol
-        for symbol_id, ticker in symbols:
+        for symbol_id, ticker, start_date in symbols:
             # Format the Yahoo Finance URL
             ticker = ticker.replace('.', '-')
             params = {
-                'period1': int(datetime(1900, 1, 1, tzinfo=timezone.utc).timestamp()),
+                'period1': int(datetime(*start_date, tzinfo=timezone.utc).timestamp()),
                 'period2': int(datetime.now(timezone.utc).timestamp()),
                 'interval': '1d',
                 'events': 'history',
@@ -78,9 +89,8 @@ class SPX500PricesSpider(scrapy.Spider):
                 item.set_defaults()
                 
                 item['symbol_id'] = symbol_id
-                item['price_date'] = datetime.fromtimestamp(
-                    timestamps[i], tz=timezone.utc
-                ).isoformat()
+                # Stored as the day number since 1970-01-01 (UTC)
+                item['price_date'] = timestamps[i] // 86400
                 item['open_price'] = quote['open'][i]
                 item['high_price'] = quote['high'][i]
                 item['low_price'] = quote['low'][i]
@@ -89,6 +99,8 @@ class SPX500PricesSpider(scrapy.Spider):
                 item['volume'] = int(quote['volume'][i])
                 
                 yield item
-                
+
+            self.synced_symbol_ids.add(symbol_id)
+
         except Exception as e:
             self.logger.error(f"Error processing symbol_id {symbol_id}: {e}")
\ No newline at end of file